@@ -0,0 +1,227 @@
+#!/usr/bin/python
+
+# Binary advertisement format and multicast sockets used by the trackers
+
+import struct
+import socket
+import time
+
+import metrics
+
+ADVERT_VERSION = 1
+
+# Message kinds
+KIND_ADVERT = 1
+KIND_NACK = 2
+KIND_BID = 3
+KIND_REPORT = 4
+KIND_ASSIGN = 5
+
+# version, kind, tracking mode, sender, sequence number, timestamp,
+# target, distance to target (the bid price for KIND_BID)
+ADVERT = struct.Struct('!BBBxHIdid')
+
+# version, kind, requester, source of the missing adverts,
+# number of missing adverts, first missing sequence number
+NACK = struct.Struct('!BBHHHI')
+
+MAX_DATAGRAM = 1500
+
+# Optional claim digest after an advert: number of claims, then for each
+# the UAV, its target, tracking mode, distance and version (the owner's
+# timestamp on the advert that carried the claim)
+DIGEST_COUNT = struct.Struct('!B')
+CLAIM = struct.Struct('!HiBfd')
+MAX_CLAIMS = (MAX_DATAGRAM - ADVERT.size - DIGEST_COUNT.size) // CLAIM.size
+
+# After the advert header of a cluster report or assignment: the
+# cluster's cell and the number of entries. A report lists the targets
+# in the member's range; an assignment lists member, target and the
+# member's distance to it.
+CLUSTER = struct.Struct('!hhB')
+REPORT_TARGET = struct.Struct('!i')
+ASSIGNMENT = struct.Struct('!Hif')
+
+
+#---------------
+# Kind of a received message; text datagrams are always adverts
+#---------------
+def MessageKind(buf, nbytes):
+  if nbytes >= 2 and buf[0] == ADVERT_VERSION:
+    return buf[1]
+  return KIND_ADVERT
+
+
+#---------------
+# Parse a NACK. Returns (requester, source, first, count) or None
+#---------------
+def ParseNack(buf, nbytes):
+  if nbytes < NACK.size:
+    return None
+  version, kind, requester, source, count, first = NACK.unpack_from(buf, 0)
+  return requester, source, first, count
+
+
+#---------------
+# Parse an advertisement without copying the datagram.
+# Returns (kind, sender, seq, timestamp, target, distance, mode), or
+# None if the datagram is not something we understand. Text datagrams
+# from trackers that predate the binary format are still accepted.
+#---------------
+def ParseAdvert(buf, nbytes):
+  if nbytes >= ADVERT.size and buf[0] == ADVERT_VERSION:
+    version, kind, mode, sender, seq, stamp, target, distance = ADVERT.unpack_from(buf, 0)
+    return kind, sender, seq, stamp, target, distance, mode
+
+  try:
+    uavidstr, trgtidstr, potentialDisStr, trackModeStr = bytes(buf[:nbytes]).decode('utf-8').split(" ")
+    return KIND_ADVERT, int(uavidstr), 0, 0.0, int(trgtidstr), float(potentialDisStr), int(trackModeStr)
+  except ValueError:
+    return None
+
+
+#---------------
+# Claims gossiped in an advert, as (uav, target, mode, distance, version)
+# tuples; empty if it carries none
+#---------------
+def ParseDigest(buf, nbytes):
+  offset = ADVERT.size
+  if nbytes < offset + DIGEST_COUNT.size or buf[0] != ADVERT_VERSION:
+    return []
+  count = min(buf[offset], (nbytes - offset - DIGEST_COUNT.size) // CLAIM.size)
+  offset += DIGEST_COUNT.size
+  return [CLAIM.unpack_from(buf, offset + i*CLAIM.size) for i in range(count)]
+
+
+#---------------
+# Cell and entries of a cluster report or assignment, unpacked with
+# entry; None if the datagram is too short
+#---------------
+def ParseCluster(buf, nbytes, entry):
+  offset = ADVERT.size
+  if nbytes < offset + CLUSTER.size or buf[0] != ADVERT_VERSION:
+    return None
+  cx, cy, count = CLUSTER.unpack_from(buf, offset)
+  offset += CLUSTER.size
+  count = min(count, (nbytes - offset) // entry.size)
+  return (cx, cy), [entry.unpack_from(buf, offset + i*entry.size) for i in range(count)]
+
+
+#---------------
+# Long-lived multicast sender. The socket, TTL and group address are set
+# up once; each send packs into a preallocated buffer. A transport
+# callable replaces the socket when running without a network.
+#---------------
+class McastSender():
+  def __init__(self, mcastaddr, port, ttl, transport=None):
+    self.transport = transport
+    self.port = port
+    self.group = mcastaddr
+    if transport is None:
+      addrinfo = socket.getaddrinfo(mcastaddr, None)[0]
+      self.sk = socket.socket(addrinfo[0], socket.SOCK_DGRAM)
+      ttl_bin = struct.pack('@i', ttl)
+      self.sk.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl_bin)
+      self.dest = (addrinfo[4][0], port)
+    self.buf = bytearray(MAX_DATAGRAM)
+    self.view = memoryview(self.buf)
+    self.length = ADVERT.size
+    self.nackbuf = bytearray(NACK.size)
+    self.seq = 0
+
+  # Send to another group on the same port from now on. A transport
+  # with a group attribute is told the group as well.
+  def setGroup(self, group):
+    if group == self.group:
+      return
+    self.group = group
+    if self.transport is None:
+      self.dest = (socket.getaddrinfo(group, None)[0][4][0], self.port)
+    elif hasattr(self.transport, 'group'):
+      self.transport.group = group
+
+  # Send our claim, followed by the claims in digest if any
+  def send(self, uavnodeid, trgtnodeid, potentialTrgDis, track, kind=KIND_ADVERT, digest=()):
+    self.seq += 1
+    ADVERT.pack_into(self.buf, 0, ADVERT_VERSION, kind, track, uavnodeid,
+                     self.seq, time.time(), trgtnodeid, potentialTrgDis)
+    self.length = ADVERT.size
+    if digest:
+      claims = digest[:MAX_CLAIMS]
+      DIGEST_COUNT.pack_into(self.buf, self.length, len(claims))
+      self.length += DIGEST_COUNT.size
+      for claim in claims:
+        CLAIM.pack_into(self.buf, self.length, *claim)
+        self.length += CLAIM.size
+    self.transmit(self.view[:self.length])
+    return self.seq
+
+  # Send a cluster report or assignment: the advert header, then the
+  # cell and up to 255 entries packed with entry
+  def sendCluster(self, kind, uavnodeid, trgtnodeid, potentialTrgDis, track, cell, entry, entries):
+    self.seq += 1
+    ADVERT.pack_into(self.buf, 0, ADVERT_VERSION, kind, track, uavnodeid,
+                     self.seq, time.time(), trgtnodeid, potentialTrgDis)
+    self.length = ADVERT.size
+    entries = entries[:min(255, (MAX_DATAGRAM - self.length - CLUSTER.size) // entry.size)]
+    CLUSTER.pack_into(self.buf, self.length, cell[0], cell[1], len(entries))
+    self.length += CLUSTER.size
+    for values in entries:
+      if isinstance(values, tuple):
+        entry.pack_into(self.buf, self.length, *values)
+      else:
+        entry.pack_into(self.buf, self.length, values)
+      self.length += entry.size
+    self.transmit(self.view[:self.length])
+    return self.seq
+
+  # Ask source to retransmit count adverts starting at sequence first
+  def sendNack(self, requester, source, first, count):
+    NACK.pack_into(self.nackbuf, 0, ADVERT_VERSION, KIND_NACK, requester, source, count, first)
+    self.transmit(self.nackbuf)
+
+  # Send an already packed message again
+  def resend(self, data):
+    self.transmit(data)
+
+  def transmit(self, data):
+    metrics.Inc('datagrams_out')
+    if self.transport is not None:
+      self.transport(bytes(data))
+    else:
+      self.sk.sendto(data, self.dest)
+
+
+#---------------
+# Multicast receiver that reads every datagram into the same buffer.
+# It joins mcastaddr unless that is None; more groups on the same port
+# can be joined and left later.
+#---------------
+class McastReceiver():
+  def __init__(self, mcastaddr, port):
+    self.sk = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.sk.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    # Bind
+    self.sk.bind(('', port))
+
+    if mcastaddr is not None:
+      self.join(mcastaddr)
+
+    self.buf = bytearray(MAX_DATAGRAM)
+    self.view = memoryview(self.buf)
+
+  def membership(self, group):
+    addrinfo = socket.getaddrinfo(group, None)[0]
+    return socket.inet_pton(addrinfo[0], addrinfo[4][0]) + struct.pack('=I', socket.INADDR_ANY)
+
+  def join(self, group):
+    self.sk.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, self.membership(group))
+
+  def leave(self, group):
+    self.sk.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, self.membership(group))
+
+  # Block for the next datagram; returns the shared buffer view and length
+  def recv(self):
+    nbytes, sender = self.sk.recvfrom_into(self.buf)
+    return self.view, nbytes
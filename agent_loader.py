@@ -0,0 +1,19 @@
+#!/usr/bin/python
+
+# Load independent copies of the tracker script. track_target_grpc.py
+# keeps its state in module globals, so each agent hosted in one
+# runtime gets its own module instance.
+
+import os
+import importlib.util
+
+scriptdir = os.path.dirname(os.path.realpath(__file__))
+
+
+def LoadAgent(name, path=None):
+  if path is None:
+    path = os.path.join(scriptdir, "track_target_grpc.py")
+  spec = importlib.util.spec_from_file_location(name, path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
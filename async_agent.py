@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+# asyncio version of the tracking loop. Advertisements are applied by a
+# datagram protocol on the event loop, and all gRPC and XML-RPC calls
+# are awaited outside of TrackTargets, so a slow tick never delays
+# incoming advertisements and no lock is needed around the tracker state.
+
+import asyncio
+import concurrent.futures
+
+import grpc
+from core.api.grpc import core_pb2
+from core.api.grpc import core_pb2_grpc
+
+from advert import McastReceiver
+import metrics
+
+
+#---------------
+# Datagram protocol feeding received advertisements to the tracker
+#---------------
+class AdvertProtocol(asyncio.DatagramProtocol):
+  def __init__(self, agent):
+    self.agent = agent
+
+  def datagram_received(self, data, addr):
+    self.agent.HandleAdvert(memoryview(data), len(data))
+
+
+#---------------
+# Mover interface used by TrackTargets in asyncio mode. Reads return
+# values fetched before the tick; writes are queued and sent after it.
+#---------------
+class DeferredMover():
+  def __init__(self, mover, orig_wypt):
+    self.mover = mover
+    self.orig_wypt = orig_wypt
+    self.potential_targets = []
+    self.pending = []
+    # XML-RPC proxies are not thread safe; keep every call on one thread
+    self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+  def getPotentialTargets(self, covered_zone, track_range):
+    return self.potential_targets
+
+  def getOriginalWypt(self):
+    return self.orig_wypt
+
+  def setWypt(self, x, y):
+    self.pending.append(('setWypt', (x, y)))
+    return True
+
+  def setTarget(self, target):
+    self.pending.append(('setTarget', (target,)))
+    return True
+
+  async def prefetch(self, covered_zone, track_range):
+    loop = asyncio.get_running_loop()
+    self.potential_targets = await loop.run_in_executor(
+        self.executor, self.mover.getPotentialTargets, covered_zone, track_range)
+
+  # Send the writes queued during the tick, in order
+  async def flush(self):
+    loop = asyncio.get_running_loop()
+    pending, self.pending = self.pending, []
+    for name, args in pending:
+      await loop.run_in_executor(self.executor, getattr(self.mover, name), *args)
+
+
+#---------------
+# Fetch the session's node positions over an asyncio gRPC channel
+#---------------
+class AsyncPositionFetcher():
+  def __init__(self, address, positions):
+    self.channel = grpc.aio.insecure_channel(address)
+    self.stub = core_pb2_grpc.CoreApiStub(self.channel)
+    self.positions = positions
+
+  async def refresh(self):
+    request = core_pb2.GetSessionRequest(session_id=self.positions.session_id)
+    with metrics.Timed('grpc_seconds', call='GetSession'):
+      response = await self.stub.GetSession(request)
+    self.positions.load(response.session.nodes)
+
+
+#---------------
+# Run the tracker module's TrackTargets on the event loop
+#---------------
+async def RunAgent(agent, address, covered_zone, track_range):
+  loop = asyncio.get_running_loop()
+
+  if agent.protocol in agent.comms_protocols:
+    receiver = McastReceiver(None if agent.geo_cell else agent.mcastaddr, agent.port)
+    receiver.sk.setblocking(False)
+    agent.receiver = receiver
+    await loop.create_datagram_endpoint(lambda: AdvertProtocol(agent), sock=receiver.sk)
+
+  fetcher = AsyncPositionFetcher(address, agent.positions)
+  mover = agent.mover
+
+  # Triggers come from the datagram protocol on this loop
+  scheduler = agent.scheduler
+  wakeup = asyncio.Event()
+  scheduler.wake = lambda due: wakeup.set()
+
+  while 1:
+    delay = scheduler.due() - scheduler.clock()
+    if delay > 0:
+      try:
+        await asyncio.wait_for(wakeup.wait(), delay)
+      except asyncio.TimeoutError:
+        pass
+      wakeup.clear()
+      continue
+    scheduler.start()
+
+    # Everything TrackTargets reads is fetched before it runs
+    await asyncio.gather(fetcher.refresh(), mover.prefetch(covered_zone, track_range))
+
+    # No awaits while deciding; advertisements received meanwhile are
+    # applied before or after the tick, never during it
+    with metrics.Timed('tick_seconds'):
+      agent.TrackTargets(covered_zone, track_range)
+    scheduler.ticked(agent.Settled())
+
+    await mover.flush()
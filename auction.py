@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+# Distributed auction (Bertsekas) assignment of UAVs to targets. Each
+# UAV bids for the target with the best value net of its current price,
+# raising the price by its margin over the second best target plus eps.
+# Bids are advertised; the highest bid holds the target, and an outbid
+# UAV bids again on the next round. With eps > 0 this settles on a
+# near-optimal one-to-one assignment in a bounded number of rounds.
+
+import numpy as np
+
+NO_TARGET = -1
+
+# Bound on how far from optimal the default increment may leave the
+# assignment, as a fraction of the value range
+OPTIMALITY_GAP = 0.1
+
+
+#---------------
+# Distances between every UAV and every target, from one position snapshot
+#---------------
+def DistanceMatrix(uav_ids, target_ids, positions):
+  uavpos = np.array([positions.getPosition(n) for n in uav_ids], dtype=float).reshape(-1, 2)
+  trgpos = np.array([positions.getPosition(n) for n in target_ids], dtype=float).reshape(-1, 2)
+  delta = uavpos[:, np.newaxis, :] - trgpos[np.newaxis, :, :]
+  return np.sqrt(np.sum(delta*delta, axis=2))
+
+
+#---------------
+# One UAV's view of the auction: target prices, who holds each target,
+# and its own assignment
+#---------------
+class Auction():
+  def __init__(self, nodeid, value_range, eps=None, ttl=None):
+    self.nodeid = nodeid
+    self.value_range = value_range
+    # Fixed bid increment, or None to scale it to the value range
+    self.eps = eps
+    # Bidders not heard from for ttl seconds lose what they hold
+    self.ttl = ttl
+    self.prices = dict()
+    self.holders = dict()
+    self.holding = dict()
+    self.heard = dict()
+    self.assigned = NO_TARGET
+    self.bids = 0
+
+  def price(self, target):
+    return self.prices.get(target, 0.0)
+
+  # Bid increment. The assignment ends within n*eps of optimal for n
+  # bidders, and the number of rounds grows with value_range/eps, so by
+  # default eps is the largest that keeps n*eps within OPTIMALITY_GAP of
+  # the value range for the bidders heard.
+  def increment(self):
+    if self.eps is not None:
+      return self.eps
+    bidders = len(set(self.holding) | set([self.nodeid]))
+    return self.value_range*OPTIMALITY_GAP/bidders
+
+  def setHolder(self, bidder, target, price):
+    old = self.holding.get(bidder, NO_TARGET)
+    if old != NO_TARGET and old != target and self.holders.get(old) == bidder:
+      # The bidder moved on; the target is free again
+      del self.holders[old]
+      self.prices[old] = 0.0
+    self.holding[bidder] = target
+    if target != NO_TARGET:
+      self.holders[target] = bidder
+      self.prices[target] = price
+
+  # Apply a bid heard from another UAV at time now. The higher price
+  # wins; on equal prices the larger node id wins, as in compareUAV.
+  def bid(self, bidder, target, price, now=None):
+    if now is not None:
+      self.heard[bidder] = now
+    if target == NO_TARGET:
+      self.setHolder(bidder, NO_TARGET, 0.0)
+      return
+    holder = self.holders.get(target)
+    if holder is None or holder == bidder or price > self.price(target) or \
+        (price == self.price(target) and bidder > holder):
+      self.setHolder(bidder, target, price)
+      if holder == self.nodeid and bidder != self.nodeid:
+        # We were outbid
+        self.holding[self.nodeid] = NO_TARGET
+        self.assigned = NO_TARGET
+    elif self.holding.get(bidder) not in (None, target):
+      # Losing bid, but it still releases the bidder's previous target
+      self.setHolder(bidder, NO_TARGET, 0.0)
+
+  # Release the targets of bidders not heard from within the ttl and
+  # return those bidders
+  def expire(self, now):
+    if self.ttl is None:
+      return []
+    expired = [bidder for bidder, heard in self.heard.items() if now - heard > self.ttl]
+    for bidder in expired:
+      del self.heard[bidder]
+      self.setHolder(bidder, NO_TARGET, 0.0)
+      del self.holding[bidder]
+    return expired
+
+  # Bid for the best target among target_ids given our distances to
+  # them. Returns the target now held (or NO_TARGET) and our price.
+  def round(self, target_ids, distances):
+    if self.assigned != NO_TARGET and self.assigned not in target_ids:
+      # Our target went out of range
+      self.setHolder(self.nodeid, NO_TARGET, 0.0)
+      self.assigned = NO_TARGET
+
+    if self.assigned == NO_TARGET and len(target_ids) > 0:
+      values = self.value_range - np.asarray(distances, dtype=float)
+      prices = np.array([self.price(t) for t in target_ids])
+      net = values - prices
+      order = np.argsort(-net)
+      best = order[0]
+      # Second best, or staying unassigned (worth 0) if there is no other
+      second = max(net[order[1]], 0.0) if len(order) > 1 else 0.0
+      if net[best] >= 0:
+        target = target_ids[best]
+        self.setHolder(self.nodeid, target, prices[best] + net[best] - second + self.increment())
+        self.assigned = target
+        self.bids += 1
+
+    return self.assigned, self.price(self.assigned) if self.assigned != NO_TARGET else 0.0
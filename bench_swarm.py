@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+# Sweep swarm size with the headless harness and report how the
+# tracking protocol scales: assignment convergence time, messages per
+# UAV per second, tracker CPU per agent and gRPC calls per tick.
+
+import time
+import argparse
+
+import scenario_gen
+from swarm_sim import Scenario
+from swarm_sim import SwarmHarness
+
+COLUMNS = ('uavs', 'protocol', 'tracked', 'duplicates', 'converged_at',
+           'msgs_per_uav_per_sec', 'cpu_per_agent', 'grpc_calls_per_tick', 'wall')
+
+
+def RunOne(num_uavs, protocol, seconds, seed, interval):
+  config = scenario_gen.MakeConfig(num_uavs, num_uavs, interval=interval)
+  start = time.monotonic()
+  harness = SwarmHarness(Scenario.FromConfig(config), protocol, interval/1000, seed=seed)
+  harness.run(seconds)
+  result = harness.summary()
+  result['protocol'] = protocol
+  result['wall'] = time.monotonic() - start
+  return result
+
+
+def PrintRow(result):
+  row = []
+  for column in COLUMNS:
+    value = result[column]
+    if isinstance(value, float):
+      row.append("%12.4f" % value)
+    else:
+      row.append("%12s" % value)
+  print(" ".join(row))
+
+
+#---------------
+# main
+#---------------
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n','--sizes', dest = 'sizes', metavar='sizes',
+                      type=str, default = '8,16,32,64', help='Comma separated swarm sizes')
+  parser.add_argument('-p','--protocols', dest = 'protocols', metavar='protocols',
+                      type=str, default = 'udp,nack', help='Comma separated protocols')
+  parser.add_argument('-t','--time', dest = 'seconds', metavar='seconds',
+                      type=float, default = '60', help='Simulated time per run')
+  parser.add_argument('-i','--update_interval', dest = 'interval', metavar='update interval',
+                      type=int, default = '500', help='Tracker update interval (msec)')
+  parser.add_argument('--seed', dest = 'seed', type=int, default = '0', help='Random seed')
+  args = parser.parse_args()
+
+  print(" ".join("%12s" % column for column in COLUMNS))
+  for size in [int(n) for n in args.sizes.split(',')]:
+    for protocol in args.protocols.split(','):
+      PrintRow(RunOne(size, protocol, args.seconds, args.seed, args.interval))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,213 @@
+#!/usr/bin/python
+
+# Hierarchical coordination. UAVs are grouped into clusters by the grid
+# cell they are in, and the lowest node id heard in a cell is its head.
+# Members report the targets in their range to the swarm; the head
+# assigns targets to all its members in one batch and advertises the
+# assignment. Heads hear each other's assignments and only negotiate
+# over targets claimed in more than one cluster, with the same rule as
+# compareUAV: the closer UAV keeps the target, the larger node id on a
+# tie.
+#
+# Reports and assignments are only sent when they change, or refreshed
+# every refresh period, so a settled swarm sends a few messages per UAV
+# per peer TTL instead of several per tick. What was heard is only
+# forgotten after MISSES refreshes in a row are lost, so on a lossy
+# link a settled cluster does not drop members and hand out their
+# targets again.
+
+from geocast import CellOf
+
+NO_TARGET = -1
+
+# Refreshes missed in a row before a member, claim or assignment expires
+MISSES = 6
+
+
+#---------------
+# What a UAV last reported
+#---------------
+class Member():
+  __slots__ = ('nodeid', 'cell', 'targets', 'trackid', 'heard')
+
+  def __init__(self, nodeid, cell, targets, trackid, heard):
+    self.nodeid = nodeid
+    self.cell = cell
+    self.targets = targets
+    self.trackid = trackid
+    self.heard = heard
+
+
+#---------------
+# One UAV's view of the clusters: members heard, assignments of our own
+# head, and the targets other clusters hold
+#---------------
+class ClusterView():
+  def __init__(self, nodeid, cell_size, refresh, misses=MISSES, margin=None):
+    self.nodeid = nodeid
+    self.cell_size = cell_size
+    self.margin = margin if margin is not None else cell_size/8
+    self.refresh = refresh
+    self.ttl = refresh*misses
+    self.members = dict()
+    # Target -> (head, uav, distance, heard) held by another cluster
+    self.foreign = dict()
+    # Our head's last assignment to us, as (head, target, heard)
+    self.assigned = None
+    # Our assignment of our members while we are head
+    self.assignment = dict()
+    self.solves = 0
+
+  # The cell of a UAV at (x, y). A UAV stays in its current cell until
+  # it is margin beyond it, so one tracking a target on a cell border
+  # does not flap between clusters.
+  def cellOf(self, x, y, current=None):
+    if current is not None:
+      cx, cy = current
+      lo_x, lo_y = cx*self.cell_size - self.margin, cy*self.cell_size - self.margin
+      hi_x, hi_y = (cx + 1)*self.cell_size + self.margin, (cy + 1)*self.cell_size + self.margin
+      if lo_x <= x < hi_x and lo_y <= y < hi_y:
+        return current
+    return CellOf(x, y, self.cell_size)
+
+  def report(self, nodeid, cell, targets, trackid, now):
+    member = self.members.get(nodeid)
+    changed = member is None or member.cell != cell or member.targets != targets
+    self.members[nodeid] = Member(nodeid, cell, targets, trackid, now)
+    return changed
+
+  # Forget members, foreign claims and our assignment not refreshed
+  # within the TTL
+  def expire(self, now):
+    for nodeid in [n for n, m in self.members.items() if now - m.heard > self.ttl]:
+      if nodeid != self.nodeid:
+        del self.members[nodeid]
+    for target in [t for t, claim in self.foreign.items() if now - claim[3] > self.ttl]:
+      del self.foreign[target]
+    if self.assigned is not None and now - self.assigned[2] > self.ttl:
+      self.assigned = None
+
+  def membersOf(self, cell):
+    return sorted(n for n, m in self.members.items() if m.cell == cell)
+
+  def head(self, cell):
+    members = self.membersOf(cell)
+    if not members:
+      return None
+    return members[0]
+
+  # An assignment heard from head for the cluster in cell. For our own
+  # cluster, returns whether our target changed. An assignment that
+  # leaves us out means the head has not heard us lately; we keep what
+  # we had until it does.
+  def heardAssign(self, head, cell, entries, now):
+    member = self.members.get(head)
+    if member is None or member.cell != cell:
+      # The head's own report may not have arrived yet
+      self.report(head, cell, member.targets if member else [], NO_TARGET, now)
+    else:
+      member.heard = now
+
+    own = self.members.get(self.nodeid)
+    if own is not None and own.cell == cell:
+      if head != self.head(cell):
+        return False
+      listed = [trgt for uav, trgt, distance in entries if uav == self.nodeid]
+      if not listed:
+        return False
+      target = listed[0]
+      previous = self.assigned[1] if self.assigned is not None else NO_TARGET
+      self.assigned = (head, target, now)
+      return target != previous
+
+    # Another cluster: its targets are taken unless we can outbid them.
+    # Returns whether it claims a target we assigned.
+    for target in [t for t, claim in self.foreign.items() if claim[0] == head]:
+      del self.foreign[target]
+    held = set(target for target, distance in self.assignment.values())
+    contested = False
+    for uav, target, distance in entries:
+      if target != NO_TARGET:
+        self.foreign[target] = (head, uav, distance, now)
+        contested = contested or target in held
+    return contested
+
+  # Whether another cluster holds target against uav at distance
+  def blocked(self, target, uav, distance):
+    claim = self.foreign.get(target)
+    if claim is None:
+      return False
+    head, holder, held = claim[0], claim[1], claim[2]
+    if holder == uav:
+      return False      # Its claim from the cluster it came from
+    return held < distance or (held == distance and holder > uav)
+
+  # Assign targets to the members of our cluster in one batch. distances
+  # holds each member's distance to each target, indexed as member_ids
+  # and target_ids. Members keep the target we assigned them, or the one
+  # they report if they joined from another cluster, while it stays in
+  # their range and uncontested; the rest are matched closest pair first.
+  def solve(self, member_ids, target_ids, distances):
+    self.solves += 1
+    column = dict((target, j) for j, target in enumerate(target_ids))
+    taken = set()
+    assignment = dict()
+
+    kept = []
+    for i, uav in enumerate(member_ids):
+      member = self.members[uav]
+      previous = self.assignment.get(uav, (NO_TARGET, 0.0))[0]
+      if previous == NO_TARGET:
+        previous = member.trackid
+      if previous != NO_TARGET and previous in member.targets:
+        kept.append((float(distances[i][column[previous]]), uav, previous))
+    kept.sort()
+    for distance, uav, target in kept:
+      if target not in taken and not self.blocked(target, uav, distance):
+        assignment[uav] = (target, distance)
+        taken.add(target)
+
+    pairs = []
+    for i, uav in enumerate(member_ids):
+      if uav in assignment:
+        continue
+      for target in self.members[uav].targets:
+        if target not in taken:
+          pairs.append((float(distances[i][column[target]]), uav, target))
+    pairs.sort()
+    for distance, uav, target in pairs:
+      if uav in assignment or target in taken or self.blocked(target, uav, distance):
+        continue
+      assignment[uav] = (target, distance)
+      taken.add(target)
+
+    # A member left without a target takes one from a member that can
+    # move to a target nobody holds, so keeping targets does not leave
+    # targets untracked
+    row = dict((uav, i) for i, uav in enumerate(member_ids))
+    holder = dict((target, uav) for uav, (target, distance) in assignment.items())
+    for uav in member_ids:
+      if uav in assignment:
+        continue
+      for target in sorted(self.members[uav].targets, key=lambda t: distances[row[uav]][column[t]]):
+        other = holder.get(target)
+        if other is None:
+          continue
+        free = [(float(distances[row[other]][column[t]]), t) for t in self.members[other].targets
+                if t not in taken and not self.blocked(t, other, float(distances[row[other]][column[t]]))]
+        distance = float(distances[row[uav]][column[target]])
+        if not free or self.blocked(target, uav, distance):
+          continue
+        moved, spare = min(free)
+        assignment[other] = (spare, moved)
+        assignment[uav] = (target, distance)
+        holder[spare] = other
+        holder[target] = uav
+        taken.add(spare)
+        break
+
+    for uav in member_ids:
+      if uav not in assignment:
+        assignment[uav] = (NO_TARGET, 0.0)
+    self.assignment = assignment
+    return assignment
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+
+# In-process stand-in for the CORE gRPC client, so the tracker and mover
+# code can run without core-daemon. Only the calls those scripts make
+# are provided: sessions, get_node, edit_node, node events and icons.
+
+import sys
+import types
+import collections
+
+
+#---------------
+# Plain records shaped like the core_pb2 messages the scripts read
+#---------------
+class Position():
+  def __init__(self, x=0.0, y=0.0):
+    self.x = x
+    self.y = y
+
+
+class Node():
+  def __init__(self, node_id, x, y, icon=""):
+    self.id = node_id
+    self.position = Position(x, y)
+    self.icon = icon
+
+  def copy(self):
+    return Node(self.id, self.position.x, self.position.y, self.icon)
+
+
+class Reply():
+  def __init__(self, **fields):
+    self.__dict__.update(fields)
+
+
+class NodeEvent():
+  def __init__(self, node):
+    self.node_event = Reply(node=node)
+
+  def HasField(self, name):
+    return name == "node_event"
+
+
+class EventType():
+  SESSION = 0
+  NODE = 1
+
+
+#---------------
+# Event subscription handle; mirrors the grpc stream's done callback
+#---------------
+class EventStream():
+  def __init__(self, handler):
+    self.handler = handler
+    self.callbacks = []
+    self.closed = False
+
+  def add_done_callback(self, callback):
+    self.callbacks.append(callback)
+
+  def cancel(self):
+    self.closed = True
+    for callback in self.callbacks:
+      callback(self)
+
+
+#---------------
+# One emulated session shared by every client
+#---------------
+class FakeWorld():
+  def __init__(self, session_id=1):
+    self.session_id = session_id
+    self.nodes = dict()
+    self.streams = []
+    self.calls = collections.Counter()
+
+  def addNode(self, node_id, x, y, icon=""):
+    self.nodes[node_id] = Node(node_id, x, y, icon)
+
+  def moveNode(self, node_id, x, y):
+    node = self.nodes[node_id]
+    node.position = Position(x, y)
+    self.broadcast(node)
+
+  def broadcast(self, node):
+    for stream in self.streams:
+      if not stream.closed:
+        stream.handler(NodeEvent(node.copy()))
+
+
+#---------------
+# Client with the CoreGrpcClient calls used by the scripts. Every call
+# is counted in the world so benchmarks can report gRPC load.
+#---------------
+class FakeCoreClient():
+  def __init__(self, world):
+    self.world = world
+
+  def connect(self):
+    pass
+
+  def get_sessions(self):
+    self.world.calls['get_sessions'] += 1
+    return Reply(sessions=[Reply(id=self.world.session_id)])
+
+  def get_session(self, session_id):
+    self.world.calls['get_session'] += 1
+    nodes = [node.copy() for node in self.world.nodes.values()]
+    return Reply(session=Reply(id=session_id, nodes=nodes))
+
+  def get_node(self, session_id, node_id):
+    self.world.calls['get_node'] += 1
+    return Reply(node=self.world.nodes[node_id].copy())
+
+  def edit_node(self, session_id, node_id, position=None, icon=None, source=None):
+    self.world.calls['edit_node'] += 1
+    node = self.world.nodes[node_id]
+    if position is not None:
+      node.position = Position(position.x, position.y)
+    if icon:
+      node.icon = icon
+    self.world.broadcast(node)
+    return Reply(result=True)
+
+  def events(self, session_id, handler, events=None):
+    self.world.calls['events'] += 1
+    stream = EventStream(handler)
+    self.world.streams.append(stream)
+    return stream
+
+
+# World used by clients created through the installed module
+default_world = FakeWorld()
+
+
+#---------------
+# Make "from core.api.grpc import client, core_pb2" resolve to this
+# stand-in. Must run before the tracker or mover modules are imported.
+#---------------
+def InstallFakeCore(world=None):
+  global default_world
+  if world is not None:
+    default_world = world
+
+  core_pb2 = types.ModuleType('core.api.grpc.core_pb2')
+  core_pb2.Position = Position
+  core_pb2.EventType = EventType
+
+  client = types.ModuleType('core.api.grpc.client')
+  client.CoreGrpcClient = lambda address: FakeCoreClient(default_world)
+
+  grpc_pkg = types.ModuleType('core.api.grpc')
+  grpc_pkg.client = client
+  grpc_pkg.core_pb2 = core_pb2
+  api = types.ModuleType('core.api')
+  api.grpc = grpc_pkg
+  core = types.ModuleType('core')
+  core.api = api
+
+  sys.modules['core'] = core
+  sys.modules['core.api'] = api
+  sys.modules['core.api.grpc'] = grpc_pkg
+  sys.modules['core.api.grpc.client'] = client
+  sys.modules['core.api.grpc.core_pb2'] = core_pb2
+  return default_world
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+
+# Geographic multicast groups. The area is split into square cells and
+# each cell has its own multicast group on the advert port. A UAV sends
+# to the group of the cell it is in and joins the groups of the cells
+# within its listen range, so it only receives adverts from UAVs near
+# enough to matter. Two UAVs can only compete for a target if both are
+# within tracking range of it, so trackers listen to twice their
+# tracking range.
+#
+# Linux allows 20 group memberships per socket by default
+# (net.ipv4.igmp_max_memberships); a cell at least 1.5 times the
+# tracking range keeps a tracker within that.
+
+import math
+
+# Cell groups are 235.2.<x cell>.<y cell>
+GROUP_PREFIX = "235.2"
+
+
+def CellOf(x, y, cell):
+  return int(math.floor(x/cell)), int(math.floor(y/cell))
+
+def CellGroup(cx, cy):
+  return "%s.%d.%d" % (GROUP_PREFIX, cx & 0xff, cy & 0xff)
+
+#---------------
+# Cells whose square comes within radius of (x, y)
+#---------------
+def CellsNear(x, y, radius, cell):
+  cells = set()
+  x0, y0 = CellOf(x - radius, y - radius, cell)
+  x1, y1 = CellOf(x + radius, y + radius, cell)
+  for cx in range(x0, x1 + 1):
+    for cy in range(y0, y1 + 1):
+      dx = max(cx*cell - x, 0, x - (cx + 1)*cell)
+      dy = max(cy*cell - y, 0, y - (cy + 1)*cell)
+      if dx*dx + dy*dy <= radius*radius:
+        cells.add((cx, cy))
+  return cells
+
+
+#---------------
+# Group memberships of one tracker, kept in step with its position.
+# membership is anything with join(group) and leave(group), such as a
+# McastReceiver. A group is left only once its cell is margin beyond
+# the listen range, so a UAV on a cell border does not flap.
+#---------------
+class GeoGroups():
+  def __init__(self, membership, cell, listen_range, margin=None):
+    self.membership = membership
+    self.cell = cell
+    self.listen_range = listen_range
+    self.margin = margin if margin is not None else cell/8
+    self.joined = set()
+    self.joins = 0
+    self.leaves = 0
+
+  # Update memberships for a UAV at (x, y); returns the group to send to
+  def update(self, x, y):
+    wanted = set(CellGroup(*c) for c in CellsNear(x, y, self.listen_range, self.cell))
+    kept = set(CellGroup(*c) for c in CellsNear(x, y, self.listen_range + self.margin, self.cell))
+    # Leave first, so the memberships never exceed what we will hold
+    for group in self.joined - kept:
+      self.membership.leave(group)
+      self.joined.discard(group)
+      self.leaves += 1
+    for group in wanted - self.joined:
+      self.membership.join(group)
+      self.joined.add(group)
+      self.joins += 1
+    return CellGroup(*CellOf(x, y, self.cell))
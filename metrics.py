@@ -0,0 +1,247 @@
+#!/usr/bin/python
+
+# Counters and latency histograms for the tracker and mover hot paths,
+# served as plain text (Prometheus exposition format) on a local port,
+# and a sampling profiler that SIGUSR1 turns on for a few seconds.
+
+import os
+import sys
+import time
+import bisect
+import signal
+import threading
+import collections
+import http.server
+
+# Histogram bucket bounds in seconds, 100us to 10s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+#---------------
+# Series name with its labels, e.g. rpc_seconds{call="setWypt"}
+#---------------
+def SeriesName(name, labels):
+  if not labels:
+    return name
+  return name + '{' + ','.join('%s="%s"' % (k, v) for k, v in labels) + '}'
+
+
+#---------------
+# Cumulative bucket counts, sum and count of observed values
+#---------------
+class Histogram():
+  __slots__ = ('counts', 'sum', 'count')
+
+  def __init__(self):
+    self.counts = [0]*(len(BUCKETS) + 1)
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+    self.sum += value
+    self.count += 1
+
+  def render(self, name, labels, lines):
+    cumulative = 0
+    for bound, n in zip(BUCKETS, self.counts):
+      cumulative += n
+      lines.append("%s %d" % (SeriesName(name + '_bucket', labels + (('le', bound),)), cumulative))
+    lines.append("%s %d" % (SeriesName(name + '_bucket', labels + (('le', '+Inf'),)), self.count))
+    lines.append("%s %f" % (SeriesName(name + '_sum', labels), self.sum))
+    lines.append("%s %d" % (SeriesName(name + '_count', labels), self.count))
+
+
+#---------------
+# Times the enclosed block into a histogram
+#---------------
+class Timer():
+  __slots__ = ('registry', 'name', 'labels', 'start')
+
+  def __init__(self, registry, name, labels):
+    self.registry = registry
+    self.name = name
+    self.labels = labels
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+#---------------
+# Every counter and histogram of the process
+#---------------
+class Registry():
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.counters = dict()
+    self.histograms = dict()
+
+  def inc(self, name, n=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with self.lock:
+      self.counters[key] = self.counters.get(key, 0) + n
+
+  def observe(self, name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with self.lock:
+      histogram = self.histograms.get(key)
+      if histogram is None:
+        histogram = self.histograms[key] = Histogram()
+      histogram.observe(value)
+
+  def timed(self, name, **labels):
+    return Timer(self, name, labels)
+
+  def render(self):
+    lines = []
+    with self.lock:
+      typed = set()
+      for (name, labels), value in sorted(self.counters.items()):
+        if name not in typed:
+          typed.add(name)
+          lines.append("# TYPE %s counter" % name)
+        lines.append("%s %d" % (SeriesName(name, labels), value))
+      for (name, labels), histogram in sorted(self.histograms.items()):
+        if name not in typed:
+          typed.add(name)
+          lines.append("# TYPE %s histogram" % name)
+        histogram.render(name, labels, lines)
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+def Inc(name, n=1, **labels):
+  registry.inc(name, n, **labels)
+
+def Observe(name, value, **labels):
+  registry.observe(name, value, **labels)
+
+def Timed(name, **labels):
+  return registry.timed(name, **labels)
+
+
+#---------------
+# Wraps a client (gRPC, XML-RPC proxy or IPC mover) and times every
+# method call into name{call=<method>}
+#---------------
+class TimedProxy():
+  def __init__(self, target, name):
+    self._target = target
+    self._name = name
+
+  def __getattr__(self, attr):
+    value = getattr(self._target, attr)
+    if not callable(value):
+      return value
+    name = self._name
+    def call(*args, **kwargs):
+      start = time.perf_counter()
+      try:
+        return value(*args, **kwargs)
+      finally:
+        registry.observe(name, time.perf_counter() - start, call=attr)
+    return call
+
+
+#---------------
+# Lock that records how long callers wait for it and hold it
+#---------------
+class TimedLock():
+  def __init__(self, name, lock=None):
+    self.lock = lock if lock is not None else threading.Lock()
+    self.wait_name = name + '_wait_seconds'
+    self.hold_name = name + '_hold_seconds'
+    self.acquired = 0.0
+
+  def acquire(self):
+    start = time.perf_counter()
+    self.lock.acquire()
+    self.acquired = time.perf_counter()
+    registry.observe(self.wait_name, self.acquired - start)
+    return True
+
+  def release(self):
+    held = time.perf_counter() - self.acquired
+    self.lock.release()
+    registry.observe(self.hold_name, held)
+
+  def __enter__(self):
+    return self.acquire()
+
+  def __exit__(self, *exc):
+    self.release()
+
+
+#---------------
+# Text metrics endpoint, e.g. "curl localhost:9101/metrics"
+#---------------
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+  def do_GET(self):
+    body = registry.render().encode()
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+def ServeMetrics(port, host='127.0.0.1'):
+  server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  print("Serving metrics on %s port %d" % (host, port))
+  return server
+
+
+#---------------
+# On SIGUSR1, sample every thread's stack for a few seconds and write
+# the counts in collapsed-stack form (one "frame;frame;... count" line
+# per stack, as flamegraph.pl reads it)
+#---------------
+class SampleProfiler():
+  def __init__(self, path, duration=10, interval=0.005):
+    self.path = path
+    self.duration = duration
+    self.interval = interval
+    self.thread = None
+
+  def install(self):
+    signal.signal(signal.SIGUSR1, self.trigger)
+
+  def trigger(self, signum=None, frame=None):
+    if self.thread is not None and self.thread.is_alive():
+      return
+    self.thread = threading.Thread(target=self.sample, daemon=True)
+    self.thread.start()
+
+  @staticmethod
+  def stack(frame):
+    names = []
+    while frame is not None:
+      code = frame.f_code
+      names.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+      frame = frame.f_back
+    return ";".join(reversed(names))
+
+  def sample(self):
+    stacks = collections.Counter()
+    me = threading.get_ident()
+    end = time.monotonic() + self.duration
+    while time.monotonic() < end:
+      for ident, frame in sys._current_frames().items():
+        if ident != me:
+          stacks[self.stack(frame)] += 1
+      time.sleep(self.interval)
+
+    with open(self.path, 'w') as f:
+      for stack, count in stacks.most_common():
+        f.write("%s %d\n" % (stack, count))
+    print("Wrote %d stack samples to %s" % (sum(stacks.values()), self.path))
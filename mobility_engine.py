@@ -0,0 +1,242 @@
+#!/usr/bin/python
+
+# Move every UAV from one process. Positions, waypoints, radii and
+# speeds live in NumPy arrays and the whole fleet is advanced with one
+# vectorized step that follows MoveVehicle's approach-then-orbit rules.
+# Each UAV's CoreUav interface is served from the shared arrays over
+# the uav_ipc channel, so trackers run with -m shm.
+
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from core.api.grpc import client
+
+import move_node_grpc
+from move_node_grpc import CoreUav
+from move_node_grpc import SetColor
+from node_positions import PositionSnapshot
+from node_updates import NodeUpdater
+from node_updates import UpdateThread
+from scheduler import FixedRate
+from spatial import TargetIndex
+from uav_ipc import IpcServer
+import scenario_gen
+
+
+#---------------
+# Vectorized MoveToWaypoint
+#---------------
+def FleetToWaypoint(xold, yold, xwypt, ywypt, movedist, totaldist):
+  ratio = movedist/totaldist
+  return xold + (xwypt-xold)*ratio, yold + (ywypt-yold)*ratio
+
+#---------------
+# Vectorized MoveOnCircle
+#---------------
+def FleetOnCircle(xnode, ynode, xcenter, ycenter, radius, distance):
+  posangle = np.arctan2(ynode-ycenter, xnode-xcenter)
+  moveangle = -distance/radius
+  return xcenter + radius*np.cos(posangle-moveangle), ycenter + radius*np.sin(posangle-moveangle)
+
+#---------------
+# Advance every vehicle by one step. Same cases as MoveVehicle, each
+# computed for the whole fleet and selected per vehicle.
+#---------------
+def MoveFleet(xold, yold, xtrgt, ytrgt, rad, speed, duration):
+  with np.errstate(divide='ignore', invalid='ignore'):
+    trgtdist = np.sqrt(np.power(ytrgt-yold, 2) + np.power(xtrgt-xold, 2))
+    movedist = speed * duration
+    collocated = trgtdist == 0
+    outside = trgtdist >= rad
+
+    # Outside the circle and still outside after moving
+    approach = outside & (trgtdist - movedist >= rad)
+    xa, ya = FleetToWaypoint(xold, yold, xtrgt, ytrgt, movedist, trgtdist)
+
+    # Outside the circle, reaching it during this step
+    tocircledist = trgtdist - rad
+    ratio = tocircledist/trgtdist
+    xcircle = xold + (xtrgt-xold)*ratio
+    ycircle = yold + (ytrgt-yold)*ratio
+    xb, yb = FleetOnCircle(xcircle, ycircle, xtrgt, ytrgt, rad, movedist - tocircledist)
+
+    # Inside the circle: the waypoint on the circle straight away from
+    # the target, or to the right of it when collocated
+    ratio = rad/trgtdist
+    xcircle = np.where(collocated, xtrgt + rad, xtrgt + (xold-xtrgt)*ratio)
+    ycircle = np.where(collocated, ytrgt, ytrgt + (yold-ytrgt)*ratio)
+    tocircledist = rad - trgtdist
+    inside_straight = movedist + trgtdist <= rad
+    wyptdist = np.sqrt(np.power(ycircle-yold, 2) + np.power(xcircle-xold, 2))
+    xc, yc = FleetToWaypoint(xold, yold, xcircle, ycircle, movedist, wyptdist)
+    xd, yd = FleetOnCircle(xcircle, ycircle, xtrgt, ytrgt, rad, movedist - tocircledist)
+
+    xnew = np.where(outside,
+                    np.where(approach, xa, np.where(collocated, xold, xb)),
+                    np.where(inside_straight, xc, xd))
+    ynew = np.where(outside,
+                    np.where(approach, ya, np.where(collocated, yold, yb)),
+                    np.where(inside_straight, yc, yd))
+
+    # A zero radius orbit is the target itself, as in MoveVehicle
+    orbit_zero = (rad == 0) & ~approach & ~collocated
+    xnew = np.where(orbit_zero, xtrgt, xnew)
+    ynew = np.where(orbit_zero, ytrgt, ynew)
+  return xnew, ynew
+
+
+#---------------
+# CoreUav whose position and waypoint are rows of the engine arrays
+#---------------
+class EngineUav(CoreUav):
+  def __init__(self, engine, index, core, session_id, node_id, x, y, wypt_x, wypt_y, positions,
+               target_index=None):
+    self.engine = engine
+    self.index = index
+    CoreUav.__init__(self, core, session_id, node_id, x, y, wypt_x, wypt_y, positions, target_index)
+
+  @property
+  def position(self):
+    return (float(self.engine.x[self.index]), float(self.engine.y[self.index]))
+
+  @position.setter
+  def position(self, position):
+    self.engine.x[self.index], self.engine.y[self.index] = position
+
+  @property
+  def track_wypt(self):
+    return (float(self.engine.wx[self.index]), float(self.engine.wy[self.index]))
+
+  @track_wypt.setter
+  def track_wypt(self, wypt):
+    self.engine.wx[self.index], self.engine.wy[self.index] = wypt
+
+
+#---------------
+# Fleet state and the loop that moves it
+#---------------
+class MobilityEngine():
+  def __init__(self, core, session_id, positions, updater):
+    self.core = core
+    self.session_id = session_id
+    self.positions = positions
+    self.updater = updater
+    # One grid over the targets (set before the engine), shared by the fleet
+    self.target_index = TargetIndex(positions, move_node_grpc.targets)
+    self.uavs = []
+    self.servers = []
+    self.x = np.zeros(0)
+    self.y = np.zeros(0)
+    self.wx = np.zeros(0)
+    self.wy = np.zeros(0)
+    self.rad = np.zeros(0)
+    self.speed = np.zeros(0)
+    self.update_thread = None
+
+  def addVehicle(self, node_id, x, y, wypt, rad, speed):
+    index = len(self.uavs)
+    self.x = np.append(self.x, float(x))
+    self.y = np.append(self.y, float(y))
+    self.wx = np.append(self.wx, float(wypt[0]))
+    self.wy = np.append(self.wy, float(wypt[1]))
+    self.rad = np.append(self.rad, float(rad))
+    self.speed = np.append(self.speed, float(speed))
+    uav = EngineUav(self, index, self.core, self.session_id, node_id, x, y,
+                    wypt[0], wypt[1], self.positions, self.target_index)
+    self.uavs.append(uav)
+    return uav
+
+  # Serve each vehicle's CoreUav interface to its tracker
+  def serve(self):
+    for uav in self.uavs:
+      server = IpcServer(uav)
+      server.start()
+      self.servers.append(server)
+
+  def step(self, duration):
+    for server in self.servers:
+      server.poll()
+
+    self.x, self.y = MoveFleet(self.x, self.y, self.wx, self.wy, self.rad, self.speed, duration)
+
+    for uav in self.uavs:
+      x, y = uav.position
+      self.updater.setPosition(uav.node_id, x, y)
+    if self.update_thread is not None:
+      self.update_thread.kick()
+    else:
+      self.updater.flush()
+
+    for server in self.servers:
+      server.publish()
+
+  # Step every duration over the time that actually passed, with the
+  # edits sent from their own thread
+  def run(self, duration):
+    self.update_thread = UpdateThread(self.updater)
+    self.update_thread.start()
+    rate = FixedRate(duration)
+    while 1:
+      self.step(rate.wait())
+
+
+#---------------
+# main
+#---------------
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-u','--uav', dest = 'uavs', metavar='id,x,y', action='append',
+                      default=[], help='UAV node id and initial position (repeat per UAV)')
+  parser.add_argument('-x','--scenario', dest = 'scenario', metavar='swarm config',
+                      type=str, default = None, help='Swarm config with every UAV and target (from scenario_gen.py)')
+  parser.add_argument('-r','--radius', dest = 'rad', metavar='radius',
+                      type=int, default = '70', help='Radius of the circle around the target')
+  parser.add_argument('-v','--speed', dest = 'speed', metavar='speed',
+                      type=float, default = '40', help='Vehicle speed')
+  parser.add_argument('-d','--duration', dest = 'msecduration', metavar='duration',
+                      type=float, default = '200', help='Movement duration (msec)')
+  parser.add_argument('-s','--snapshot-age', dest = 'snapshot_age', metavar='snapshot age',
+                      type=int, default = '250', help='Max age of the node position snapshot (msec)')
+  parser.add_argument('-m','--min-move', dest = 'min_move', metavar='min move',
+                      type=float, default = '0.5', help='Smallest position change sent to CORE')
+  args = parser.parse_args()
+  duration = args.msecduration/1000
+
+  # One grpc channel for the whole fleet
+  core = client.CoreGrpcClient("172.16.0.254:50051")
+  core.connect()
+  response = core.get_sessions()
+  if not response.sessions:
+    raise ValueError("no current core sessions")
+  session_id = int(response.sessions[0].id)
+
+  positions = PositionSnapshot(core, session_id, args.snapshot_age/1000)
+  updater = NodeUpdater(core, session_id, args.min_move)
+  move_node_grpc.targets = dict(move_node_grpc.default_targets)
+  move_node_grpc.updater = updater
+  if args.scenario:
+    config = scenario_gen.LoadConfig(args.scenario)
+    move_node_grpc.targets = scenario_gen.ConfigTargets(config)
+
+  engine = MobilityEngine(core, session_id, positions, updater)
+  if args.scenario:
+    for uav in config['uavs']:
+      engine.addVehicle(uav['id'], uav['x'], uav['y'], uav['wypt'], uav['rad'], uav['speed'])
+      SetColor(core, session_id, uav['id'], 'grey', "uav")
+  for uav in args.uavs:
+    node_id, x, y = [int(v) for v in uav.split(',')]
+    engine.addVehicle(node_id, x, y, move_node_grpc.original_wypts[node_id], args.rad, args.speed)
+    SetColor(core, session_id, node_id, 'grey', "uav")
+  for target_id, color in move_node_grpc.targets.items():
+    SetColor(core, session_id, target_id, color, "target")
+
+  engine.serve()
+  print("Moving %d UAVs" % len(engine.uavs))
+  engine.run(duration)
+
+
+if __name__ == '__main__':
+  main()
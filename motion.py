@@ -0,0 +1,177 @@
+#!/usr/bin/python
+
+# Target motion prediction. Each target read through PredictedPositions
+# gets a constant-velocity Kalman filter fed by the position snapshot.
+# The snapshot is only refreshed (one get_session call) when some
+# target's predicted position has grown too uncertain, or it is older
+# than max_age; in between, reads return the filters' predictions. The
+# filters' velocity estimates also give an intercept point for a UAV
+# flying at a known speed.
+
+import math
+import time
+
+# Process noise: variance of the unmodelled target acceleration
+ACCEL_VAR = 1.0
+
+# Measurement noise: variance of a position read
+READ_VAR = 1.0
+
+# Prior variance of a new target's velocity
+SPEED_VAR = 400.0
+
+# Furthest ahead an intercept is predicted (seconds)
+MAX_LEAD = 30.0
+
+
+#---------------
+# Constant-velocity Kalman filter for one axis: position, velocity and
+# their covariance
+#---------------
+class AxisFilter():
+  __slots__ = ('p', 'v', 'pp', 'pv', 'vv')
+
+  def __init__(self, z):
+    self.p = z
+    self.v = 0.0
+    self.pp = READ_VAR
+    self.pv = 0.0
+    self.vv = SPEED_VAR
+
+  # Covariance after dt seconds without a measurement
+  def predicted(self, dt):
+    q = ACCEL_VAR
+    pp = self.pp + 2*dt*self.pv + dt*dt*self.vv + q*dt**3/3
+    pv = self.pv + dt*self.vv + q*dt*dt/2
+    vv = self.vv + q*dt
+    return pp, pv, vv
+
+  def update(self, dt, z):
+    pp, pv, vv = self.predicted(dt)
+    self.p += self.v*dt
+    s = pp + READ_VAR
+    kp, kv = pp/s, pv/s
+    innovation = z - self.p
+    self.p += kp*innovation
+    self.v += kv*innovation
+    self.pp = (1 - kp)*pp
+    self.pv = (1 - kp)*pv
+    self.vv = vv - kv*pv
+
+
+#---------------
+# Position and velocity estimate of one target
+#---------------
+class TargetFilter():
+  __slots__ = ('x', 'y', 'stamp', 'read')
+
+  def __init__(self, stamp, x, y):
+    self.x = AxisFilter(x)
+    self.y = AxisFilter(y)
+    self.stamp = stamp
+    self.read = stamp
+
+  def update(self, stamp, x, y):
+    dt = stamp - self.stamp
+    self.x.update(dt, x)
+    self.y.update(dt, y)
+    self.stamp = stamp
+
+  def position(self, now):
+    dt = now - self.stamp
+    return self.x.p + self.x.v*dt, self.y.p + self.y.v*dt
+
+  def velocity(self):
+    return self.x.v, self.y.v
+
+  # Standard deviation of the predicted position
+  def sigma(self, now):
+    dt = now - self.stamp
+    return math.sqrt(self.x.predicted(dt)[0] + self.y.predicted(dt)[0])
+
+
+#---------------
+# Where a UAV at uav flying at speed meets a target at target moving at
+# velocity; the target itself if it cannot be caught within MAX_LEAD
+#---------------
+def Intercept(uav, speed, target, velocity):
+  dx, dy = target[0] - uav[0], target[1] - uav[1]
+  vx, vy = velocity
+  # |d + v t| = speed t, a quadratic in t
+  a = vx*vx + vy*vy - speed*speed
+  b = 2*(dx*vx + dy*vy)
+  c = dx*dx + dy*dy
+  if abs(a) < 1e-9:
+    t = -c/b if b < 0 else None
+  else:
+    disc = b*b - 4*a*c
+    t = None
+    if disc >= 0:
+      roots = [r for r in ((-b - math.sqrt(disc))/(2*a), (-b + math.sqrt(disc))/(2*a)) if r > 0]
+      if roots:
+        t = min(roots)
+  if t is None or t > MAX_LEAD:
+    return target
+  return target[0] + vx*t, target[1] + vy*t
+
+
+#---------------
+# Position source with the interface of PositionSnapshot that predicts
+# target positions between snapshot refreshes. Reads of own_id, the
+# UAV itself, are not predicted, since a UAV's turns do not fit a
+# constant-velocity model; they go to own() when given, else to the
+# snapshot.
+#---------------
+class PredictedPositions():
+  def __init__(self, positions, max_sigma=5.0, max_age=2.0, clock=time.monotonic,
+               own_id=None, own=None):
+    self.positions = positions
+    self.max_sigma = max_sigma
+    self.max_age = max_age
+    self.clock = clock
+    self.own_id = own_id
+    self.own = own
+    self.filters = dict()
+    self.refreshes = 0
+    self.skipped = 0
+
+  # Refresh the snapshot if a target we still read may have moved
+  # further than max_sigma from its prediction. Targets not read for
+  # max_age are forgotten.
+  def update(self):
+    now = self.clock()
+    for node_id in [n for n, f in self.filters.items() if now - f.read > self.max_age]:
+      del self.filters[node_id]
+    if now - self.positions.stamp < self.max_age:
+      if all(f.sigma(now) <= self.max_sigma for f in self.filters.values()):
+        self.skipped += 1
+        return self.positions.positions
+    self.refreshes += 1
+    return self.positions.refresh()
+
+  def getPosition(self, node_id):
+    if node_id == self.own_id:
+      # Our own position is not predicted
+      if self.own is not None:
+        return tuple(self.own())
+      return self.positions.getPosition(node_id)
+    position = self.positions.positions.get(node_id)
+    if position is None:
+      position = self.positions.getPosition(node_id)
+    stamp = self.positions.stamp
+    f = self.filters.get(node_id)
+    if f is None:
+      f = self.filters[node_id] = TargetFilter(stamp, position[0], position[1])
+    elif stamp > f.stamp:
+      f.update(stamp, position[0], position[1])
+    f.read = self.clock()
+    return f.position(f.read)
+
+  def velocity(self, node_id):
+    f = self.filters.get(node_id)
+    if f is None:
+      return 0.0, 0.0
+    return f.velocity()
+
+  def __getattr__(self, attr):
+    return getattr(self.positions, attr)
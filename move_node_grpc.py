@@ -9,17 +9,40 @@ import time
 import subprocess
 
 import threading
+import argparse
 
 from core.api.grpc import client
 from core.api.grpc import core_pb2
 
+from node_positions import PositionSnapshot
+from node_positions import NodeCache
+from uav_ipc import IpcServer
+from node_updates import NodeUpdater
+from node_updates import UpdateThread
+from scheduler import FixedRate
+from motion import PredictedPositions
+from spatial import TargetIndex
+import scenario_gen
+import metrics
+
 from xmlrpc.server import SimpleXMLRPCServer
 from xmlrpc.server import SimpleXMLRPCRequestHandler
 import sys
 
 filepath = "/tmp/"
 
+# Original waypoints
+original_wypts = {1: (100,150), 2: (100, 300), 3: (100, 450), 4: (100, 600), 
+                  6: (400, 150), 7: (400, 300), 8: (400, 450), 9: (400, 600)}
+
+# Targets colors
+colors = ['blue', 'yellow', 'green', 'red', 'lime', 'orange', 'pink', 'purple', 'lavender', 'cyan']
+default_targets = {11: colors[0], 12: colors[1], 13: colors[2], 14: colors[3], 
+                   16: colors[4], 17: colors[5], 18: colors[6], 19: colors[7]}
+
 targets = dict()
+nodecache = None
+updater = None
 iconpath = "/data/uas-core/icons/uav/"
 
 
@@ -32,9 +55,14 @@ def SetColor(core, session_id, node_id, color, nodetype):
   if nodetype == "target":
     iconname = color + '_dot.png'
   iconfile = iconpath + iconname
-  response = core.edit_node(session_id=session_id, node_id=node_id, icon=iconfile)  
-  response = core.get_node(session_id, node_id)  
-  print("SetColor for Node %d: %s" % (response.node.id, response.node.icon))
+  # Sent with the next position update
+  if updater is not None:
+    updater.setIcon(node_id, iconfile)
+  else:
+    response = core.edit_node(session_id=session_id, node_id=node_id, icon=iconfile)  
+  if nodecache is not None:
+    nodecache.setIcon(node_id, iconfile)
+  print("SetColor for Node %d: %s" % (node_id, iconfile))
 
 
 #---------------
@@ -62,10 +90,15 @@ def Distance(x1, y1, x2, y2):
 # Define a CORE UAV node
 #---------------
 class CoreUav():
-  def __init__(self, core, session_id, node_id, x, y, wypt_x, wypt_y):
+  def __init__(self, core, session_id, node_id, x, y, wypt_x, wypt_y, positions=None, index=None):
       self.core = core
       self.session_id = session_id
       self.node_id = node_id
+      if positions is None:
+        positions = PositionSnapshot(core, session_id)
+      self.positions = positions
+      # Grid over the target positions, which movers in one process can share
+      self.target_index = index
       self.target = -1
       self.position = (x,y)
       self.orig_wypt = (wypt_x,wypt_y)
@@ -89,22 +122,13 @@ class CoreUav():
     SetColor(self.core, self.session_id, self.node_id, color, "uav")
     return color
 
+  # Targets within track_range and inside the covered zone, nearest first
   def getPotentialTargets(self, covered_zone=1200, track_range=600):
-    potential_targets = []
-
-    for target_id in targets: 
-
-      response = self.core.get_node(self.session_id, target_id)
-      node = response.node
-      target_x, target_y = node.position.x, node.position.y
-      uav_x, uav_y = self.position[0], self.position[1]
-      distance = Distance(uav_x, uav_y, target_x, target_y)
-
-      if target_x <= covered_zone:
-        if Distance(uav_x, uav_y, target_x, target_y) <= track_range:
-          potential_targets.append(target_id)
-
-    return potential_targets
+    if self.target_index is None:
+      self.target_index = TargetIndex(self.positions, targets)
+    uav_x, uav_y = self.position[0], self.position[1]
+    near = self.target_index.query(uav_x, uav_y, track_range, covered_zone)
+    return [target_id for distance, target_id in near]
     
   def getWypt(self):
     return self.track_wypt
@@ -164,6 +188,8 @@ def MoveVehicle(xold, yold, xtrgt, ytrgt, rad, speed, duration):
       # the distance
       if trgtdist == 0:      # Special case: vehicle is collocated with 
         return xold, yold    # the target and radius is zero
+      if rad == 0:           # Special case: a zero radius orbit is the
+        return xtrgt, ytrgt  # target itself
       
       tocircledist = trgtdist - rad
       circledist = movedist - tocircledist
@@ -228,32 +254,56 @@ def StartXmlRpcServer(core_uav):
 #---------------
 def main():
   global targets
-
-  # Original waypoints
-  original_wypts = {1: (100,150), 2: (100, 300), 3: (100, 450), 4: (100, 600), 
-                    6: (400, 150), 7: (400, 300), 8: (400, 450), 9: (400, 600)}
-
-  # Targets colors
-  colors = ['blue', 'yellow', 'green', 'red', 'lime', 'orange', 'pink', 'purple', 'lavender', 'cyan']
-  targets = {11: colors[0], 12: colors[1], 13: colors[2], 14: colors[3], 
-            16: colors[4], 17: colors[5], 18: colors[6], 19: colors[7]}
+  global nodecache
+  global updater
+  global original_wypts
 
   # Get command line inputs 
-  if len(sys.argv) >= 7:
-    node_id  = int(sys.argv[1])
-    xuav  = int(sys.argv[2])
-    yuav  = int(sys.argv[3])
-    rad   = int(sys.argv[4])
-    speed = float(sys.argv[5])
-    msecduration  = float(sys.argv[6])
-    duration = msecduration/1000
-  else:
-    print("move_node.py nodenum xuav yuav radius speed duration(msec)\n")
-    sys.exit()
+  parser = argparse.ArgumentParser(usage="move_node.py nodenum xuav yuav radius speed duration(msec)")
+  parser.add_argument('node_id', type=int, help='My Node ID')
+  parser.add_argument('xuav', type=int, help='Initial X position')
+  parser.add_argument('yuav', type=int, help='Initial Y position')
+  parser.add_argument('rad', type=int, help='Radius of the circle around the target')
+  parser.add_argument('speed', type=float, help='Vehicle speed')
+  parser.add_argument('msecduration', type=float, help='Movement duration (msec)')
+  parser.add_argument('-s','--snapshot-age', dest = 'snapshot_age', metavar='snapshot age',
+                      type=int, default = '250', help='Max age of the node position snapshot (msec)')
+  parser.add_argument('-e','--events', dest = 'events', action='store_true',
+                      help='Keep node positions up to date from the CORE event stream')
+  parser.add_argument('-m','--min-move', dest = 'min_move', metavar='min move',
+                      type=float, default = '0.5', help='Smallest position change sent to CORE')
+  parser.add_argument('-x','--scenario', dest = 'scenario', metavar='swarm config',
+                      type=str, default = None, help='Swarm config with waypoints and targets (from scenario_gen.py)')
+  parser.add_argument('-P','--predict', dest = 'predict', metavar='max sigma',
+                      type=float, default = '0', help='Predict target positions, polling only when a prediction '
+                      'may be off by more than this (0 for always poll; not with -e)')
+  parser.add_argument('-M','--metrics-port', dest = 'metrics_port', metavar='metrics port',
+                      type=int, default = '0', help='Serve metrics on this local port (0 for none)')
+  args = parser.parse_args()
+  if args.predict > 0 and args.events:
+    parser.error("-P cannot be combined with -e")
+
+  if args.metrics_port:
+    metrics.ServeMetrics(args.metrics_port)
+  metrics.SampleProfiler("/tmp/move_n%d.prof" % args.node_id).install()
+
+  targets = dict(default_targets)
+  if args.scenario:
+    config = scenario_gen.LoadConfig(args.scenario)
+    original_wypts = scenario_gen.ConfigWaypoints(config)
+    targets = scenario_gen.ConfigTargets(config)
+
+  node_id = args.node_id
+  xuav = args.xuav
+  yuav = args.yuav
+  rad = args.rad
+  speed = args.speed
+  duration = args.msecduration/1000
 
   # Create grpc client
   core = client.CoreGrpcClient("172.16.0.254:50051")
   core.connect()
+  core = metrics.TimedProxy(core, 'grpc_seconds')
   response = core.get_sessions()
   if not response.sessions:
     raise ValueError("no current core sessions")
@@ -261,9 +311,22 @@ def main():
   session_id = int(session_summary.id)
   session = core.get_session(session_id).session
 
+  updater = NodeUpdater(core, session_id, args.min_move)
+
   # Set CORE UAV
   node_wypt = original_wypts[node_id]
-  core_uav = CoreUav(core, session_id, node_id, xuav, yuav, node_wypt[0], node_wypt[1])
+  if args.events:
+    nodecache = NodeCache(core, session_id, args.snapshot_age/1000)
+    nodecache.subscribe()
+    positions = nodecache
+  else:
+    positions = PositionSnapshot(core, session_id, args.snapshot_age/1000)
+    if args.predict > 0:
+      positions = PredictedPositions(positions, args.predict)
+  core_uav = CoreUav(core, session_id, node_id, xuav, yuav, node_wypt[0], node_wypt[1], positions,
+                     TargetIndex(positions, targets))
+  if nodecache is not None:
+    nodecache.listener = core_uav.target_index.moved
 
   # Initialize targets
   SetColor(core, session_id, node_id, 'grey', "uav")
@@ -276,27 +339,32 @@ def main():
   xml_rpc_server_thread = StartXmlRpcServerThread(core_uav)
   xml_rpc_server_thread.start()
 
+  # Initiate shared memory and command socket server
+  ipc_server = IpcServer(core_uav)
+  ipc_server.start()
+
   print("Start MOVE UAV thread")
 
-  # Move UAV node
+  # Positions go to CORE from their own thread, newest first
+  update_thread = UpdateThread(updater)
+  update_thread.start()
+
+  # Move UAV node every duration, over the time that actually passed
+  rate = FixedRate(duration)
   while 1:
-    time.sleep(duration)
-    position = core_uav.getWypt()
-    xtrgt, ytrgt = position[0], position[1] 
-    xuav, yuav = MoveVehicle(xuav, yuav, xtrgt, ytrgt, rad, speed, duration)
-    #print("xuav: %d, yuav: %d" % (xuav, yuav))
-
-    # Find UAV color to set
-    target_id = core_uav.target
-    color = "grey"
-    if target_id in targets: 
-      color = targets[target_id]
-    icon_file_path = iconpath + color + "_plane.png"
-
-    # Set position and keep current UAV color
-    pos = core_pb2.Position(x = xuav, y = yuav)
-    response = core.edit_node(session_id=session_id, node_id=node_id, position=pos, icon=icon_file_path)
-    core_uav.setPosition(xuav, yuav)
+    elapsed = rate.wait()
+    with metrics.Timed('step_seconds'):
+      ipc_server.poll()
+      position = core_uav.getWypt()
+      xtrgt, ytrgt = position[0], position[1] 
+      xuav, yuav = MoveVehicle(xuav, yuav, xtrgt, ytrgt, rad, speed, elapsed)
+      #print("xuav: %d, yuav: %d" % (xuav, yuav))
+
+      # Set position; color changes since the last step go in the same edit
+      updater.setPosition(node_id, xuav, yuav)
+      update_thread.kick()
+      core_uav.setPosition(xuav, yuav)
+      ipc_server.publish()
 
 
       
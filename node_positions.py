@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+# Node position lookups shared by the tracking and mobility scripts
+
+import time
+import threading
+
+from core.api.grpc import core_pb2
+
+
+#---------------
+# Snapshot of every node position in a CORE session, fetched with a
+# single get_session call and reused until it is older than max_age
+#---------------
+class PositionSnapshot():
+  def __init__(self, core, session_id, max_age=0.25, clock=time.monotonic):
+    self.core = core
+    self.session_id = session_id
+    self.max_age = max_age
+    self.clock = clock
+    self.positions = dict()
+    self.icons = dict()
+    self.stamp = 0.0
+
+  # Fetch all node positions in one round trip
+  def refresh(self):
+    response = self.core.get_session(self.session_id)
+    return self.load(response.session.nodes)
+
+  # Replace the snapshot with the given session nodes
+  def load(self, nodes):
+    positions = dict()
+    icons = dict()
+    for node in nodes:
+      positions[node.id] = (node.position.x, node.position.y)
+      icons[node.id] = node.icon
+    self.positions = positions
+    self.icons = icons
+    self.stamp = self.clock()
+    return positions
+
+  # Refresh the snapshot only if it is older than the staleness bound
+  def update(self):
+    if self.clock() - self.stamp > self.max_age:
+      self.refresh()
+    return self.positions
+
+  def getPosition(self, node_id):
+    positions = self.update()
+    if node_id not in positions:
+      # Node created after the last snapshot; ask for it directly
+      response = self.core.get_node(self.session_id, node_id)
+      node = response.node
+      positions[node_id] = (node.position.x, node.position.y)
+    return positions[node_id]
+
+  def getIcon(self, node_id):
+    if node_id not in self.icons:
+      response = self.core.get_node(self.session_id, node_id)
+      self.icons[node_id] = response.node.icon
+    return self.icons[node_id]
+
+  # Record an icon we just set ourselves
+  def setIcon(self, node_id, icon):
+    self.icons[node_id] = icon
+
+
+#---------------
+# Node table kept up to date by CORE's node event stream.
+# Lookups are served locally while the stream is up; if it drops,
+# lookups fall back to snapshot polling until it can be resubscribed
+#---------------
+class NodeCache(PositionSnapshot):
+  def __init__(self, core, session_id, max_age=0.25, retry=5.0):
+    PositionSnapshot.__init__(self, core, session_id, max_age)
+    self.retry = retry
+    self.lock = threading.Lock()
+    self.stream = None
+    self.streaming = False
+    self.last_subscribe = 0.0
+    # Called with (node id, x, y) for every position event
+    self.listener = None
+
+  # Subscribe to node events and seed the table with one snapshot
+  def subscribe(self):
+    self.last_subscribe = self.clock()
+    try:
+      self.stream = self.core.events(self.session_id, self.handleEvent, [core_pb2.EventType.NODE])
+    except Exception as e:
+      print("NodeCache: cannot subscribe to node events: %s" % e)
+      self.streaming = False
+      return False
+    self.streaming = True
+    self.stream.add_done_callback(self.streamDone)
+    self.refresh()
+    return True
+
+  def streamDone(self, stream):
+    print("NodeCache: node event stream closed, polling positions")
+    self.streaming = False
+
+  def handleEvent(self, event):
+    if not event.HasField("node_event"):
+      return
+    node = event.node_event.node
+    with self.lock:
+      self.positions[node.id] = (node.position.x, node.position.y)
+      if node.icon:
+        self.icons[node.id] = node.icon
+    if self.listener is not None:
+      self.listener(node.id, node.position.x, node.position.y)
+
+  def refresh(self):
+    with self.lock:
+      return PositionSnapshot.refresh(self)
+
+  def update(self):
+    if self.streaming:
+      return self.positions
+    if self.clock() - self.last_subscribe > self.retry:
+      self.subscribe()
+    return PositionSnapshot.update(self)
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+# Outbound node updates to CORE. Only nodes that changed since the last
+# edit_node are sent, and icon changes made between flushes are merged
+# into a single call with the next position update. A position update
+# always carries the node's current icon, as CORE may otherwise reset
+# it to the default.
+
+import math
+import threading
+import traceback
+
+from core.api.grpc import core_pb2
+
+import metrics
+
+
+#---------------
+# Last sent state for one node
+#---------------
+class SentState():
+  __slots__ = ('x', 'y', 'icon')
+
+  def __init__(self):
+    self.x = None
+    self.y = None
+    self.icon = None
+
+
+#---------------
+# Collect position and icon changes and send the deltas on flush
+#---------------
+class NodeUpdater():
+  def __init__(self, core, session_id, min_move=0.5):
+    self.core = core
+    self.session_id = session_id
+    self.min_move = min_move
+    self.lock = threading.Lock()
+    self.sent = dict()
+    self.positions = dict()
+    self.icons = dict()
+    self.edits = 0
+    self.coalesced = 0
+
+  # A position not yet sent is replaced, so only the newest goes out
+  def setPosition(self, node_id, x, y):
+    with self.lock:
+      if node_id in self.positions:
+        self.coalesced += 1
+        metrics.Inc('edits_coalesced')
+      self.positions[node_id] = (x, y)
+
+  # Later icon changes for the same node replace earlier ones
+  def setIcon(self, node_id, icon):
+    with self.lock:
+      self.icons[node_id] = icon
+
+  # Send one edit_node per node that has something new
+  def flush(self):
+    with self.lock:
+      positions, self.positions = self.positions, dict()
+      icons, self.icons = self.icons, dict()
+
+    for node_id in set(positions) | set(icons):
+      sent = self.sent.get(node_id)
+      if sent is None:
+        sent = self.sent[node_id] = SentState()
+
+      pos = None
+      if node_id in positions:
+        x, y = positions[node_id]
+        # Skip moves too small to show on the canvas
+        if sent.x is None or math.hypot(x - sent.x, y - sent.y) >= self.min_move:
+          pos = core_pb2.Position(x = x, y = y)
+          sent.x, sent.y = x, y
+
+      icon = icons.get(node_id)
+      if icon == sent.icon:
+        icon = None
+      elif icon is not None:
+        sent.icon = icon
+
+      if pos is None and icon is None:
+        continue
+      # Set position and keep current UAV color
+      self.core.edit_node(session_id=self.session_id, node_id=node_id, position=pos,
+                          icon=icon if icon is not None else sent.icon)
+      self.edits += 1
+
+
+#---------------
+# Send an updater's edits from a thread of its own, so a slow edit_node
+# does not hold up the mover loop. The pipeline is bounded by the
+# updater itself: it keeps one pending position per node, and a step
+# made while an edit is in flight replaces it, so CORE gets the newest
+# position as soon as the previous call returns.
+#---------------
+class UpdateThread(threading.Thread):
+  def __init__(self, updater):
+    threading.Thread.__init__(self, daemon=True)
+    self.updater = updater
+    self.cond = threading.Condition()
+    self.pending = False
+
+  # Flush the updater as soon as the last flush is done
+  def kick(self):
+    with self.cond:
+      self.pending = True
+      self.cond.notify()
+
+  def run(self):
+    while 1:
+      with self.cond:
+        while not self.pending:
+          self.cond.wait()
+        self.pending = False
+      try:
+        self.updater.flush()
+      except Exception:
+        traceback.print_exc()
+        metrics.Inc('edit_errors')
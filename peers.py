@@ -0,0 +1,170 @@
+#!/usr/bin/python
+
+# Peer state kept by a tracker: one record per UAV, indexed by node id
+# and by the target each UAV claims. Peers not heard from within the
+# table's TTL are dropped along with their claims.
+
+import heapq
+import collections
+
+
+#---------------
+# Define a CORE node
+#---------------
+class CORENode():
+  __slots__ = ('nodeid', '_trackid', '_oldtrackid', 'trackingMode',
+               'potentialTargetDis', 'table', 'heard', 'expires', 'claim')
+
+  def __init__(self, nodeid, track_nodeid, potentialDistance, trackingMode):
+    self.table = None
+    self.heard = None
+    self.expires = None
+    # Last claim advertised by this UAV, as (target, mode, distance,
+    # version); local resets of trackid do not change it
+    self.claim = None
+    self.nodeid = nodeid
+    self._trackid = track_nodeid
+    self._oldtrackid = track_nodeid
+    self.trackingMode = trackingMode
+    self.potentialTargetDis = potentialDistance
+
+  def __repr__(self):
+    return str(self.nodeid)
+
+  # Target changes go through the table so its indexes stay current
+  @property
+  def trackid(self):
+    return self._trackid
+
+  @trackid.setter
+  def trackid(self, trackid):
+    if self.table is not None:
+      self.table.reindex(self.table.claimants, self, self._trackid, trackid)
+    self._trackid = trackid
+
+  @property
+  def oldtrackid(self):
+    return self._oldtrackid
+
+  @oldtrackid.setter
+  def oldtrackid(self, oldtrackid):
+    if self.table is not None:
+      self.table.reindex(self.table.old_claimants, self, self._oldtrackid, oldtrackid)
+    self._oldtrackid = oldtrackid
+
+
+#---------------
+# UAV records in arrival order (our own node first), with O(1) lookup
+# by node id and reverse indexes from target id to the UAVs claiming it.
+# With a ttl, peers are expired from a heap holding at most one timer
+# per peer; a timer that fires for a peer heard since is pushed back.
+#---------------
+class PeerTable():
+  def __init__(self, ttl=None):
+    self.byid = dict()
+    self.claimants = dict()
+    self.old_claimants = dict()
+    self.ttl = ttl
+    self.timers = []
+
+  def __getitem__(self, i):
+    if i == 0:
+      return next(iter(self.byid.values()))
+    return list(self.byid.values())[i]
+
+  def __iter__(self):
+    return iter(self.byid.values())
+
+  def __len__(self):
+    return len(self.byid)
+
+  def __repr__(self):
+    return repr(list(self.byid.values()))
+
+  def append(self, node):
+    node.table = self
+    self.byid[node.nodeid] = node
+    self.reindex(self.claimants, node, None, node.trackid)
+    self.reindex(self.old_claimants, node, None, node.oldtrackid)
+
+  def get(self, nodeid):
+    return self.byid.get(nodeid)
+
+  # Drop a peer and the claims it holds
+  def remove(self, node):
+    if self.byid.get(node.nodeid) is not node:
+      return
+    del self.byid[node.nodeid]
+    self.reindex(self.claimants, node, node.trackid, None)
+    self.reindex(self.old_claimants, node, node.oldtrackid, None)
+    node.table = None
+
+  # Note that a peer was heard from at time now
+  def touch(self, node, now):
+    node.heard = now
+    if self.ttl is not None and node.expires is None:
+      node.expires = now + self.ttl
+      heapq.heappush(self.timers, (node.expires, node.nodeid))
+
+  # Remove and return the peers not heard from for ttl seconds
+  def expire(self, now):
+    expired = []
+    while self.timers and self.timers[0][0] <= now:
+      deadline, nodeid = heapq.heappop(self.timers)
+      node = self.byid.get(nodeid)
+      if node is None or node.expires != deadline:
+        continue
+      if node.heard + self.ttl > now:
+        node.expires = node.heard + self.ttl
+        heapq.heappush(self.timers, (node.expires, nodeid))
+        continue
+      node.expires = None
+      self.remove(node)
+      expired.append(node)
+    return expired
+
+  def reindex(self, index, node, old, new):
+    if old == new:
+      return
+    if old in index:
+      claiming = index[old]
+      claiming.pop(node.nodeid, None)
+      if not claiming:
+        del index[old]
+    if new is not None:
+      index.setdefault(new, dict())[node.nodeid] = node
+
+  # UAVs whose current target is trgtnodeid
+  def claiming(self, trgtnodeid):
+    return list(self.claimants.get(trgtnodeid, dict()).values())
+
+  # UAVs whose target was trgtnodeid before the last reset
+  def previouslyClaiming(self, trgtnodeid):
+    return list(self.old_claimants.get(trgtnodeid, dict()).values())
+
+
+#---------------
+# Set of target ids that forgets the oldest entries past maxlen
+#---------------
+class BoundedSet():
+  def __init__(self, maxlen=256):
+    self.maxlen = maxlen
+    self.items = collections.OrderedDict()
+
+  def __contains__(self, item):
+    return item in self.items
+
+  def __len__(self):
+    return len(self.items)
+
+  def __repr__(self):
+    return repr(list(self.items))
+
+  def add(self, item):
+    self.items[item] = True
+    self.items.move_to_end(item)
+    if len(self.items) > self.maxlen:
+      self.items.popitem(last=False)
+
+  def clear(self):
+    self.items.clear()
@@ -0,0 +1,209 @@
+#!/usr/bin/python
+
+# Record everything a tracker's decisions depend on (received
+# advertisements, position reads, potential target sets and tick times)
+# plus the mover calls it makes, to a compact append-only binary log
+# that replay.py plays back. Records are copied into a ring buffer and
+# written to disk by a background thread, so the hot path never waits
+# on file I/O.
+
+import json
+import time
+import struct
+import threading
+
+MAGIC = b'UAVREC1\n'
+
+# Every record: kind, clock time, payload length, then the payload
+RECORD = struct.Struct('!BdH')
+
+REC_HEADER = 0       # JSON agent settings
+REC_TICK = 1         # TrackTargets started
+REC_ADVERT = 2       # raw received datagram
+REC_POSITION = 3     # node id, x, y returned by a position read
+REC_TARGETS = 4      # potential target ids
+REC_SET_TARGET = 5   # target id passed to the mover
+REC_SET_WYPT = 6     # waypoint passed to the mover
+REC_ORIG_WYPT = 7    # original waypoint returned by the mover
+
+POSITION = struct.Struct('!idd')
+TARGET = struct.Struct('!i')
+WYPT = struct.Struct('!dd')
+
+RING_BYTES = 1 << 20
+
+
+#---------------
+# Byte ring drained to a file by its own thread. A record that does not
+# fit is dropped whole and counted rather than blocking the caller.
+#---------------
+class RingWriter(threading.Thread):
+  def __init__(self, path, size=RING_BYTES, flush_interval=0.05):
+    threading.Thread.__init__(self, daemon=True)
+    self.f = open(path, 'wb')
+    self.ring = bytearray(size)
+    self.view = memoryview(self.ring)
+    self.size = size
+    self.flush_interval = flush_interval
+    # Running totals of bytes copied in and written out
+    self.head = 0
+    self.tail = 0
+    self.dropped = 0
+    self.closed = False
+    self.cond = threading.Condition()
+
+  def write(self, data):
+    n = len(data)
+    with self.cond:
+      used = self.head - self.tail
+      if used + n > self.size:
+        self.dropped += 1
+        return False
+      start = self.head % self.size
+      first = min(n, self.size - start)
+      self.ring[start:start+first] = data[:first]
+      if first < n:
+        self.ring[0:n-first] = data[first:]
+      self.head += n
+      # Only wake the writer early when the ring is filling up
+      if used + n > self.size // 2:
+        self.cond.notify()
+    return True
+
+  def run(self):
+    while 1:
+      with self.cond:
+        if self.head == self.tail:
+          if self.closed:
+            break
+          self.cond.wait(self.flush_interval)
+        head, tail = self.head, self.tail
+
+      # Writers never touch [tail, head) until tail moves on
+      start, end = tail % self.size, tail % self.size + head - tail
+      if end <= self.size:
+        self.f.write(self.view[start:end])
+      else:
+        self.f.write(self.view[start:])
+        self.f.write(self.view[:end-self.size])
+      with self.cond:
+        self.tail = head
+    self.f.close()
+
+  def close(self):
+    with self.cond:
+      self.closed = True
+      self.cond.notify()
+    self.join()
+
+
+#---------------
+# Packs tracker inputs and mover calls into records
+#---------------
+class Recorder():
+  def __init__(self, path, header, clock=time.monotonic):
+    self.clock = clock
+    self.writer = RingWriter(path)
+    self.writer.write(MAGIC)
+    self.record(REC_HEADER, json.dumps(header).encode())
+    self.writer.start()
+
+  def record(self, kind, payload=b''):
+    self.writer.write(RECORD.pack(kind, self.clock(), len(payload)) + payload)
+
+  def tick(self):
+    self.record(REC_TICK)
+
+  def advert(self, buf, nbytes):
+    self.record(REC_ADVERT, bytes(buf[:nbytes]))
+
+  def position(self, node_id, x, y):
+    self.record(REC_POSITION, POSITION.pack(node_id, x, y))
+
+  def targets(self, target_ids):
+    self.record(REC_TARGETS, struct.pack('!%di' % len(target_ids), *target_ids))
+
+  def setTarget(self, target):
+    self.record(REC_SET_TARGET, TARGET.pack(target))
+
+  def setWypt(self, x, y):
+    self.record(REC_SET_WYPT, WYPT.pack(x, y))
+
+  def origWypt(self, x, y):
+    self.record(REC_ORIG_WYPT, WYPT.pack(x, y))
+
+  def close(self):
+    self.writer.close()
+    if self.writer.dropped:
+      print("Recorder dropped %d records" % self.writer.dropped)
+
+
+#---------------
+# Position source that records every read
+#---------------
+class RecordingPositions():
+  def __init__(self, positions, recorder):
+    self.positions = positions
+    self.recorder = recorder
+
+  def update(self):
+    return self.positions.update()
+
+  def getPosition(self, node_id):
+    x, y = self.positions.getPosition(node_id)
+    self.recorder.position(node_id, x, y)
+    return x, y
+
+  def __getattr__(self, attr):
+    return getattr(self.positions, attr)
+
+
+#---------------
+# Mover that records the replies the tracker reads and the calls it makes
+#---------------
+class RecordingMover():
+  def __init__(self, mover, recorder):
+    self.mover = mover
+    self.recorder = recorder
+
+  def getPotentialTargets(self, covered_zone=1200, track_range=600):
+    target_ids = self.mover.getPotentialTargets(covered_zone, track_range)
+    self.recorder.targets(target_ids)
+    return target_ids
+
+  def getOriginalWypt(self):
+    position = self.mover.getOriginalWypt()
+    self.recorder.origWypt(position[0], position[1])
+    return position
+
+  def setTarget(self, target):
+    self.recorder.setTarget(target)
+    return self.mover.setTarget(target)
+
+  def setWypt(self, x, y):
+    self.recorder.setWypt(x, y)
+    return self.mover.setWypt(x, y)
+
+  def __getattr__(self, attr):
+    return getattr(self.mover, attr)
+
+
+#---------------
+# Records of a log as (kind, time, payload) tuples
+#---------------
+def ReadLog(path):
+  with open(path, 'rb') as f:
+    data = f.read()
+  if not data.startswith(MAGIC):
+    raise ValueError("%s is not a tracker recording" % path)
+  offset = len(MAGIC)
+  while offset + RECORD.size <= len(data):
+    kind, stamp, length = RECORD.unpack_from(data, offset)
+    offset += RECORD.size
+    if offset + length > len(data):
+      break       # Truncated last record
+    yield kind, stamp, data[offset:offset+length]
+    offset += length
+
+def Targets(payload):
+  return list(struct.unpack('!%di' % (len(payload) // 4), payload))
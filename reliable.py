@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+# NACK-based reliability for tracker advertisements: receivers detect
+# missing sequence numbers and ask the sender to retransmit them from a
+# small ring buffer, so adverts are only repeated when loss is observed
+
+import time
+import collections
+
+from advert import McastSender
+from advert import KIND_ADVERT
+
+# Adverts kept for retransmission by each sender
+RING_SIZE = 16
+
+# A sequence number this far behind the last one seen means the sender
+# restarted, even without a timestamp to tell
+RESTART_WINDOW = 4 * RING_SIZE
+
+
+#---------------
+# Sender that keeps its recent adverts for retransmission
+#---------------
+class ReliableSender(McastSender):
+  def __init__(self, mcastaddr, port, ttl, transport=None, holdoff=0.1):
+    McastSender.__init__(self, mcastaddr, port, ttl, transport)
+    self.ring = collections.deque(maxlen=RING_SIZE)
+    self.holdoff = holdoff
+    self.resent = dict()
+    self.retransmits = 0
+
+  def send(self, uavnodeid, trgtnodeid, potentialTrgDis, track, kind=KIND_ADVERT, digest=()):
+    seq = McastSender.send(self, uavnodeid, trgtnodeid, potentialTrgDis, track, kind, digest)
+    self.ring.append((seq, bytes(self.view[:self.length])))
+    return seq
+
+  # Retransmit the requested adverts that are still in the ring. Several
+  # receivers may NACK the same loss; repeat each advert at most once per
+  # holdoff period. Runs on the receive thread while send() appends to
+  # the ring, so it works on a copy.
+  def handleNack(self, first, count, now=None):
+    if now is None:
+      now = time.monotonic()
+    for seq, data in list(self.ring):
+      if first <= seq < first + count:
+        if now - self.resent.get(seq, 0.0) < self.holdoff:
+          continue
+        self.resent[seq] = now
+        self.resend(data)
+        self.retransmits += 1
+    for seq in list(self.resent):
+      if seq < first - RING_SIZE:
+        del self.resent[seq]
+
+
+#---------------
+# Per-sender receive state
+#---------------
+class PeerSeq():
+  def __init__(self, seq, now, stamp=None):
+    self.last = seq
+    self.heard = now
+    self.stamp = stamp
+    self.nacked = -1
+    self.nacked_at = None
+
+
+#---------------
+# Sequence tracking on the receive side
+#---------------
+class ReliableReceiver():
+  def __init__(self, interval):
+    self.interval = interval
+    self.peers = dict()
+    self.lost = 0
+    self.recovered = 0
+
+  # Record an advert from source, sent at the sender's timestamp stamp.
+  # Returns whether it is newer than what we have applied. Every advert
+  # carries the sender's full state, so a gap closed by a newer advert is
+  # only counted; what needs repair is a missing latest advert, which
+  # overdue() finds. A restarted sender counts from 1 again: an old
+  # sequence number with a newer timestamp than the last advert is a
+  # restart, where a retransmission carries its original timestamp.
+  def received(self, source, seq, now, stamp=None):
+    peer = self.peers.get(source)
+    restarted = peer is not None and seq <= peer.last and (
+      seq + RESTART_WINDOW < peer.last or
+      (stamp is not None and peer.stamp is not None and stamp > peer.stamp))
+    if peer is None or restarted:
+      self.peers[source] = PeerSeq(seq, now, stamp)
+      return True
+
+    if seq <= peer.last:
+      # Retransmission of an advert already superseded
+      return False
+
+    if seq == peer.nacked:
+      self.recovered += 1
+    self.lost += seq - peer.last - 1
+    peer.last = seq
+    peer.heard = now
+    if stamp is not None:
+      peer.stamp = stamp
+    return True
+
+  # Stop tracking a source that has gone away
+  def forget(self, source):
+    self.peers.pop(source, None)
+
+  # Another receiver already asked for this advert at time now; don't
+  # repeat the NACK
+  def heardNack(self, source, first, count, now):
+    peer = self.peers.get(source)
+    if peer is not None and first <= peer.last + 1 < first + count:
+      peer.nacked = peer.last + 1
+      peer.nacked_at = now
+
+  # Peers whose next advert is overdue, which usually means it was lost.
+  # Returns (source, expected sequence) pairs to NACK, again every
+  # interval while the NACK or its repair is lost too. Only sources for
+  # which relevant(source) holds are considered.
+  def overdue(self, now, relevant=None):
+    missing = []
+    for source, peer in self.peers.items():
+      if relevant is not None and not relevant(source):
+        continue
+      expected = peer.last + 1
+      if now - peer.heard > 1.5 * self.interval and (
+          peer.nacked != expected or now - peer.nacked_at >= self.interval):
+        peer.nacked = expected
+        peer.nacked_at = now
+        missing.append((source, expected))
+    return missing
@@ -0,0 +1,204 @@
+#!/usr/bin/python
+
+# Replay a tracker recording (track_target_grpc.py -R, or swarm_sim.py
+# -R) through a fresh copy of the tracker, as fast as it will run.
+# Positions, potential targets and advertisements come from the log, so
+# the same log gives the same decisions every time; the mover calls made
+# are checked against the recorded ones and every tick is timed.
+
+import sys
+import json
+import time
+import argparse
+
+import fake_core
+from agent_loader import LoadAgent
+from record import ReadLog
+from record import Targets
+from record import POSITION
+from record import TARGET
+from record import WYPT
+from record import REC_HEADER
+from record import REC_TICK
+from record import REC_ADVERT
+from record import REC_POSITION
+from record import REC_TARGETS
+from record import REC_SET_TARGET
+from record import REC_ORIG_WYPT
+
+
+#---------------
+# Positions read during the tick being replayed
+#---------------
+class ReplayPositions():
+  def __init__(self):
+    self.table = dict()
+    self.misses = 0
+
+  def update(self):
+    pass
+
+  def getPosition(self, node_id):
+    position = self.table.get(node_id)
+    if position is None:
+      # The tracker read a node the recorded run never did
+      self.misses += 1
+      return (0.0, 0.0)
+    return position
+
+
+#---------------
+# Mover replies from the log; calls made are kept for comparison
+#---------------
+class ReplayMover():
+  def __init__(self):
+    self.potential_targets = []
+    self.orig_wypt = (0, 0)
+    self.targets = []
+    self.wypts = []
+
+  def getPotentialTargets(self, covered_zone=1200, track_range=600):
+    return list(self.potential_targets)
+
+  def getOriginalWypt(self):
+    return self.orig_wypt
+
+  def setTarget(self, target):
+    self.targets.append(target)
+    return True
+
+  def setWypt(self, x, y):
+    self.wypts.append((x, y))
+    return True
+
+
+#---------------
+# One recording and the tracker it drives
+#---------------
+class Replay():
+  def __init__(self, path, name="replay_agent"):
+    self.records = list(ReadLog(path))
+    kind, stamp, payload = self.records[0]
+    if kind != REC_HEADER:
+      raise ValueError("%s has no header record" % path)
+    self.header = json.loads(payload)
+    self.now = stamp
+    self.sent = 0
+    self.adverts = 0
+    self.tick_times = []
+    self.expected_targets = [TARGET.unpack(payload)[0]
+                             for kind, stamp, payload in self.records if kind == REC_SET_TARGET]
+
+    # The tracker module reads the CORE client at import
+    fake_core.InstallFakeCore(fake_core.FakeWorld())
+    self.positions = ReplayPositions()
+    self.mover = ReplayMover()
+    for kind, stamp, payload in self.records:
+      if kind == REC_ORIG_WYPT:
+        self.mover.orig_wypt = WYPT.unpack(payload)
+        break
+
+    agent = LoadAgent(name)
+    agent.protocol = self.header['protocol']
+    agent.peer_ttl = self.header.get('peer_ttl', agent.peer_ttl)
+    agent.redundancy = self.header.get('redundancy', agent.redundancy)
+    agent.gossip = self.header.get('gossip', agent.gossip)
+    agent.cluster_cell = self.header.get('cluster_cell', agent.cluster_cell)
+    agent.positions = self.positions
+    agent.mover = self.mover
+    agent.transport = self.transport
+    agent.clock = self.clock
+    agent.quiet = True
+    agent.InitAgent(self.header['uav_id'], self.header['interval'])
+    self.agent = agent
+
+  def clock(self):
+    return self.now
+
+  def transport(self, data):
+    self.sent += 1
+
+  # Load the positions and potential targets recorded during the tick
+  # starting at records[start]
+  def loadTick(self, start):
+    for kind, stamp, payload in self.records[start:]:
+      if kind == REC_TICK:
+        break
+      if kind == REC_POSITION:
+        node_id, x, y = POSITION.unpack(payload)
+        self.positions.table[node_id] = (x, y)
+      elif kind == REC_TARGETS:
+        self.mover.potential_targets = Targets(payload)
+
+  def run(self):
+    agent = self.agent
+    covered_zone, track_range = self.header['covered_zone'], self.header['track_range']
+    for index, (kind, stamp, payload) in enumerate(self.records):
+      self.now = stamp
+      if kind == REC_ADVERT:
+        self.adverts += 1
+        agent.HandleAdvert(memoryview(payload), len(payload))
+      elif kind == REC_ORIG_WYPT:
+        self.mover.orig_wypt = WYPT.unpack(payload)
+      elif kind == REC_TICK:
+        self.loadTick(index + 1)
+        start = time.perf_counter()
+        agent.TrackTargets(covered_zone, track_range)
+        self.tick_times.append(time.perf_counter() - start)
+
+  # Index of the first mover target call that differs from the recording,
+  # or None if they all match
+  def divergence(self):
+    for index, (expected, actual) in enumerate(zip(self.expected_targets, self.mover.targets)):
+      if expected != actual:
+        return index
+    if len(self.expected_targets) != len(self.mover.targets):
+      return min(len(self.expected_targets), len(self.mover.targets))
+    return None
+
+  def summary(self):
+    times = sorted(self.tick_times)
+    def Percentile(p):
+      if not times:
+        return 0.0
+      return times[min(len(times) - 1, int(p*len(times)))]
+    return {
+      'uav': self.header['uav_id'],
+      'protocol': self.header['protocol'],
+      'recorded_seconds': self.records[-1][1] - self.records[0][1],
+      'ticks': len(times),
+      'adverts': self.adverts,
+      'sent': self.sent,
+      'tick_total': sum(times),
+      'tick_p50': Percentile(0.5),
+      'tick_p99': Percentile(0.99),
+      'tick_max': times[-1] if times else 0.0,
+      'position_misses': self.positions.misses,
+      'target_changes': len(self.mover.targets),
+      'diverged_at': self.divergence(),
+    }
+
+
+#---------------
+# main
+#---------------
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('logs', nargs='+', help='Tracker recordings')
+  parser.add_argument('-n','--repeat', dest = 'repeat', metavar='repeat',
+                      type=int, default = '1', help='Replay each log this many times')
+  args = parser.parse_args()
+
+  diverged = False
+  for path in args.logs:
+    for i in range(args.repeat):
+      replay = Replay(path, "replay_agent_%d" % i)
+      replay.run()
+      result = replay.summary()
+      print(path, " ".join("%s=%s" % (name, value) for name, value in result.items()))
+      diverged = diverged or result['diverged_at'] is not None
+  sys.exit(1 if diverged else 0)
+
+
+if __name__ == '__main__':
+  main()
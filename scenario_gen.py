@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+# Generate a swarm scenario for any number of UAVs and targets: the
+# CORE scenario XML, a swarm config (waypoints, targets, link and
+# tracker settings) and a launch script for the trackers, all from the
+# same layout so they stay consistent.
+
+import os
+import json
+import argparse
+import xml.etree.ElementTree as ET
+
+iconpath = "/data/uas-core/icons/uav/"
+colors = ['blue', 'yellow', 'green', 'red', 'lime', 'orange', 'pink', 'purple', 'lavender', 'cyan']
+
+# Layout, following the hand-made 8x8 scenario: UAV waypoints in columns
+# 300 apart on the left, UAVs starting near the left edge, targets in
+# the covered zone further right, rows 150 apart
+UAV_COLUMNS = (100, 400)
+TARGET_COLUMNS = (700, 1000)
+ROW_SPACING = 150
+FIRST_ROW = 150
+
+
+#---------------
+# Build the swarm config for num_uavs UAVs and num_targets targets.
+# UAVs get ids 1..N, targets N+1..N+M and the wlan the next id.
+#---------------
+def MakeConfig(num_uavs, num_targets, rad=70, speed=40, duration=200, interval=500,
+               covered_zone=1200, track_range=600, linkrange=1100, delay=0.2, error=20):
+  uavs = []
+  for i in range(num_uavs):
+    column, row = i % len(UAV_COLUMNS), i // len(UAV_COLUMNS)
+    wypt = (UAV_COLUMNS[column], FIRST_ROW + row*ROW_SPACING)
+    uavs.append({'id': i + 1, 'x': 67 + 100*column, 'y': 36 + 50*row,
+                 'wypt': wypt, 'rad': rad, 'speed': speed, 'duration': duration})
+
+  targets = dict()
+  for i in range(num_targets):
+    column, row = i % len(TARGET_COLUMNS), i // len(TARGET_COLUMNS)
+    targets[str(num_uavs + i + 1)] = {'x': TARGET_COLUMNS[column], 'y': FIRST_ROW + row*ROW_SPACING,
+                                      'color': colors[i % len(colors)]}
+
+  return {'uavs': uavs, 'targets': targets, 'wlan': num_uavs + num_targets + 1,
+          'link': {'range': linkrange, 'delay': delay, 'error': error},
+          'interval': interval, 'covered_zone': covered_zone, 'track_range': track_range}
+
+
+def LoadConfig(path):
+  with open(path) as f:
+    return json.load(f)
+
+
+#---------------
+# Original waypoints and target colors of a swarm config, in the form
+# move_node_grpc.py keeps them
+#---------------
+def ConfigWaypoints(config):
+  return dict((uav['id'], tuple(uav['wypt'])) for uav in config['uavs'])
+
+def ConfigTargets(config):
+  return dict((int(target_id), target['color']) for target_id, target in config['targets'].items())
+
+
+def Ip4(index):
+  return "10.0.%d.%d" % (index // 250, index % 250 + 1)
+
+
+#---------------
+# CORE scenario XML for a swarm config. The movers read their waypoints
+# and targets from the config at configpath.
+#---------------
+def MakeScenarioXml(config, configpath, movepath="/data/uas-core/move_node_grpc.py"):
+  scenario = ET.Element('scenario', name="uav-swarm")
+  networks = ET.SubElement(scenario, 'networks')
+  wlan = ET.SubElement(networks, 'network', id=str(config['wlan']),
+                       name="wlan%d" % config['wlan'], icon="", type="WIRELESS_LAN")
+  ET.SubElement(wlan, 'position', x="368.0", y="28.0")
+
+  devices = ET.SubElement(scenario, 'devices')
+  def AddDevice(node_id, icon, x, y):
+    device = ET.SubElement(devices, 'device', id=str(node_id), name="n%d" % node_id,
+                           icon=iconpath + icon, type="PC", attrib={'class': "", 'image': ""})
+    ET.SubElement(device, 'position', x="%.1f" % x, y="%.1f" % y)
+    services = ET.SubElement(device, 'services')
+    ET.SubElement(services, 'service', name="DefaultRoute")
+
+  for uav in config['uavs']:
+    AddDevice(uav['id'], "grey_plane.png", uav['x'], uav['y'])
+  for target_id, target in config['targets'].items():
+    AddDevice(int(target_id), "grey_dot.png", target['x'], target['y'])
+
+  links = ET.SubElement(scenario, 'links')
+  for i, uav in enumerate(config['uavs']):
+    link = ET.SubElement(links, 'link', node1=str(config['wlan']), node2=str(uav['id']))
+    ET.SubElement(link, 'iface2', id="0", name="eth0", ip4=Ip4(i), ip4_mask="16")
+
+  mobility = ET.SubElement(ET.SubElement(scenario, 'mobility_configurations'), 'mobility_configuration',
+                           node=str(config['wlan']), model="basic_range")
+  link = config['link']
+  for name, value in (('range', link['range']), ('bandwidth', 54000000), ('jitter', 0),
+                      ('delay', int(link['delay']*1000000)), ('error', link['error'])):
+    ET.SubElement(mobility, 'configuration', name=name, value=str(value))
+
+  hook = ["#!/bin/sh", "# session hook script; write commands here to execute on the host at the",
+          "# specified state", "", "# Set initial waypoints"]
+  for uav in config['uavs']:
+    hook.append("echo %d %d > /tmp/n%d_orig_wypt.txt" % (uav['wypt'][0], uav['wypt'][1], uav['id']))
+  hook += ["", "# Set multicast routes"]
+  for uav in config['uavs']:
+    hook.append("vcmd -c /tmp/pycore.*/n%d -- /sbin/ip route add 224.0.0.0/4 dev eth0" % uav['id'])
+  hook += ["", "sleep 5", "", "# Start mobility scripts"]
+  for uav in config['uavs']:
+    hook.append("vcmd -c /tmp/pycore.*/n%d -- core-python -u %s %d %d %d %d %d %d -x %s > /tmp/move_n%d.log 2>&1 &"
+                % (uav['id'], movepath, uav['id'], uav['x'], uav['y'], uav['rad'], uav['speed'],
+                   uav['duration'], configpath, uav['id']))
+  hooks = ET.SubElement(scenario, 'session_hooks')
+  ET.SubElement(hooks, 'hook', name="runtime_hook.sh", state="4").text = "\n".join(hook)
+
+  options = ET.SubElement(scenario, 'session_options')
+  ET.SubElement(options, 'configuration', name="controlnet", value="172.16.0.0/24")
+
+  ET.indent(scenario, space="  ")
+  return "<?xml version='1.0' encoding='UTF-8'?>\n" + ET.tostring(scenario, encoding='unicode') + "\n"
+
+
+#---------------
+# Launch script for the trackers, like start_tracking_grpc.sh
+#---------------
+def MakeLaunchScript(config):
+  lines = ["#!/bin/bash", "", "coredir=$(ls /tmp | grep pycore)",
+           'filedir="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"', "",
+           "pkill -f track_target_grpc.py", ""]
+  for uav in config['uavs']:
+    lines.append("vcmd -c /tmp/$coredir/n%d -- core-python -u $filedir/track_target_grpc.py -my %d -i %d "
+                 "-c %d -r %d -p $1 > /tmp/track_n%d.log 2>&1 &"
+                 % (uav['id'], uav['id'], config['interval'], config['covered_zone'],
+                    config['track_range'], uav['id']))
+  return "\n".join(lines) + "\n"
+
+
+def WriteScenario(config, outdir, name):
+  paths = (os.path.join(outdir, name + ".xml"), os.path.join(outdir, name + ".json"),
+           os.path.join(outdir, "start_tracking_" + name + ".sh"))
+  with open(paths[0], 'w') as f:
+    f.write(MakeScenarioXml(config, os.path.abspath(paths[1])))
+  with open(paths[1], 'w') as f:
+    json.dump(config, f, indent=2)
+  with open(paths[2], 'w') as f:
+    f.write(MakeLaunchScript(config))
+  os.chmod(paths[2], 0o755)
+  return paths
+
+
+#---------------
+# main
+#---------------
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n','--uavs', dest = 'uavs', metavar='uavs',
+                      type=int, default = '8', help='Number of UAVs')
+  parser.add_argument('-t','--targets', dest = 'targets', metavar='targets',
+                      type=int, default = None, help='Number of targets (default: one per UAV)')
+  parser.add_argument('-o','--outdir', dest = 'outdir', metavar='output dir',
+                      type=str, default = '.', help='Output directory')
+  parser.add_argument('-i','--update_interval', dest = 'interval', metavar='update interval',
+                      type=int, default = '500', help='Tracker update interval (msec)')
+  args = parser.parse_args()
+
+  targets = args.targets
+  if targets is None:
+    targets = args.uavs
+  config = MakeConfig(args.uavs, targets, interval=args.interval)
+  name = "uav%d-target%d" % (args.uavs, targets)
+  for path in WriteScenario(config, args.outdir, name):
+    print("Wrote %s" % path)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+# When the tracker should next run TrackTargets. Ticks are due on a
+# monotonic deadline measured from the start of the previous tick, so
+# the time a tick takes does not stretch the period. An advert or
+# position event that needs a quick answer triggers an early tick, no
+# sooner than min_gap after the last one. While the assignment holds
+# and the tracked target moves slowly the interval grows towards
+# max_interval, and falls back to the base interval on any change.
+
+import time
+import threading
+
+import metrics
+
+# Growth of the interval per settled tick
+STRETCH = 1.5
+
+# Target speed (CORE units per second) below which it counts as slow
+SLOW_SPEED = 10.0
+
+
+class TickScheduler():
+  def __init__(self, interval, max_interval=None, min_gap=None,
+               slow_speed=SLOW_SPEED, clock=time.monotonic):
+    self.interval = interval
+    self.max_interval = max(max_interval or interval, interval)
+    self.min_gap = min_gap if min_gap is not None else interval/4
+    self.slow_speed = slow_speed
+    self.clock = clock
+    self.current = interval
+    self.last = None
+    self.deadline = clock() + interval
+    self.triggered = False
+    self.triggers = 0
+    self.cond = threading.Condition()
+    # Called with the new due time when a trigger moves the next tick
+    # earlier, for loops that do not block in wait()
+    self.wake = None
+
+  # Start time of the next tick
+  def due(self):
+    if self.triggered and self.last is not None:
+      return min(self.deadline, self.last + self.min_gap)
+    return self.deadline
+
+  # Ask for an early tick
+  def trigger(self):
+    with self.cond:
+      if self.triggered:
+        return
+      self.triggered = True
+      self.triggers += 1
+      self.cond.notify()
+      due = self.due()
+    if self.wake is not None:
+      self.wake(due)
+
+  # Block until the next tick is due, then start it
+  def wait(self):
+    with self.cond:
+      while 1:
+        delay = self.due() - self.clock()
+        if delay <= 0:
+          break
+        self.cond.wait(delay)
+    self.start()
+
+  def start(self):
+    with self.cond:
+      self.last = self.clock()
+      self.triggered = False
+
+  # The tick that started at self.last is done. Returns the next deadline.
+  def ticked(self, settled):
+    with self.cond:
+      if settled:
+        self.current = min(self.current*STRETCH, self.max_interval)
+      else:
+        self.current = self.interval
+      self.deadline = self.last + self.current
+      # After an overrun start the next tick now, without catching up
+      self.deadline = max(self.deadline, self.clock())
+      return self.deadline
+
+
+#---------------
+# Fixed-rate timing for the mover loops. Steps are due every period on
+# a monotonic deadline, and each step is given the time that actually
+# passed since the previous one, so a vehicle covers speed*time however
+# long its steps take. Deadlines an overrun missed are counted and
+# skipped rather than run back to back; a step never covers more than
+# max_step, so a stalled process does not jump its vehicles.
+#---------------
+class FixedRate():
+  def __init__(self, period, max_step=None, clock=time.monotonic, sleep=time.sleep):
+    self.period = period
+    self.max_step = max_step if max_step is not None else 4*period
+    self.clock = clock
+    self.sleep = sleep
+    self.last = clock()
+    self.deadline = self.last + period
+    self.steps = 0
+    self.overruns = 0
+
+  # Sleep until the next step is due; returns the seconds it covers
+  def wait(self):
+    delay = self.deadline - self.clock()
+    if delay > 0:
+      self.sleep(delay)
+    now = self.clock()
+    self.deadline += self.period
+    if self.deadline <= now:
+      missed = int((now - self.deadline)/self.period) + 1
+      self.deadline += missed*self.period
+      self.overruns += missed
+      metrics.Inc('step_overruns', missed)
+    elapsed = now - self.last
+    self.last = now
+    self.steps += 1
+    return min(elapsed, self.max_step)
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+
+# Uniform grid over target positions for range queries. Targets are
+# bucketed by cell and moved between buckets as their positions change,
+# so finding the targets near a UAV only looks at the cells its range
+# overlaps instead of every target in the scenario.
+
+import math
+
+# Cell side (CORE units); a few cells per track range
+CELL = 200.0
+
+
+#---------------
+# Target positions bucketed by grid cell
+#---------------
+class TargetGrid():
+  def __init__(self, cell=CELL):
+    self.cell = cell
+    self.cells = dict()
+    self.where = dict()
+
+  def key(self, x, y):
+    return int(math.floor(x/self.cell)), int(math.floor(y/self.cell))
+
+  def __len__(self):
+    return len(self.where)
+
+  def __contains__(self, node_id):
+    return node_id in self.where
+
+  # Add a target or update its position
+  def move(self, node_id, x, y):
+    key = self.key(x, y)
+    old = self.where.get(node_id)
+    if old is not None and old[2] != key:
+      bucket = self.cells[old[2]]
+      del bucket[node_id]
+      if not bucket:
+        del self.cells[old[2]]
+    self.where[node_id] = (x, y, key)
+    self.cells.setdefault(key, dict())[node_id] = (x, y)
+
+  def remove(self, node_id):
+    old = self.where.pop(node_id, None)
+    if old is None:
+      return
+    bucket = self.cells[old[2]]
+    del bucket[node_id]
+    if not bucket:
+      del self.cells[old[2]]
+
+  # Targets in the cells overlapping a square around cell key
+  def candidates(self, key, reach):
+    cx, cy = key
+    found = []
+    for i in range(cx - reach, cx + reach + 1):
+      for j in range(cy - reach, cy + reach + 1):
+        bucket = self.cells.get((i, j))
+        if bucket:
+          found.extend(bucket.items())
+    return found
+
+  # (distance, id) of the targets within radius of (x, y) and no
+  # further right than max_x, nearest first
+  def query(self, x, y, radius, max_x=None):
+    reach = int(math.ceil(radius/self.cell))
+    return self.select(self.candidates(self.key(x, y), reach), x, y, radius, max_x)
+
+  @staticmethod
+  def select(found, x, y, radius, max_x):
+    near = []
+    for node_id, (tx, ty) in found:
+      if max_x is not None and tx > max_x:
+        continue
+      d = math.hypot(tx - x, ty - y)
+      if d <= radius:
+        near.append((d, node_id))
+    near.sort()
+    return near
+
+
+#---------------
+# Grid of a set of targets kept in step with a position source. The
+# grid is reloaded once per new snapshot rather than once per query;
+# with an event stream, moved() keeps it current between snapshots.
+#---------------
+class TargetIndex():
+  def __init__(self, positions, target_ids, cell=CELL):
+    self.positions = positions
+    self.target_ids = set(target_ids)
+    self.grid = TargetGrid(cell)
+    self.stamp = None
+    self.reloads = 0
+
+  def sync(self):
+    self.positions.update()
+    stamp = self.positions.stamp
+    if stamp == self.stamp:
+      return
+    self.stamp = stamp
+    self.reloads += 1
+    for node_id in self.target_ids:
+      x, y = self.positions.getPosition(node_id)
+      self.grid.move(node_id, x, y)
+
+  # Position event listener (NodeCache.listener)
+  def moved(self, node_id, x, y):
+    if node_id in self.target_ids:
+      self.grid.move(node_id, x, y)
+
+  def query(self, x, y, radius, max_x=None):
+    self.sync()
+    return self.grid.query(x, y, radius, max_x)
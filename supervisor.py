@@ -0,0 +1,342 @@
+#!/usr/bin/python
+
+# Host the trackers of a whole swarm in a few processes instead of one
+# core-python process per UAV. The supervisor looks up the CORE session
+# once and starts a small pool of workers, each hosting a share of the
+# UAVs. A worker has one gRPC channel and one position snapshot for all
+# its agents and runs every agent's ticks and received adverts on a
+# single thread. Each agent's multicast sockets are created inside its
+# node's network namespace, so adverts still go over the emulated wlan.
+# An agent whose tick fails is reloaded on its own, and a worker that
+# dies is started again.
+#
+# Agents reach their movers over shared memory (track_target_grpc.py
+# -m shm), since each mover's XML-RPC port is only reachable inside its
+# node. Entering the namespaces needs root, like vcmd.
+
+import os
+import sys
+import glob
+import time
+import heapq
+import ctypes
+import argparse
+import selectors
+import traceback
+import contextlib
+import multiprocessing
+import multiprocessing.connection
+
+from core.api.grpc import client
+
+import metrics
+import scenario_gen
+from agent_loader import LoadAgent
+from advert import McastSender
+from advert import McastReceiver
+from reliable import ReliableSender
+from node_positions import PositionSnapshot
+from scheduler import TickScheduler
+from trickle import REDUNDANCY
+from uav_ipc import IpcMover
+from geocast import GeoGroups
+import track_target_grpc as tracker
+
+CLONE_NEWNET = 0x40000000
+
+# Shortest time between restarts of a worker process (seconds)
+RESTART_DELAY = 1.0
+
+
+#---------------
+# Switch the calling thread to the network namespace open on fd
+#---------------
+def SetNetns(fd):
+  if hasattr(os, 'setns'):
+    os.setns(fd, CLONE_NEWNET)
+    return
+  libc = ctypes.CDLL(None, use_errno=True)
+  if libc.setns(fd, CLONE_NEWNET) != 0:
+    errno = ctypes.get_errno()
+    raise OSError(errno, os.strerror(errno))
+
+#---------------
+# Run the body inside the network namespace of CORE node n<node_id>,
+# found through the pid of its vnoded
+#---------------
+@contextlib.contextmanager
+def NodeNetns(nodepath, node_id):
+  with open(os.path.join(nodepath, "n%d.pid" % node_id)) as f:
+    pid = int(f.read().strip())
+  own = os.open("/proc/thread-self/ns/net", os.O_RDONLY)
+  node = os.open("/proc/%d/ns/net" % pid, os.O_RDONLY)
+  try:
+    SetNetns(node)
+    try:
+      yield
+    finally:
+      SetNetns(own)
+  finally:
+    os.close(node)
+    os.close(own)
+
+
+#---------------
+# Worker settings shared by all its agents
+#---------------
+class Options():
+  def __init__(self, protocol, interval, covered_zone, track_range, snapshot_age=0.25,
+               max_interval=None, redundancy=REDUNDANCY, gossip=0, peer_ttl=3.0,
+               quiet=True, netns=True, geo_cell=0, cluster_cell=1200):
+    self.protocol = protocol
+    self.interval = interval
+    self.covered_zone = covered_zone
+    self.track_range = track_range
+    self.snapshot_age = snapshot_age
+    self.max_interval = max_interval
+    self.redundancy = redundancy
+    self.gossip = gossip
+    self.peer_ttl = peer_ttl
+    self.quiet = quiet
+    self.netns = netns
+    self.geo_cell = geo_cell
+    self.cluster_cell = cluster_cell
+
+
+#---------------
+# One tracker hosted by a worker. The sockets outlive the tracker module,
+# so a restarted agent keeps its namespace, its advert sequence and its
+# group memberships.
+#---------------
+class HostedAgent():
+  def __init__(self, worker, node_id):
+    self.worker = worker
+    self.node_id = node_id
+    self.module = None
+    self.due = None
+    self.restarts = 0
+    self.receiver = None
+    self.sender = None
+    self.geo_groups = None
+
+    options = worker.options
+    if options.protocol in tracker.comms_protocols:
+      with self.netns():
+        if options.protocol == "nack":
+          self.sender = ReliableSender(tracker.mcastaddr, tracker.port, tracker.ttl)
+        else:
+          self.sender = McastSender(tracker.mcastaddr, tracker.port, tracker.ttl)
+        self.receiver = McastReceiver(None if options.geo_cell else tracker.mcastaddr, tracker.port)
+      self.receiver.sk.setblocking(False)
+      if options.geo_cell:
+        self.geo_groups = GeoGroups(self.receiver, options.geo_cell, 2*options.track_range)
+
+  def netns(self):
+    if not self.worker.options.netns:
+      return contextlib.nullcontext()
+    return NodeNetns(self.worker.nodepath, self.node_id)
+
+  # Load a fresh copy of the tracker and set it up the way its main() would
+  def start(self):
+    options = self.worker.options
+    agent = LoadAgent("track_agent_%d_%d" % (self.node_id, self.restarts))
+    agent.protocol = options.protocol
+    agent.quiet = options.quiet
+    agent.peer_ttl = options.peer_ttl
+    agent.tracking_range = options.track_range
+    agent.redundancy = options.redundancy
+    agent.gossip = options.gossip
+    agent.core = self.worker.core
+    agent.session_id = self.worker.session_id
+    agent.positions = self.worker.positions
+    agent.nodepath = self.worker.nodepath
+    agent.mover = metrics.TimedProxy(IpcMover(self.node_id), 'shm_seconds')
+    agent.sender = self.sender
+    agent.receiver = self.receiver
+    agent.geo_cell = options.geo_cell
+    agent.geo_groups = self.geo_groups
+    agent.cluster_cell = options.cluster_cell
+    agent.scheduler = TickScheduler(options.interval, options.max_interval)
+    agent.scheduler.wake = lambda due: self.worker.schedule(self, due)
+    agent.InitAgent(self.node_id, options.interval)
+    self.module = agent
+    self.worker.schedule(self, agent.scheduler.due())
+
+  def restart(self):
+    print("Agent %d failed, restarting" % self.node_id)
+    traceback.print_exc()
+    metrics.Inc('agent_restarts')
+    self.restarts += 1
+    self.due = None
+    self.start()
+
+  def tick(self):
+    agent = self.module
+    try:
+      agent.scheduler.start()
+      with metrics.Timed('tick_seconds'):
+        agent.TrackTargets(self.worker.options.covered_zone, self.worker.options.track_range)
+      self.worker.schedule(self, agent.scheduler.ticked(agent.Settled()))
+    except Exception:
+      self.restart()
+
+  # Apply every advert waiting on our socket
+  def receive(self):
+    while 1:
+      try:
+        buf, nbytes = self.receiver.recv()
+      except BlockingIOError:
+        return
+      try:
+        self.module.HandleAdvert(buf, nbytes)
+      except Exception:
+        self.restart()
+
+
+#---------------
+# The agents of one process, run from a single thread: ticks in order
+# of their due times, adverts as they arrive in between
+#---------------
+class Worker():
+  def __init__(self, address, session_id, nodepath, node_ids, options):
+    self.options = options
+    self.session_id = session_id
+    self.nodepath = nodepath
+
+    # One channel and one snapshot for all agents of this process
+    core = client.CoreGrpcClient(address)
+    core.connect()
+    self.core = metrics.TimedProxy(core, 'grpc_seconds')
+    self.positions = PositionSnapshot(self.core, session_id, options.snapshot_age)
+
+    self.due = []
+    self.count = 0
+    self.selector = selectors.DefaultSelector()
+    self.agents = []
+    for node_id in node_ids:
+      agent = HostedAgent(self, node_id)
+      if agent.receiver is not None:
+        self.selector.register(agent.receiver.sk, selectors.EVENT_READ, agent)
+      self.agents.append(agent)
+    for agent in self.agents:
+      agent.start()
+
+  # Run agent's next tick at due, replacing the one it had scheduled if
+  # that was later
+  def schedule(self, agent, due):
+    if agent.due is not None and agent.due <= due:
+      return
+    agent.due = due
+    self.count += 1
+    heapq.heappush(self.due, (due, self.count, agent))
+
+  def run(self):
+    while 1:
+      now = time.monotonic()
+      while self.due and self.due[0][0] <= now:
+        due, count, agent = heapq.heappop(self.due)
+        if due != agent.due:
+          continue      # Replaced by an earlier tick
+        agent.due = None
+        agent.tick()
+      timeout = self.due[0][0] - time.monotonic() if self.due else None
+      if timeout is not None and timeout < 0:
+        timeout = 0
+      for key, events in self.selector.select(timeout):
+        key.data.receive()
+
+
+def RunWorker(address, session_id, nodepath, node_ids, options):
+  Worker(address, session_id, nodepath, node_ids, options).run()
+
+
+#---------------
+# Keep the worker processes running, restarting any that exit
+#---------------
+def Supervise(address, session_id, nodepath, shares, options):
+  context = multiprocessing.get_context('fork')
+  workers = dict()
+  started = dict()
+
+  def Start(index):
+    process = context.Process(target=RunWorker, name="tracker-worker-%d" % index,
+                              args=(address, session_id, nodepath, shares[index], options))
+    process.start()
+    workers[process.sentinel] = (index, process)
+    started[index] = time.monotonic()
+    print("Worker %d (pid %d) hosts UAVs %s" % (index, process.pid, shares[index]))
+
+  for index in range(len(shares)):
+    Start(index)
+  while 1:
+    for sentinel in multiprocessing.connection.wait(list(workers)):
+      index, process = workers.pop(sentinel)
+      process.join()
+      print("Worker %d exited with %s, restarting" % (index, process.exitcode))
+      delay = started[index] + RESTART_DELAY - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+      Start(index)
+
+
+#---------------
+# main
+#---------------
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('config', help='Swarm config from scenario_gen.py')
+  parser.add_argument('-p','--protocol', dest = 'protocol', metavar='comms protocol',
+                      type=str, default = 'none', help='Comms Protocol (none, udp, nack, auction, trickle, cluster)')
+  parser.add_argument('-w','--workers', dest = 'workers', metavar='workers',
+                      type=int, default = '1', help='Worker processes (0 to host every agent in this one)')
+  parser.add_argument('-s','--snapshot-age', dest = 'snapshot_age', metavar='snapshot age',
+                      type=int, default = '250', help='Max age of the node position snapshot (msec)')
+  parser.add_argument('-I','--max-interval', dest = 'max_interval', metavar='max interval',
+                      type=int, default = '0', help='Longest update interval while assignments are settled (msec)')
+  parser.add_argument('-k','--redundancy', dest = 'redundancy', metavar='redundancy',
+                      type=int, default = REDUNDANCY, help='Trickle: skip our advert after this many consistent ones (0 never skips)')
+  parser.add_argument('-g','--gossip', dest = 'gossip', metavar='claims',
+                      type=int, default = '0', help='Add up to this many recently heard claims to each advert')
+  parser.add_argument('-t','--peer-ttl', dest = 'peer_ttl', metavar='peer ttl',
+                      type=int, default = '3000', help='Forget peers not heard from for this long (msec, 0 for never)')
+  parser.add_argument('-G','--geo-cell', dest = 'geo_cell', metavar='cell size',
+                      type=int, default = '0', help='Per-cell multicast groups (see track_target_grpc.py -G)')
+  parser.add_argument('-C','--cluster-cell', dest = 'cluster_cell', metavar='cell size',
+                      type=int, default = '1200', help='Cluster protocol cell size (see track_target_grpc.py -C)')
+  parser.add_argument('-N','--no-netns', dest = 'netns', action='store_false',
+                      help='Create agent sockets in our own network namespace (runs outside CORE)')
+  parser.add_argument('-v','--verbose', dest = 'quiet', action='store_false',
+                      help='Show tracker output')
+  parser.add_argument('-M','--metrics-port', dest = 'metrics_port', metavar='metrics port',
+                      type=int, default = '0', help='Serve metrics on this local port (0 for none; in-process agents only)')
+  args = parser.parse_args()
+
+  config = scenario_gen.LoadConfig(args.config)
+  options = Options(args.protocol, config['interval']/1000, config['covered_zone'], config['track_range'],
+                    args.snapshot_age/1000, args.max_interval/1000, args.redundancy, args.gossip,
+                    args.peer_ttl/1000 if args.peer_ttl > 0 else None, args.quiet, args.netns,
+                    args.geo_cell, args.cluster_cell)
+
+  # The session and its directory are looked up once for every agent
+  address = "172.16.0.254:50051"
+  core = client.CoreGrpcClient(address)
+  core.connect()
+  response = core.get_sessions()
+  if not response.sessions:
+    raise ValueError("no current core sessions")
+  session_id = int(response.sessions[0].id)
+  core.close()
+  nodepath = glob.glob("/tmp/pycore.*/")[0]
+
+  node_ids = [uav['id'] for uav in config['uavs']]
+  if args.workers <= 0:
+    if args.metrics_port:
+      metrics.ServeMetrics(args.metrics_port)
+    RunWorker(address, session_id, nodepath, node_ids, options)
+    return
+  shares = [node_ids[i::args.workers] for i in range(min(args.workers, len(node_ids)))]
+  Supervise(address, session_id, nodepath, shares, options)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,487 @@
+#!/usr/bin/python
+
+# Run the swarm headless: N trackers and movers in one process against
+# the fake CORE client and an in-memory multicast bus that models the
+# scenario's wlan (range, delay, loss). Simulated time is used
+# throughout, so runs are repeatable and faster than real time.
+
+import os
+import re
+import sys
+import math
+import time
+import heapq
+import random
+import argparse
+import contextlib
+import xml.etree.ElementTree as ET
+
+import fake_core
+import scenario_gen
+from agent_loader import LoadAgent
+from record import Recorder
+from record import RecordingPositions
+from record import RecordingMover
+from scheduler import TickScheduler
+from motion import PredictedPositions
+from spatial import TargetIndex
+from warmstate import WarmState
+
+scriptdir = os.path.dirname(os.path.realpath(__file__))
+default_scenario = os.path.join(scriptdir, "uav8-notrack-new-gui.xml")
+
+colors = ['blue', 'yellow', 'green', 'red', 'lime', 'orange', 'pink', 'purple', 'lavender', 'cyan']
+
+
+#---------------
+# Wireless link parameters of the wlan
+#---------------
+class LinkModel():
+  def __init__(self, linkrange=1100, delay=0.2, error=20):
+    self.linkrange = linkrange
+    self.delay = delay
+    self.error = error
+
+
+#---------------
+# UAVs, targets and link parameters read from a CORE scenario file.
+# UAV start positions, radius, speed and step come from the move_node
+# lines in the runtime hook, and original waypoints from its echo lines.
+#---------------
+class Scenario():
+  def __init__(self):
+    self.link = LinkModel()
+    self.uavs = []
+    self.wypts = dict()
+    self.targets = dict()
+    self.colors = dict()
+
+  # Scenario from a swarm config made by scenario_gen.py
+  @staticmethod
+  def FromConfig(config):
+    scenario = Scenario()
+    link = config['link']
+    scenario.link = LinkModel(link['range'], link['delay'], link['error'])
+    for uav in config['uavs']:
+      scenario.uavs.append((uav['id'], uav['x'], uav['y'], uav['rad'], uav['speed'], uav['duration']/1000))
+    scenario.wypts = scenario_gen.ConfigWaypoints(config)
+    scenario.colors = scenario_gen.ConfigTargets(config)
+    for target_id, target in config['targets'].items():
+      scenario.targets[int(target_id)] = (target['x'], target['y'])
+    return scenario
+
+  @staticmethod
+  def Load(path=default_scenario):
+    if path.endswith('.json'):
+      return Scenario.FromConfig(scenario_gen.LoadConfig(path))
+    scenario = Scenario()
+    root = ET.parse(path).getroot()
+
+    for config in root.iter('configuration'):
+      name, value = config.get('name'), config.get('value')
+      if name == 'range':
+        scenario.link.linkrange = float(value)
+      elif name == 'delay':
+        scenario.link.delay = float(value)/1000000
+      elif name == 'error':
+        scenario.link.error = float(value)
+
+    for device in root.iter('device'):
+      if device.get('icon', '').endswith('_dot.png'):
+        position = device.find('position')
+        scenario.targets[int(device.get('id'))] = (float(position.get('x')), float(position.get('y')))
+
+    for hook in root.iter('hook'):
+      for line in hook.text.splitlines():
+        match = re.search(r'echo (\d+) (\d+) > /tmp/n(\d+)_orig_wypt', line)
+        if match:
+          scenario.wypts[int(match.group(3))] = (int(match.group(1)), int(match.group(2)))
+        match = re.search(r'move_node_grpc.py (\d+) (\d+) (\d+) (\d+) (\S+) (\S+)', line)
+        if match:
+          node_id, x, y, rad = [int(v) for v in match.groups()[:4]]
+          scenario.uavs.append((node_id, x, y, rad, float(match.group(5)), float(match.group(6))/1000))
+    return scenario
+
+
+#---------------
+# Sending end of a node on the bus. The sender sets group when it moves
+# to another multicast group; None reaches every attached node.
+#---------------
+class BusTransport():
+  def __init__(self, bus, node_id):
+    self.bus = bus
+    self.node_id = node_id
+    self.group = None
+
+  def __call__(self, data):
+    self.bus.send(self.node_id, data, self.group)
+
+
+#---------------
+# Group memberships of a node on the bus, like those of a McastReceiver
+#---------------
+class BusMembership():
+  def __init__(self, bus, node_id):
+    self.bus = bus
+    self.node_id = node_id
+
+  def join(self, group):
+    self.bus.groups.setdefault(group, set()).add(self.node_id)
+
+  def leave(self, group):
+    self.bus.groups[group].discard(self.node_id)
+
+
+#---------------
+# In-memory multicast. Each datagram reaches every other attached node
+# within range after the link delay, unless lost to the link error.
+# Datagrams sent to a group only reach the nodes that joined it.
+#---------------
+class McastBus():
+  def __init__(self, world, link, rng, clock):
+    self.world = world
+    self.link = link
+    self.rng = rng
+    self.clock = clock
+    self.endpoints = dict()
+    self.groups = dict()
+    self.queue = []
+    self.count = 0
+    self.sent = dict()
+    self.delivered = 0
+    self.dropped = 0
+
+  def attach(self, node_id, handler):
+    self.endpoints[node_id] = handler
+    self.sent[node_id] = 0
+
+  # Transport for the sender of node_id
+  def transport(self, node_id):
+    return BusTransport(self, node_id)
+
+  # Memberships of a freshly opened receiver of node_id
+  def membership(self, node_id):
+    for members in self.groups.values():
+      members.discard(node_id)
+    return BusMembership(self, node_id)
+
+  def send(self, src, data, group=None):
+    self.sent[src] += 1
+    now = self.clock()
+    srcpos = self.world.nodes[src].position
+    receivers = self.endpoints
+    if group is not None:
+      receivers = [dst for dst in self.groups.get(group, ()) if dst in self.endpoints]
+    for dst in receivers:
+      if dst == src:
+        continue
+      dstpos = self.world.nodes[dst].position
+      if math.hypot(dstpos.x - srcpos.x, dstpos.y - srcpos.y) > self.link.linkrange:
+        continue
+      if self.rng.random()*100 < self.link.error:
+        self.dropped += 1
+        continue
+      self.count += 1
+      heapq.heappush(self.queue, (now + self.link.delay, self.count, dst, data))
+
+  # Hand over every datagram due by the given time
+  def deliver(self, until):
+    while self.queue and self.queue[0][0] <= until:
+      due, count, dst, data = heapq.heappop(self.queue)
+      self.delivered += 1
+      self.endpoints[dst](memoryview(data), len(data))
+
+  def nextDue(self):
+    if self.queue:
+      return self.queue[0][0]
+    return None
+
+
+#---------------
+# N trackers and movers driven by one simulated clock
+#---------------
+class SwarmHarness():
+  def __init__(self, scenario=None, protocol='udp', interval=0.5, covered_zone=1200,
+               track_range=600, seed=0, targets=None, quiet=True, record=None, max_interval=None,
+               gossip=0, predict=0, warm=None, geo_cell=0, cluster_cell=1200):
+    if scenario is None:
+      scenario = Scenario.Load()
+    self.scenario = scenario
+    self.protocol = protocol
+    self.interval = interval
+    self.covered_zone = covered_zone
+    self.track_range = track_range
+    self.quiet = quiet
+    # Where agent output goes in quiet runs, opened once for every call
+    self.devnull = open(os.devnull, 'w') if quiet else None
+    self.record = record
+    self.max_interval = max_interval
+    self.gossip = gossip
+    self.predict = predict
+    self.warm = warm
+    self.geo_cell = geo_cell
+    self.cluster_cell = cluster_cell
+    self.speeds = dict()
+    self.tick_due = dict()
+    self.tick_generation = dict()
+    self.recorders = []
+    self.rng = random.Random(seed)
+    self.now = 0.0
+    self.events = []
+    self.count = 0
+    self.ticks = 0
+    self.cpu = 0.0
+    self.assignments = dict()
+    self.last_change = 0.0
+
+    self.world = fake_core.FakeWorld()
+    fake_core.InstallFakeCore(self.world)
+
+    # Imported only once the fake client is in place
+    import move_node_grpc
+    from node_positions import PositionSnapshot
+    self.move_node = move_node_grpc
+
+    self.core = fake_core.FakeCoreClient(self.world)
+    self.session_id = self.world.session_id
+    self.bus = McastBus(self.world, scenario.link, self.rng, self.clock)
+
+    if targets is None:
+      targets = scenario.targets
+    move_node_grpc.targets = dict()
+    for i, (target_id, (x, y)) in enumerate(sorted(targets.items())):
+      self.world.addNode(target_id, x, y)
+      move_node_grpc.targets[target_id] = scenario.colors.get(target_id, colors[i % len(colors)])
+
+    # All movers share one grid over the target positions
+    positions = PositionSnapshot(self.core, self.session_id, 0.25, self.clock)
+    if predict > 0:
+      positions = PredictedPositions(positions, predict, clock=self.clock)
+    self.index = TargetIndex(positions, move_node_grpc.targets)
+
+    self.movers = dict()
+    self.agents = dict()
+    for node_id, x, y, rad, speed, duration in scenario.uavs:
+      self.world.addNode(node_id, x, y)
+      wypt = scenario.wypts.get(node_id, (x, y))
+      self.speeds[node_id] = speed
+      mover = move_node_grpc.CoreUav(self.core, self.session_id, node_id, x, y, wypt[0], wypt[1],
+                                     positions, self.index)
+      self.movers[node_id] = mover
+      self.schedule(self.rng.random()*duration, self.moverStep, mover, rad, speed, duration)
+
+    with self.output():
+      for node_id in self.movers:
+        agent = self.addAgent(node_id)
+        self.scheduleTick(agent, self.rng.random()*interval)
+
+  # Set up one tracker the way its main() would
+  def addAgent(self, node_id):
+    from node_positions import PositionSnapshot
+    agent = LoadAgent("track_agent_%d" % node_id)
+    agent.protocol = self.protocol
+    agent.core = self.core
+    agent.session_id = self.session_id
+    agent.positions = PositionSnapshot(self.core, self.session_id, 0.25, self.clock)
+    if self.predict > 0:
+      agent.positions = PredictedPositions(agent.positions, self.predict, clock=self.clock,
+                                           own_id=node_id, own=self.movers[node_id].getPosition)
+      agent.uav_speed = self.speeds[node_id]
+    agent.mover = self.movers[node_id]
+    agent.transport = self.bus.transport(node_id)
+    if self.geo_cell:
+      agent.geo_cell = self.geo_cell
+      agent.receiver = self.bus.membership(node_id)
+    agent.clock = self.clock
+    agent.quiet = self.quiet
+    agent.tracking_range = self.track_range
+    agent.rng = random.Random(self.rng.random())
+    agent.gossip = self.gossip
+    agent.cluster_cell = self.cluster_cell
+    if self.record:
+      agent.recorder = Recorder("%s_n%d.rec" % (self.record, node_id),
+                                dict(uav_id=node_id, protocol=self.protocol, interval=self.interval,
+                                     covered_zone=self.covered_zone, track_range=self.track_range,
+                                     peer_ttl=agent.peer_ttl, redundancy=agent.redundancy,
+                                     gossip=self.gossip, cluster_cell=self.cluster_cell), self.clock)
+      agent.positions = RecordingPositions(agent.positions, agent.recorder)
+      agent.mover = RecordingMover(agent.mover, agent.recorder)
+      self.recorders.append(agent.recorder)
+    if self.warm:
+      agent.warm_state = WarmState("%s_n%d.state" % (self.warm, node_id), self.clock)
+    agent.scheduler = TickScheduler(self.interval, self.max_interval, clock=self.clock)
+    agent.scheduler.wake = lambda due: self.wakeAgent(agent, due)
+    agent.InitAgent(node_id, self.interval)
+    if self.protocol in agent.comms_protocols:
+      self.bus.attach(node_id, agent.HandleAdvert)
+    self.agents[node_id] = agent
+    return agent
+
+  # Replace an agent with a fresh copy, as when its process is
+  # restarted; with warm state it resumes from its last snapshot
+  def restartAgent(self, node_id):
+    with self.output():
+      agent = self.addAgent(node_id)
+    self.scheduleTick(agent, self.now + self.rng.random()*self.interval)
+    return agent
+
+  def clock(self):
+    return self.now
+
+  def output(self):
+    if self.quiet:
+      return contextlib.redirect_stdout(self.devnull)
+    return contextlib.nullcontext()
+
+  def schedule(self, delay, action, *args):
+    self.count += 1
+    heapq.heappush(self.events, (self.now + delay, self.count, action, args))
+
+  # Same step as move_node's main loop
+  def moverStep(self, mover, rad, speed, duration):
+    xuav, yuav = mover.getPosition()
+    xtrgt, ytrgt = mover.getWypt()
+    xuav, yuav = self.move_node.MoveVehicle(xuav, yuav, xtrgt, ytrgt, rad, speed, duration)
+    pos = fake_core.Position(xuav, yuav)
+    self.core.edit_node(session_id=self.session_id, node_id=mover.node_id, position=pos)
+    mover.setPosition(xuav, yuav)
+    self.schedule(duration, self.moverStep, mover, rad, speed, duration)
+
+  # Tick an agent at the given time, replacing any tick it had scheduled
+  def scheduleTick(self, agent, when):
+    node_id = agent.uavs[agent.mynodeseq].nodeid
+    self.tick_due[node_id] = when
+    self.tick_generation[node_id] = self.tick_generation.get(node_id, 0) + 1
+    self.schedule(when - self.now, self.trackerTick, agent, self.tick_generation[node_id])
+
+  # A trigger moved the agent's next tick earlier
+  def wakeAgent(self, agent, due):
+    if due < self.tick_due[agent.uavs[agent.mynodeseq].nodeid]:
+      self.scheduleTick(agent, max(due, self.now))
+
+  def trackerTick(self, agent, generation):
+    if generation != self.tick_generation[agent.uavs[agent.mynodeseq].nodeid]:
+      return
+    start = time.process_time()
+    agent.scheduler.start()
+    agent.TrackTargets(self.covered_zone, self.track_range)
+    deadline = agent.scheduler.ticked(agent.Settled())
+    self.cpu += time.process_time() - start
+    self.ticks += 1
+    node_id = agent.uavs[agent.mynodeseq].nodeid
+    target = self.movers[node_id].getTarget()
+    if self.assignments.get(node_id) != target:
+      self.assignments[node_id] = target
+      self.last_change = self.now
+    self.scheduleTick(agent, deadline)
+
+  def moveTarget(self, target_id, x, y):
+    self.world.moveNode(target_id, x, y)
+
+  # Advance simulated time by the given number of seconds
+  def run(self, seconds):
+    end = self.now + seconds
+    with self.output():
+      while self.events and self.events[0][0] <= end:
+        due = self.events[0][0]
+        self.bus.deliver(due)
+        due, count, action, args = heapq.heappop(self.events)
+        self.now = due
+        action(*args)
+      self.bus.deliver(end)
+      self.now = end
+
+  # Finish writing any recordings
+  def close(self):
+    for recorder in self.recorders:
+      recorder.close()
+    if self.devnull is not None:
+      self.devnull.close()
+      self.devnull = None
+
+  # Targets claimed by more than one UAV
+  def duplicates(self):
+    claimed = [t for t in self.assignments.values() if t != -1]
+    return len(claimed) - len(set(claimed))
+
+  def summary(self):
+    tracked = len([t for t in self.assignments.values() if t != -1])
+    sent = sum(self.bus.sent.values())
+    return {
+      'uavs': len(self.movers),
+      'targets': len(self.move_node.targets),
+      'tracked': tracked,
+      'duplicates': self.duplicates(),
+      'converged_at': self.last_change,
+      'msgs_per_uav_per_sec': sent / max(len(self.movers), 1) / max(self.now, 1e-9),
+      'delivered': self.bus.delivered,
+      'received_per_uav_per_sec': self.bus.delivered / max(len(self.movers), 1) / max(self.now, 1e-9),
+      'dropped': self.bus.dropped,
+      'grpc_calls_per_tick': sum(self.world.calls.values()) / max(self.ticks, 1),
+      'cpu_per_agent': self.cpu / max(len(self.movers), 1) / max(self.now, 1e-9),
+    }
+
+
+#---------------
+# main
+#---------------
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-x','--scenario', dest = 'scenario', metavar='scenario',
+                      type=str, default = default_scenario, help='CORE scenario file, or swarm config from scenario_gen.py')
+  parser.add_argument('-p','--protocol', dest = 'protocol', metavar='comms protocol',
+                      type=str, default = 'udp', help='Comms Protocol')
+  parser.add_argument('-i','--update_interval', dest = 'interval', metavar='update interval',
+                      type=int, default = '500', help='Update Inteval (msec)')
+  parser.add_argument('-t','--time', dest = 'seconds', metavar='seconds',
+                      type=float, default = '60', help='Simulated time to run')
+  parser.add_argument('-dx','--target-shift', dest = 'target_shift', metavar='target shift',
+                      type=float, default = None, help='Move targets this far left, into the covered zone '
+                      '(default 700 for scenario XML, 0 for swarm configs)')
+  parser.add_argument('--seed', dest = 'seed', type=int, default = '0', help='Random seed')
+  parser.add_argument('-v','--verbose', dest = 'verbose', action='store_true', help='Show tracker output')
+  parser.add_argument('-I','--max-interval', dest = 'max_interval', metavar='max interval',
+                      type=int, default = '0', help='Longest tracker interval while settled (msec)')
+  parser.add_argument('-g','--gossip', dest = 'gossip', metavar='claims',
+                      type=int, default = '0', help='Claims gossiped per advert')
+  parser.add_argument('-P','--predict', dest = 'predict', metavar='max sigma',
+                      type=float, default = '0', help='Predict target positions (see track_target_grpc.py -P)')
+  parser.add_argument('-R','--record', dest = 'record', metavar='record prefix',
+                      type=str, default = None, help='Record each tracker to <prefix>_nN.rec (see replay.py)')
+  parser.add_argument('-W','--warm-restart', dest = 'warm', metavar='state prefix',
+                      type=str, default = None, help='Keep warm restart state in <prefix>_nN.state')
+  parser.add_argument('-G','--geo-cell', dest = 'geo_cell', metavar='cell size',
+                      type=int, default = '0', help='Per-cell multicast groups (see track_target_grpc.py -G)')
+  parser.add_argument('-C','--cluster-cell', dest = 'cluster_cell', metavar='cell size',
+                      type=int, default = '1200', help='Cluster protocol cell size (see track_target_grpc.py -C)')
+  parser.add_argument('-r','--restart-at', dest = 'restart_at', metavar='seconds',
+                      type=float, default = None, help='Restart every tracker, one per tick interval, at this time')
+  args = parser.parse_args()
+
+  scenario = Scenario.Load(args.scenario)
+  if args.target_shift is None:
+    args.target_shift = 0 if args.scenario.endswith('.json') else 700
+  targets = dict()
+  for target_id, (x, y) in scenario.targets.items():
+    targets[target_id] = (x - args.target_shift, y)
+
+  harness = SwarmHarness(scenario, args.protocol, args.interval/1000, seed=args.seed,
+                         targets=targets, quiet=not args.verbose, record=args.record,
+                         max_interval=args.max_interval/1000, gossip=args.gossip,
+                         predict=args.predict, warm=args.warm, geo_cell=args.geo_cell,
+                         cluster_cell=args.cluster_cell)
+  if args.restart_at is not None and args.restart_at < args.seconds:
+    harness.run(args.restart_at)
+    for node_id in list(harness.movers):
+      harness.restartAgent(node_id)
+      harness.run(args.interval/1000)
+    harness.run(args.seconds - harness.now)
+  else:
+    harness.run(args.seconds)
+  harness.close()
+  for name, value in harness.summary().items():
+    print("%s: %s" % (name, value))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,11 @@
+# The scripts live at the top of the repo and import CORE's gRPC client,
+# so tests run them against the fake core used by swarm_sim.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_core
+
+fake_core.InstallFakeCore()
@@ -0,0 +1,76 @@
+from advert import ASSIGNMENT
+from advert import KIND_ADVERT
+from advert import KIND_ASSIGN
+from advert import KIND_BID
+from advert import KIND_NACK
+from advert import KIND_REPORT
+from advert import MAX_CLAIMS
+from advert import McastSender
+from advert import MessageKind
+from advert import ParseAdvert
+from advert import ParseCluster
+from advert import ParseDigest
+from advert import ParseNack
+from advert import REPORT_TARGET
+
+
+def MakeSender():
+  sent = []
+  return McastSender(None, 0, 0, transport=sent.append), sent
+
+
+def test_advert_round_trip():
+  sender, sent = MakeSender()
+  assert sender.send(3, 14, 148.5, 1) == 1
+  assert sender.send(3, 14, 150.0, 0, KIND_BID) == 2
+  data = sent[0]
+  assert MessageKind(data, len(data)) == KIND_ADVERT
+  kind, uav, seq, stamp, target, distance, mode = ParseAdvert(data, len(data))
+  assert (kind, uav, seq, target, distance, mode) == (KIND_ADVERT, 3, 1, 14, 148.5, 1)
+  assert stamp > 0
+  assert ParseDigest(data, len(data)) == []
+  assert ParseAdvert(sent[1], len(sent[1]))[0] == KIND_BID
+
+
+def test_digest_round_trip():
+  sender, sent = MakeSender()
+  claims = [(4, 12, 1, 80.0, 1000.5), (6, 16, 0, 250.0, 1001.25)]
+  sender.send(3, 14, 148.5, 1, digest=claims)
+  data = sent[0]
+  assert ParseAdvert(data, len(data))[4] == 14
+  assert ParseDigest(data, len(data)) == claims
+
+  # A digest is cut to what fits in one datagram
+  sender.send(3, 14, 148.5, 1, digest=[claims[0]]*(MAX_CLAIMS + 5))
+  assert len(ParseDigest(sent[1], len(sent[1]))) == MAX_CLAIMS
+
+
+def test_cluster_round_trip():
+  sender, sent = MakeSender()
+  sender.sendCluster(KIND_REPORT, 3, 14, 148.5, 1, (1, -2), REPORT_TARGET, [11, 14])
+  sender.sendCluster(KIND_ASSIGN, 1, -1, 0.0, 0, (1, -2), ASSIGNMENT, [(1, 11, 20.0), (3, 14, 148.5)])
+  report, assign = sent
+  assert MessageKind(report, len(report)) == KIND_REPORT
+  assert ParseCluster(report, len(report), REPORT_TARGET) == ((1, -2), [(11,), (14,)])
+  assert MessageKind(assign, len(assign)) == KIND_ASSIGN
+  assert ParseCluster(assign, len(assign), ASSIGNMENT) == ((1, -2), [(1, 11, 20.0), (3, 14, 148.5)])
+
+  # A truncated datagram yields the entries that arrived whole
+  assert ParseCluster(assign, len(assign) - 1, ASSIGNMENT) == ((1, -2), [(1, 11, 20.0)])
+
+
+def test_nack_round_trip():
+  sender, sent = MakeSender()
+  sender.sendNack(2, 3, 40, 4)
+  data = sent[0]
+  assert MessageKind(data, len(data)) == KIND_NACK
+  assert ParseNack(data, len(data)) == (2, 3, 40, 4)
+  assert ParseNack(data, len(data) - 1) is None
+
+
+def test_legacy_text_advert():
+  data = b"3 14 148.5 1"
+  assert MessageKind(data, len(data)) == KIND_ADVERT
+  assert ParseAdvert(data, len(data)) == (KIND_ADVERT, 3, 0, 0.0, 14, 148.5, 1)
+  assert ParseDigest(data, len(data)) == []
+  assert ParseAdvert(b"not an advert", 13) is None
@@ -0,0 +1,81 @@
+import itertools
+import random
+
+from auction import Auction
+from auction import NO_TARGET
+from auction import OPTIMALITY_GAP
+
+
+def RandomDistances(n, seed, value_range=600.0):
+  rng = random.Random(seed)
+  return [[rng.uniform(0, value_range) for t in range(n)] for u in range(n)]
+
+
+# Run an auction among n UAVs over n targets, every bid heard by every
+# UAV at the end of its round. Returns the rounds it took and the
+# assignment.
+def RunAuction(n, eps, seed=0, value_range=600.0, max_rounds=10000):
+  distances = RandomDistances(n, seed, value_range)
+  auctions = [Auction(u, value_range, eps) for u in range(n)]
+  for rounds in range(1, max_rounds + 1):
+    bids = [auction.round(list(range(n)), distances[u]) for u, auction in enumerate(auctions)]
+    for u, (target, price) in enumerate(bids):
+      for other in auctions:
+        if other.nodeid != u:
+          other.bid(u, target, price)
+    assigned = [auction.assigned for auction in auctions]
+    if NO_TARGET not in assigned and len(set(assigned)) == n:
+      return rounds, assigned
+  return max_rounds, None
+
+
+def test_scaled_increment_settles_in_few_rounds():
+  scaled = []
+  fixed = []
+  for seed in range(5):
+    rounds, assigned = RunAuction(16, None, seed)
+    assert assigned is not None
+    assert rounds <= 32
+    scaled.append(rounds)
+
+    # A unit increment against a value range of 600 takes longer
+    slow, assigned = RunAuction(16, 1.0, seed)
+    assert slow >= rounds
+    fixed.append(slow)
+  assert sum(scaled) < sum(fixed)
+
+
+def test_scaled_increment_is_near_optimal():
+  n = 6
+  for seed in range(5):
+    distances = RandomDistances(n, seed)
+    rounds, assigned = RunAuction(n, None, seed)
+    value = sum(600.0 - distances[u][t] for u, t in enumerate(assigned))
+    best = max(sum(600.0 - distances[u][t] for u, t in enumerate(order))
+               for order in itertools.permutations(range(n)))
+    assert value >= best - 600.0*OPTIMALITY_GAP
+
+
+def test_increment_shrinks_as_bidders_are_heard():
+  auction = Auction(1, 600.0)
+  assert auction.increment() == 600.0*OPTIMALITY_GAP
+  for bidder in range(2, 9):
+    auction.bid(bidder, bidder + 10, 100.0)
+  assert auction.increment() == 600.0*OPTIMALITY_GAP/8
+  assert Auction(1, 600.0, eps=1.0).increment() == 1.0
+
+
+def test_silent_bidder_releases_its_target():
+  auction = Auction(1, 600.0, ttl=3.0)
+  auction.bid(2, 12, 150.0, 0.0)
+  auction.bid(3, 14, 148.0, 0.0)
+  auction.bid(2, 12, 150.0, 2.5)
+  assert auction.expire(3.5) == [3]
+  assert 14 not in auction.holders
+  assert auction.price(14) == 0.0
+  assert 3 not in auction.holding
+  assert auction.holders[12] == 2
+
+  # The released target is ours for the taking
+  target, price = auction.round([12, 14], [100.0, 100.0])
+  assert target == 14
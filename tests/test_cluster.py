@@ -0,0 +1,50 @@
+import numpy as np
+
+from cluster import ClusterView
+from cluster import MISSES
+from cluster import NO_TARGET
+from swarm_sim import Scenario
+from swarm_sim import SwarmHarness
+
+
+def test_member_outlives_lost_refreshes():
+  view = ClusterView(1, 1200, 1.0)
+  view.report(1, (0, 0), [11], NO_TARGET, 0.0)
+  view.report(2, (0, 0), [12], 12, 0.0)
+  view.expire(MISSES - 0.5)
+  assert view.membersOf((0, 0)) == [1, 2]
+  view.expire(MISSES + 0.5)
+  assert view.membersOf((0, 0)) == [1]
+
+
+def test_assignment_without_us_keeps_ours():
+  view = ClusterView(2, 1200, 1.0)
+  view.report(1, (0, 0), [11], 11, 0.0)
+  view.report(2, (0, 0), [12], 12, 0.0)
+  assert view.heardAssign(1, (0, 0), [(1, 11, 10.0), (2, 12, 20.0)], 0.0)
+  assert not view.heardAssign(1, (0, 0), [(1, 11, 10.0)], 1.0)
+  assert view.assigned[1] == 12
+
+
+def test_idle_member_takes_a_target_another_can_give_up():
+  view = ClusterView(1, 1200, 1.0)
+  view.report(1, (0, 0), [11, 12], 11, 0.0)
+  view.report(2, (0, 0), [11], NO_TARGET, 0.0)
+  distances = np.array([[10.0, 50.0], [20.0, 600.0]])
+  assignment = view.solve([1, 2], [11, 12], distances)
+  assert assignment[1][0] == 12
+  assert assignment[2][0] == 11
+
+
+def test_static_scene_settles_under_loss():
+  scenario = Scenario.Load()
+  assert scenario.link.error == 20
+  targets = dict((target_id, (x - 700, y)) for target_id, (x, y) in scenario.targets.items())
+  for seed in range(3):
+    harness = SwarmHarness(scenario, 'cluster', 0.5, seed=seed, targets=targets)
+    harness.run(60)
+    summary = harness.summary()
+    harness.close()
+    assert summary['converged_at'] < 20
+    assert summary['tracked'] == len(targets)
+    assert summary['duplicates'] == 0
@@ -0,0 +1,75 @@
+import numpy as np
+
+import fake_core
+import move_node_grpc
+from mobility_engine import MobilityEngine
+from mobility_engine import MoveFleet
+from node_positions import PositionSnapshot
+from node_updates import NodeUpdater
+
+
+def MakeEngine():
+  world = fake_core.FakeWorld()
+  core = fake_core.FakeCoreClient(world)
+  for node_id, x, y in ((1, 0, 0), (2, 0, 500), (11, 50, 0)):
+    world.addNode(node_id, x, y)
+  move_node_grpc.targets = {11: 'blue'}
+  positions = PositionSnapshot(core, world.session_id)
+  return world, MobilityEngine(core, world.session_id, positions, NodeUpdater(core, world.session_id))
+
+
+def test_vehicles_have_their_own_rows():
+  world, engine = MakeEngine()
+  u1 = engine.addVehicle(1, 100, 100, (100, 100), 70, 40)
+  u2 = engine.addVehicle(2, 200, 200, (200, 200), 70, 40)
+  assert u1.getPosition() == (100.0, 100.0)
+  assert u2.getPosition() == (200.0, 200.0)
+
+  u1.setPosition(110, 120)
+  u2.setWypt(500, 600)
+  assert u1.getPosition() == (110.0, 120.0)
+  assert u2.getPosition() == (200.0, 200.0)
+  assert u1.getWypt() == (100.0, 100.0)
+  assert u2.getWypt() == (500.0, 600.0)
+
+
+def test_vehicles_move_separately():
+  world, engine = MakeEngine()
+  u1 = engine.addVehicle(1, 0, 0, (1000, 0), 70, 40)
+  u2 = engine.addVehicle(2, 0, 500, (0, 1500), 70, 20)
+  engine.step(1.0)
+  assert u1.getPosition() == (40.0, 0.0)
+  assert u2.getPosition() == (0.0, 520.0)
+  assert (world.nodes[1].position.x, world.nodes[1].position.y) == (40.0, 0.0)
+  assert (world.nodes[2].position.x, world.nodes[2].position.y) == (0.0, 520.0)
+
+  # Each vehicle queries the target grid from its own position
+  assert u1.getPotentialTargets(1200, 100) == [11]
+  assert u2.getPotentialTargets(1200, 100) == []
+
+
+def test_vehicles_share_one_target_grid():
+  world, engine = MakeEngine()
+  u1 = engine.addVehicle(1, 0, 0, (1000, 0), 70, 40)
+  u2 = engine.addVehicle(2, 0, 500, (0, 1500), 70, 20)
+  assert u1.target_index is u2.target_index is engine.target_index
+  u1.getPotentialTargets(1200, 100)
+  u2.getPotentialTargets(1200, 100)
+  assert engine.target_index.reloads == 1
+
+
+def test_fleet_step_matches_the_scalar_kernel():
+  rng = np.random.default_rng(0)
+  n = 1000
+  x, y = rng.uniform(0, 1000, n), rng.uniform(0, 1000, n)
+  # Targets far away, near the orbit and on the vehicle itself
+  tx = np.where(rng.random(n) < 0.5, rng.uniform(0, 1000, n), x + rng.uniform(-80, 80, n))
+  ty = np.where(rng.random(n) < 0.5, rng.uniform(0, 1000, n), y + rng.uniform(-80, 80, n))
+  tx[:10], ty[:10] = x[:10], y[:10]
+  rad = rng.choice([0.0, 30.0, 70.0], n)
+  speed = rng.uniform(1, 60, n)
+
+  xnew, ynew = MoveFleet(x, y, tx, ty, rad, speed, 1.0)
+  for i in range(n):
+    expected = move_node_grpc.MoveVehicle(x[i], y[i], tx[i], ty[i], rad[i], speed[i], 1.0)
+    assert np.allclose((xnew[i], ynew[i]), expected)
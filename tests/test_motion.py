@@ -0,0 +1,22 @@
+import fake_core
+from motion import PredictedPositions
+from node_positions import PositionSnapshot
+
+
+def test_own_position_is_not_predicted():
+  now = [0.0]
+  world = fake_core.FakeWorld()
+  world.addNode(1, 0, 0)
+  world.addNode(12, 100, 100)
+  snapshot = PositionSnapshot(fake_core.FakeCoreClient(world), world.session_id, 0.25, lambda: now[0])
+  positions = PredictedPositions(snapshot, clock=lambda: now[0], own_id=1)
+  positions.update()
+
+  assert positions.getPosition(1) == (0, 0)
+  assert 1 not in positions.filters
+  assert positions.getPosition(12) == (100, 100)
+  assert 12 in positions.filters
+
+  # With own(), the UAV's position comes from the mover instead
+  positions = PredictedPositions(snapshot, clock=lambda: now[0], own_id=1, own=lambda: [5, 6])
+  assert positions.getPosition(1) == (5, 6)
@@ -0,0 +1,42 @@
+import fake_core
+from node_updates import NodeUpdater
+
+
+class RecordingCore(fake_core.FakeCoreClient):
+  def __init__(self, world):
+    fake_core.FakeCoreClient.__init__(self, world)
+    self.edits = []
+
+  def edit_node(self, session_id, node_id, position=None, icon=None, source=None):
+    self.edits.append((node_id, None if position is None else (position.x, position.y), icon))
+    return fake_core.FakeCoreClient.edit_node(self, session_id, node_id, position, icon, source)
+
+
+def test_position_update_keeps_the_icon():
+  world = fake_core.FakeWorld()
+  world.addNode(1, 0, 0)
+  core = RecordingCore(world)
+  updater = NodeUpdater(core, world.session_id)
+
+  updater.setPosition(1, 10, 0)
+  updater.flush()
+  updater.setIcon(1, "blue_plane.png")
+  updater.flush()
+  updater.setPosition(1, 20, 0)
+  updater.flush()
+
+  assert core.edits == [(1, (10, 0), None), (1, None, "blue_plane.png"), (1, (20, 0), "blue_plane.png")]
+
+
+def test_newest_position_wins():
+  world = fake_core.FakeWorld()
+  world.addNode(1, 0, 0)
+  core = RecordingCore(world)
+  updater = NodeUpdater(core, world.session_id)
+
+  for x in (10, 20, 30):
+    updater.setPosition(1, x, 0)
+  updater.flush()
+
+  assert core.edits == [(1, (30, 0), None)]
+  assert updater.coalesced == 2
@@ -0,0 +1,55 @@
+from peers import BoundedSet
+from peers import CORENode
+from peers import PeerTable
+
+
+def test_claims_are_indexed_by_target():
+  uavs = PeerTable()
+  me = CORENode(1, -1, 0, 0)
+  peer = CORENode(2, 12, 80.0, 1)
+  uavs.append(me)
+  uavs.append(peer)
+  assert uavs[0] is me
+  assert uavs.get(2) is peer
+  assert uavs.claiming(12) == [peer]
+
+  peer.trackid = 14
+  me.trackid = 14
+  assert uavs.claiming(12) == []
+  assert sorted(n.nodeid for n in uavs.claiming(14)) == [1, 2]
+
+  peer.oldtrackid = 14
+  peer.trackid = 0
+  assert uavs.claiming(14) == [me]
+  assert uavs.previouslyClaiming(14) == [peer]
+
+
+def test_silent_peers_expire_with_their_claims():
+  uavs = PeerTable(ttl=3.0)
+  me = CORENode(1, -1, 0, 0)
+  uavs.append(me)
+  quiet = CORENode(2, 12, 80.0, 1)
+  heard = CORENode(3, 13, 90.0, 1)
+  for peer in (quiet, heard):
+    uavs.append(peer)
+    uavs.touch(peer, 0.0)
+
+  uavs.touch(heard, 2.0)
+  assert uavs.expire(2.5) == []
+  assert uavs.expire(3.5) == [quiet]
+  assert uavs.get(2) is None
+  assert uavs.claiming(12) == []
+  assert len(uavs.timers) == 1
+
+  # The timer pushed back when it fired early now expires the other
+  assert uavs.expire(5.5) == [heard]
+  assert uavs.claiming(13) == []
+  assert list(uavs) == [me]
+
+
+def test_bounded_set_forgets_the_oldest():
+  seen = BoundedSet(maxlen=3)
+  for target in (11, 12, 13, 11, 14):
+    seen.add(target)
+  assert 12 not in seen
+  assert list(seen.items) == [13, 11, 14]
@@ -0,0 +1,65 @@
+from advert import ParseAdvert
+from reliable import ReliableSender
+from reliable import ReliableReceiver
+from swarm_sim import Scenario
+from swarm_sim import SwarmHarness
+
+
+def test_restarted_sender_is_heard_at_once():
+  rx = ReliableReceiver(0.5)
+  for seq in range(1, 31):
+    assert rx.received(5, seq, seq*0.5, 1000.0 + seq)
+
+  # A retransmission keeps its original timestamp and is stale
+  assert not rx.received(5, 20, 16.0, 1020.0)
+
+  # The restarted sender counts from 1 again with a newer timestamp
+  assert rx.received(5, 1, 17.0, 1040.0)
+  assert rx.received(5, 2, 17.5, 1040.5)
+  assert not rx.received(5, 1, 18.0, 1040.0)
+
+
+def test_nack_while_sending():
+  sent = []
+  sender = ReliableSender(None, 0, 0, transport=sent.append)
+  for i in range(5):
+    sender.send(1, 11, 100.0, 1)
+
+  # The tick thread sends while the receive thread retransmits
+  def transport(data):
+    sent.append(data)
+    if len(sent) < 10:
+      sender.send(1, 11, 100.0, 1)
+  sender.transport = transport
+  sender.handleNack(1, 5, now=10.0)
+
+  assert sender.retransmits == 5
+  seqs = [ParseAdvert(data, len(data))[2] for data in sent[5:]]
+  assert set(range(1, 6)) <= set(seqs)
+
+
+def test_unanswered_nack_is_repeated():
+  rx = ReliableReceiver(1.0)
+  rx.received(5, 1, 0.0, 1000.0)
+  assert rx.overdue(1.0) == []
+  assert rx.overdue(1.6) == [(5, 2)]
+  assert rx.overdue(2.0) == []
+
+  # Neither the NACK nor its repair got through
+  assert rx.overdue(2.6) == [(5, 2)]
+
+  # Another receiver asked for it meanwhile
+  rx.heardNack(5, 2, 1, 3.0)
+  assert rx.overdue(3.6) == []
+
+
+def test_settled_swarm_sends_fewer_adverts():
+  scenario = Scenario.Load()
+  targets = dict((target_id, (x - 700, y)) for target_id, (x, y) in scenario.targets.items())
+  rates = dict()
+  for protocol in ('udp', 'nack'):
+    harness = SwarmHarness(scenario, protocol, 0.5, seed=0, targets=targets)
+    harness.run(60)
+    rates[protocol] = harness.summary()['msgs_per_uav_per_sec']
+    harness.close()
+  assert rates['nack'] < rates['udp']/2.5
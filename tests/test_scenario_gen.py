@@ -0,0 +1,27 @@
+import os
+import shlex
+import xml.etree.ElementTree as ET
+
+import scenario_gen
+
+
+def test_hook_starts_movers_with_the_config(tmp_path):
+  config = scenario_gen.MakeConfig(12, 12)
+  xml, configpath, launch = scenario_gen.WriteScenario(config, str(tmp_path), "uav12-target12")
+
+  hook = ET.parse(xml).getroot().find('session_hooks/hook').text
+  movers = [line for line in hook.splitlines() if 'move_node_grpc.py' in line]
+  assert len(movers) == len(config['uavs'])
+
+  for uav, line in zip(config['uavs'], movers):
+    argv = shlex.split(line.split(' > ')[0])
+    script = [i for i, arg in enumerate(argv) if arg.endswith('move_node_grpc.py')][0]
+    args = argv[script + 1:]
+    assert [int(a) for a in args[:6]] == [uav['id'], uav['x'], uav['y'], uav['rad'],
+                                          uav['speed'], uav['duration']]
+    assert args[6:] == ['-x', os.path.abspath(configpath)]
+
+    # The mover finds its waypoint and the swarm's targets in that config
+    loaded = scenario_gen.LoadConfig(args[7])
+    assert scenario_gen.ConfigWaypoints(loaded)[uav['id']] == tuple(uav['wypt'])
+    assert scenario_gen.ConfigTargets(loaded) == scenario_gen.ConfigTargets(config)
@@ -0,0 +1,14 @@
+import os
+
+from swarm_sim import SwarmHarness
+
+
+def test_quiet_runs_do_not_leak_files():
+  harness = SwarmHarness(protocol='udp')
+  harness.run(1)
+  open_files = len(os.listdir('/proc/self/fd'))
+  for i in range(20):
+    harness.run(1)
+  assert len(os.listdir('/proc/self/fd')) == open_files
+  harness.close()
+  assert harness.devnull is None
@@ -0,0 +1,53 @@
+from trickle import Trickle
+
+
+# Fires at the start of each window, [I/2, I)
+class EarlyRng():
+  def uniform(self, low, high):
+    return low
+
+
+def test_interval_doubles_up_to_imax():
+  trickle = Trickle(1.0, doublings=2, k=0, rng=EarlyRng())
+  sends = [t/4 for t in range(0, 60) if trickle.poll(t/4)]
+  assert sends == [0.5, 2.0, 5.0, 9.0, 13.0]
+  assert trickle.interval == 4.0
+
+
+def test_inconsistency_resets_to_imin():
+  trickle = Trickle(1.0, doublings=2, k=0, rng=EarlyRng())
+  for t in range(20):
+    trickle.poll(t/2)
+  assert trickle.interval == 4.0
+  trickle.inconsistent(10.0)
+  assert trickle.interval == 1.0
+  assert trickle.resets == 1
+  assert not trickle.poll(10.25)
+  assert trickle.poll(10.5)
+
+  # At Imin a further inconsistency does not restart the interval
+  trickle.inconsistent(10.75)
+  assert trickle.start == 10.0
+
+
+def test_consistent_peers_suppress_our_send():
+  trickle = Trickle(1.0, k=2, rng=EarlyRng())
+  trickle.poll(0.0)
+  trickle.consistent()
+  trickle.consistent()
+  assert not trickle.poll(0.5)
+  assert trickle.suppressed == 1
+
+  # The next, doubled interval starts over
+  assert [t/4 for t in range(3, 12) if trickle.poll(t/4)] == [2.0]
+
+
+def test_max_gap_forces_a_send():
+  trickle = Trickle(1.0, k=1, max_gap=3.0, rng=EarlyRng())
+  sends = []
+  for t in range(40):
+    if t > 2:
+      trickle.consistent()
+    if trickle.poll(t/4):
+      sends.append(t/4)
+  assert sends == [0.5, 3.5, 6.5, 9.5]
@@ -0,0 +1,109 @@
+import mmap
+import os
+import subprocess
+import sys
+
+import pytest
+
+import fake_core
+import move_node_grpc
+import uav_ipc
+from uav_ipc import IpcMover
+from uav_ipc import IpcServer
+from uav_ipc import MOVE_BLOCK
+from uav_ipc import SEQ
+from uav_ipc import SeqlockRead
+
+
+# A mover in its own process, serving UAV 1 next to target 12
+MOVER = """
+import sys
+sys.path.insert(0, sys.argv[1])
+import fake_core
+fake_core.InstallFakeCore()
+import move_node_grpc
+import uav_ipc
+uav_ipc.ipcpath = sys.argv[2]
+move_node_grpc.targets = {12: 'blue'}
+world = fake_core.FakeWorld()
+world.addNode(1, 0, 0)
+world.addNode(12, 100, 100)
+core = fake_core.FakeCoreClient(world)
+uav_ipc.IpcServer(move_node_grpc.CoreUav(core, world.session_id, 1, 0, 0, 100, 150)).run()
+"""
+
+
+@pytest.fixture
+def world(tmp_path, monkeypatch):
+  monkeypatch.setattr(uav_ipc, 'ipcpath', str(tmp_path) + '/')
+  world = fake_core.FakeWorld()
+  world.addNode(1, 0, 0)
+  world.addNode(12, 100, 100)
+  return world
+
+
+def MakeUav(world):
+  core = fake_core.FakeCoreClient(world)
+  return move_node_grpc.CoreUav(core, world.session_id, 1, 0, 0, 100, 150)
+
+
+def test_read_gives_up_on_a_dead_writer():
+  shm = mmap.mmap(-1, uav_ipc.SHM_SIZE)
+  MOVE_BLOCK.pack_into(shm, 0, 2, 1.0, 2.0, 3.0, 4.0)
+  assert SeqlockRead(shm, 0, MOVE_BLOCK) == (2, 1.0, 2.0, 3.0, 4.0)
+
+  # The writer died with the sequence odd
+  SEQ.pack_into(shm, 0, 3)
+  with pytest.raises(ValueError):
+    SeqlockRead(shm, 0, MOVE_BLOCK, timeout=0.05)
+
+
+def test_restarted_mover_keeps_the_trackers_state(world):
+  server = IpcServer(MakeUav(world))
+  mover = IpcMover(1, timeout=1)
+  mover.setWypt(300, 400)
+  mover.setTarget(12)
+  server.server.server_close()
+
+  uav = MakeUav(world)
+  server = IpcServer(uav)
+  assert uav.getWypt() == (300, 400)
+  assert uav.getTarget() == 12
+  server.server.server_close()
+
+
+def test_mover_resets_the_state_of_a_stopped_tracker(world):
+  server = IpcServer(MakeUav(world))
+  mover = IpcMover(1, timeout=1)
+  process = subprocess.Popen([sys.executable, '-c', 'pass'])
+  process.wait()
+  mover.pid = process.pid
+  mover.setWypt(300, 400)
+  server.server.server_close()
+
+  uav = MakeUav(world)
+  server = IpcServer(uav)
+  assert uav.getWypt() == (100, 150)
+  assert IpcMover(1, timeout=1).getWypt() == (100, 150)
+  server.server.server_close()
+
+
+def test_tracker_reconnects_to_a_restarted_mover(world, monkeypatch):
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  mover = subprocess.Popen([sys.executable, '-c', MOVER, root, uav_ipc.ipcpath],
+                           stdout=subprocess.DEVNULL)
+  try:
+    tracker = IpcMover(1, timeout=10)
+    assert tracker.getPotentialTargets() == [12]
+  finally:
+    mover.kill()
+    mover.wait()
+
+  # The restarted mover unlinks and rebinds the socket
+  monkeypatch.setattr(move_node_grpc, 'targets', {12: 'blue'})
+  server = IpcServer(MakeUav(world))
+  server.start()
+  assert tracker.getPotentialTargets() == [12]
+  tracker.close()
+  server.server.shutdown()
+  server.server.server_close()
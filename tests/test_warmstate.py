@@ -0,0 +1,60 @@
+from peers import BoundedSet
+from peers import CORENode
+from peers import PeerTable
+from warmstate import WarmState
+
+
+def MakeTracker():
+  uavs = PeerTable(ttl=3.0)
+  me = CORENode(1, 14, 120.5, 1)
+  me.oldtrackid = 14
+  uavs.append(me)
+  peer = CORENode(2, 12, 80.0, 1)
+  peer.claim = (12, 1, 80.0, 1000.5)
+  uavs.append(peer)
+  uavs.touch(peer, 9.0)
+  seen = BoundedSet()
+  seen.add(16)
+  return me, uavs, seen
+
+
+def test_save_and_resume(tmp_path):
+  wall = [1000.0]
+  path = str(tmp_path / "track_n1.state")
+  me, uavs, seen = MakeTracker()
+  WarmState(path, lambda: wall[0]).save(me, uavs, seen, 10.0)
+
+  wall[0] = 1001.5
+  state = WarmState(path, lambda: wall[0]).load(1, 3.0)
+  assert state.generation == 2
+  assert state.age == 1.5
+  assert (state.trackid, state.oldtrackid, state.trackingMode) == (14, 14, 1)
+  assert state.potentialTargetDis == 120.5
+  assert state.peers == [(2, 12, 12, 1, 80.0, 1.0, 12, 1, 80.0, 1000.5)]
+  assert state.seen == [16]
+
+
+def test_stale_or_foreign_state_is_ignored(tmp_path):
+  wall = [1000.0]
+  path = str(tmp_path / "track_n1.state")
+  me, uavs, seen = MakeTracker()
+  state = WarmState(path, lambda: wall[0])
+  state.save(me, uavs, seen, 10.0)
+  assert state.load(2, 3.0) is None
+
+  wall[0] = 1004.0
+  assert state.load(1, 3.0) is None
+
+
+def test_torn_write_is_rejected(tmp_path):
+  path = str(tmp_path / "track_n1.state")
+  me, uavs, seen = MakeTracker()
+  state = WarmState(path, lambda: 1000.0)
+  state.save(me, uavs, seen, 10.0)
+
+  # Killed mid-write: the generation is left odd
+  state.shm[0] = state.shm[0] | 1
+  assert state.load(1, 3.0) is None
+
+  # The next run writes the following generation
+  assert WarmState(path).generation == 4
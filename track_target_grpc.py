@@ -13,45 +13,119 @@ import subprocess
 import threading
 import datetime
 import random
+import asyncio
+import atexit
+import heapq
 
 from core.api.grpc import client
 from core.api.grpc import core_pb2
 import xmlrpc.client
 
-uavs = []
-seen_targets = []
+from node_positions import PositionSnapshot
+from node_positions import NodeCache
+from advert import McastSender
+from advert import McastReceiver
+from advert import ParseAdvert
+from advert import KIND_ADVERT
+from advert import KIND_NACK
+from advert import KIND_BID
+from advert import KIND_REPORT
+from advert import KIND_ASSIGN
+from advert import REPORT_TARGET
+from advert import ASSIGNMENT
+from advert import ParseCluster
+from advert import MessageKind
+from advert import ParseNack
+from advert import ParseDigest
+from reliable import ReliableSender
+from reliable import ReliableReceiver
+from peers import CORENode
+from peers import PeerTable
+from peers import BoundedSet
+from auction import Auction
+from auction import DistanceMatrix
+from auction import NO_TARGET
+from uav_ipc import IpcMover
+from record import Recorder
+from record import RecordingPositions
+from record import RecordingMover
+from scheduler import TickScheduler
+from trickle import Trickle
+from trickle import REDUNDANCY
+from motion import PredictedPositions
+from motion import Intercept
+from warmstate import WarmState
+from warmstate import StatePath
+from geocast import GeoGroups
+from cluster import ClusterView
+import metrics
+
+uavs = PeerTable()
+seen_targets = BoundedSet()
 compare = True
 mynodeseq = 0
 nodecnt = 0
 protocol = 'none'
+comms_protocols = ('udp', 'nack', 'auction', 'trickle', 'cluster')
 mcastaddr = '235.1.1.1'
 port = 9100
 ttl = 64
 core = None
 session_id = None 
+positions = None
+sender = None
+transport = None
+clock = time.monotonic
+reliable_rx = None
+auction = None
 counter = 0
+quiet = False
+recorder = None
+peer_ttl = 3.0
+scheduler = None
+tracking_range = None
+last_track = (-1, None, 0.0)
+trickle = None
+redundancy = REDUNDANCY
+advertised = None
+rng = random
+gossip = 0
+uav_speed = 0
+warm_state = None
+receiver = None
+geo_cell = 0
+geo_groups = None
+cluster = None
+cluster_cell = 1200
+last_report = (None, None)
+last_assign = (None, None)
+heartbeat = None
+last_advert = (None, None)
 
 filepath = '/tmp'
 nodepath = ''
 
-thrdlock = threading.Lock()
+thrdlock = metrics.TimedLock("thrdlock")
 xmlproxy = xmlrpc.client.ServerProxy("http://localhost:8000", allow_none=True)
+mover = xmlproxy
 
 
 #---------------
-# Define a CORE node
+# Per-tick output, turned off with -q
 #---------------
-class CORENode():
-  def __init__(self, nodeid, track_nodeid, potentialDistance, trackingMode):
-    self.nodeid = nodeid
-    self.trackid = track_nodeid
-    self.oldtrackid = track_nodeid
-    self.trackingMode = trackingMode
-    self.potentialTargetDis = potentialDistance
+def Log(*args):
+  if not quiet:
+    print(*args)
+
+#---------------
+# Ask for an early tick when something needs an answer before the next
+# deadline
+#---------------
+def Trigger(reason):
+  if scheduler is not None:
+    metrics.Inc('ticks_triggered', reason=reason)
+    scheduler.trigger()
 
-  def __repr__(self):
-    return str(self.nodeid)
-    
 #---------------
 # Thread that receives UDP Advertisements
 #---------------
@@ -78,9 +152,9 @@ def Distance_pts(x1, x2, y1, y2):
 # Redeploy a UAV back to its original position
 #---------------
 def RedeployUAV(uavnode):
-  print("Redeploy UAV")
-  position = xmlproxy.getOriginalWypt()
-  xmlproxy.setWypt(position[0], position[1])
+  Log("Redeploy UAV")
+  position = mover.getOriginalWypt()
+  mover.setWypt(position[0], position[1])
 
 #---------------
 # Record target tracked to the proxy 
@@ -88,73 +162,317 @@ def RedeployUAV(uavnode):
 #---------------
 def RecordTarget(uavnode):
   # print("RecordTarget")
-  xmlproxy.setTarget(uavnode.trackid)
+  metrics.Inc('assignment_changes')
+  mover.setTarget(uavnode.trackid)
 
 #---------------
 # Advertise the target being tracked over UDP
 #---------------
-def AdvertiseUDP(uavnodeid, trgtnodeid, potentialTrgDis, track):
-  print("AdvertiseUDP")
-  addrinfo = socket.getaddrinfo(mcastaddr, None)[0]
-  sk = socket.socket(addrinfo[0], socket.SOCK_DGRAM)
-  ttl_bin = struct.pack('@i', ttl)
-  sk.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl_bin)
-  buf = str(uavnodeid) + ' ' + str(trgtnodeid) + ' ' + str(potentialTrgDis) + ' ' + str(track)
-  sk.sendto(buf.encode(encoding='utf-8',errors='strict'), (addrinfo[4][0], port))
+def AdvertiseUDP(uavnodeid, trgtnodeid, potentialTrgDis, track, kind=KIND_ADVERT):
+  Log("AdvertiseUDP")
+  digest = ()
+  if gossip and kind == KIND_ADVERT:
+    digest = Digest()
+  GetSender().send(uavnodeid, trgtnodeid, potentialTrgDis, track, kind, digest)
+
+#---------------
+# Our advert sender, created on first use
+#---------------
+def GetSender():
+  global sender
+  if sender is None:
+    if protocol == "nack":
+      sender = ReliableSender(mcastaddr, port, ttl, transport)
+    else:
+      sender = McastSender(mcastaddr, port, ttl, transport)
+  return sender
+
+#---------------
+# Geo mode: send to the group of the cell we are in and listen to the
+# cells within competition range, twice our tracking range
+#---------------
+def UpdateGroups():
+  global geo_groups
+  if not geo_cell or protocol not in comms_protocols or receiver is None:
+    return
+  if geo_groups is None:
+    geo_groups = GeoGroups(receiver, geo_cell, 2*tracking_range)
+  uavNodeX, uavNodeY = positions.getPosition(uavs[mynodeseq].nodeid)
+  joins, leaves = geo_groups.joins, geo_groups.leaves
+  GetSender().setGroup(geo_groups.update(uavNodeX, uavNodeY))
+  metrics.Inc('group_joins', geo_groups.joins - joins)
+  metrics.Inc('group_leaves', geo_groups.leaves - leaves)
+
+#---------------
+# The most recently advertised claims of other UAVs, to gossip along
+# with our own
+#---------------
+def Digest():
+  me = uavs[mynodeseq]
+  claimed = [uavnode for uavnode in uavs if uavnode is not me and uavnode.claim is not None]
+  freshest = heapq.nlargest(gossip, claimed, key=lambda uavnode: uavnode.claim[3])
+  return [(uavnode.nodeid, uavnode.claim[0], uavnode.claim[1], uavnode.claim[2], uavnode.claim[3])
+          for uavnode in freshest]
+
+#---------------
+# Apply gossiped claims newer than the ones we hold
+#---------------
+def MergeDigest(buf, nbytes):
+  me = uavs[mynodeseq].nodeid
+  for uavnodeid, trgtnodeid, trackMode, potTrgDis, version in ParseDigest(buf, nbytes):
+    if uavnodeid == me:
+      continue
+    uavnode = uavs.get(uavnodeid)
+    if uavnode is None or uavnode.claim is None or version > uavnode.claim[3]:
+      metrics.Inc('gossip_merged')
+      UpdateTracking(uavnodeid, trgtnodeid, potTrgDis, trackMode, version)
+
+#---------------
+# Advertise when the Trickle timer says so; a change of our own claim
+# restarts it at the shortest interval
+#---------------
+def AdvertiseTrickle(uavnode):
+  global advertised
+  now = clock()
+  state = (uavnode.trackid, uavnode.trackingMode)
+  if state != advertised:
+    trickle.inconsistent(now)
+  if trickle.poll(now):
+    advertised = state
+    AdvertiseUDP(uavnode.nodeid, uavnode.trackid, uavnode.potentialTargetDis, uavnode.trackingMode)
+  else:
+    metrics.Inc('adverts_suppressed')
+
+#---------------
+# NACK protocol: advertise a changed or contested claim at once and
+# repeat an unchanged one every heartbeat, so peers can tell a lost
+# advert from a quiet sender
+#---------------
+def AdvertiseNack(uavnode):
+  global last_advert
+  now = clock()
+  state = (uavnode.trackid, uavnode.trackingMode)
+  contested = uavnode.trackid > 0 and len(uavs.claiming(uavnode.trackid)) > 1
+  if state != last_advert[0] or contested or now - last_advert[1] >= heartbeat:
+    last_advert = (state, now)
+    AdvertiseUDP(uavnode.nodeid, uavnode.trackid, uavnode.potentialTargetDis, uavnode.trackingMode)
+  else:
+    metrics.Inc('adverts_suppressed')
 
 #---------------
 # Receive and parse UDP advertisments
 #---------------
 def ReceiveUDP():
+  global receiver
   print("Receive UDP")
-  addrinfo = socket.getaddrinfo(mcastaddr, None)[0]
-  sk = socket.socket(addrinfo[0], socket.SOCK_DGRAM)
-  sk.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  if receiver is None:
+    receiver = McastReceiver(mcastaddr, port)
 
-  # Bind
-  sk.bind(('', port))
+  while 1:
+    buf, nbytes = receiver.recv()
+    HandleAdvert(buf, nbytes)
 
-  # Join group
-  group_bin = socket.inet_pton(addrinfo[0], addrinfo[4][0])
-  mreq = group_bin + struct.pack('=I', socket.INADDR_ANY)
-  sk.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+#---------------
+# Apply a single received advertisement
+#---------------
+def HandleAdvert(buf, nbytes):
+  start = time.perf_counter()
+  if recorder is not None:
+    recorder.advert(buf, nbytes)
+  if MessageKind(buf, nbytes) == KIND_NACK:
+    metrics.Inc('datagrams_in', kind='nack')
+    HandleNack(buf, nbytes)
+    return
+  advert = ParseAdvert(buf, nbytes)
+  metrics.Observe('parse_seconds', time.perf_counter() - start)
+  if advert is None:
+    metrics.Inc('datagrams_in', kind='invalid')
+    return
+  kind, uavnodeid, seq, stamp, trgtnodeid, potTrgDis, trackMode = advert
+  metrics.Inc('datagrams_in', kind={KIND_BID: 'bid', KIND_REPORT: 'report', KIND_ASSIGN: 'assign'}.get(kind, 'advert'))
+  if kind in (KIND_REPORT, KIND_ASSIGN):
+    HandleCluster(kind, uavnodeid, trgtnodeid, buf, nbytes)
+    return
+  if kind == KIND_BID:
+    if protocol == "auction" and auction is not None and uavnodeid != auction.nodeid:
+      thrdlock.acquire()
+      held = auction.assigned
+      auction.bid(uavnodeid, trgtnodeid, potTrgDis, clock())
+      outbid = held != NO_TARGET and auction.assigned == NO_TARGET
+      thrdlock.release()
+      if outbid:
+        Trigger('outbid')
+    return
+  if kind != KIND_ADVERT:
+    return
+  if protocol == "nack" and uavnodeid != uavs[mynodeseq].nodeid:
+    thrdlock.acquire()
+    fresh = reliable_rx.received(uavnodeid, seq, clock(), stamp)
+    thrdlock.release()
+    if not fresh:
+      return
+  # Update tracking info for other UAVs
+  uavnode = uavs[mynodeseq]
+  if uavnode.nodeid != uavnodeid:
+    UpdateTracking(uavnodeid, trgtnodeid, potTrgDis, trackMode, stamp)      
+  if gossip:
+    MergeDigest(buf, nbytes)
 
-  while 1:
-    buf, sender = sk.recvfrom(1500)
-    buf_str = buf.decode('utf-8')
-    uavidstr, trgtidstr, potentialDisStr, trackModeStr = buf_str.split(" ")        
-    uavnodeid, trgtnodeid, potTrgDis, trackMode = int(uavidstr), int(trgtidstr), float(potentialDisStr), int(trackModeStr)
-    # Update tracking info for other UAVs
-    uavnode = uavs[mynodeseq]
-    if uavnode.nodeid != uavnodeid:
-      UpdateTracking(uavnodeid, trgtnodeid, potTrgDis, trackMode)      
+#---------------
+# Apply a cluster report or assignment; wake up early if the head has a
+# member to (re)assign or our assignment changed
+#---------------
+def HandleCluster(kind, uavnodeid, trgtnodeid, buf, nbytes):
+  if protocol != "cluster" or cluster is None or uavnodeid == uavs[mynodeseq].nodeid:
+    return
+  now = clock()
+  if kind == KIND_REPORT:
+    parsed = ParseCluster(buf, nbytes, REPORT_TARGET)
+    if parsed is None:
+      return
+    cell, entries = parsed
+    thrdlock.acquire()
+    changed = cluster.report(uavnodeid, cell, sorted(target for (target,) in entries), trgtnodeid, now)
+    own = cluster.members.get(uavs[mynodeseq].nodeid)
+    ours = own is not None and own.cell == cell and cluster.head(cell) == own.nodeid
+    thrdlock.release()
+    if changed and ours:
+      Trigger('report')
+  else:
+    parsed = ParseCluster(buf, nbytes, ASSIGNMENT)
+    if parsed is None:
+      return
+    cell, entries = parsed
+    thrdlock.acquire()
+    changed = cluster.heardAssign(uavnodeid, cell, entries, now)
+    thrdlock.release()
+    if changed:
+      Trigger('assign')
+
+#---------------
+# Retransmit adverts a peer missed, or note that a peer already asked
+#---------------
+def HandleNack(buf, nbytes):
+  if protocol != "nack":
+    return
+  nack = ParseNack(buf, nbytes)
+  if nack is None:
+    return
+  requester, source, first, count = nack
+  if source == uavs[mynodeseq].nodeid:
+    if sender is not None:
+      sender.handleNack(first, count, clock())
+  else:
+    thrdlock.acquire()
+    reliable_rx.heardNack(source, first, count, clock())
+    thrdlock.release()
+
+#---------------
+# Ask peers to retransmit adverts that are overdue. Only peers whose
+# claims involve a target we could track are worth repairing.
+#---------------
+def SendNacks(uavnode, potential_targets):
+  sender = GetSender()
+
+  interest = set(potential_targets)
+  interest.add(uavnode.trackid)
+  interest.add(uavnode.oldtrackid)
+  interest.discard(-1)
+  interest.discard(0)
+
+  def relevant(source):
+    peer = uavs.get(source)
+    return peer is not None and (peer.trackid in interest or peer.oldtrackid in interest)
+
+  for source, expected in reliable_rx.overdue(clock(), relevant):
+    sender.sendNack(uavnode.nodeid, source, expected, 1)
 
 #---------------
 # Update tracking info based on a received advertisement
 #---------------
-def UpdateTracking(uavnodeid, trgtnodeid, potentialTrgDis, trackMode):
-  if protocol == "udp":
+def UpdateTracking(uavnodeid, trgtnodeid, potentialTrgDis, trackMode, version=None):
+  if protocol in comms_protocols:
     thrdlock.acquire()
     
   # Update corresponding UAV node structure with tracking info
   # if UAV node is in the UAV list
-  in_uavs = False
-  for uavnode in uavs:
-    if uavnode.nodeid == uavnodeid:
-      # print("Update UAV %d with trackid %d and tracking mode %d"%(uavnodeid,trgtnodeid,trackMode))
-      uavnode.trackid = trgtnodeid
-      uavnode.trackingMode = trackMode
-      uavnode.potentialTargetDis = potentialTrgDis
-      in_uavs = True
+  uavnode = uavs.get(uavnodeid)
+  conflict = trgtnodeid > 0 and trgtnodeid == uavs[mynodeseq].trackid
+
+  # A new peer, a changed claim or a contested target is news the
+  # swarm should hear soon; anything else confirms what we know
+  if trickle is not None:
+    if uavnode is None or uavnode.trackid != trgtnodeid or conflict:
+      trickle.inconsistent(clock())
+    else:
+      trickle.consistent()
+
+  if uavnode is not None:
+    # print("Update UAV %d with trackid %d and tracking mode %d"%(uavnodeid,trgtnodeid,trackMode))
+    uavnode.trackid = trgtnodeid
+    uavnode.trackingMode = trackMode
+    uavnode.potentialTargetDis = potentialTrgDis
 
   # Otherwise add UAV node to UAV list
-  if not in_uavs:
-    node = CORENode(uavnodeid, trgtnodeid, potentialTrgDis, trackMode)
-    uavs.append(node)   
+  else:
+    uavnode = CORENode(uavnodeid, trgtnodeid, potentialTrgDis, trackMode)
+    uavs.append(uavnode)   
+  uavs.touch(uavnode, clock())
+  if version is not None:
+    uavnode.claim = (trgtnodeid, trackMode, potentialTrgDis, version)
       
-  if protocol == "udp":
+  if protocol in comms_protocols:
     thrdlock.release()
 
+  # Another UAV claims our target
+  if conflict:
+    Trigger('conflict')
+
+#---------------
+# Node event from CORE: re-evaluate early if our target left our range
+#---------------
+def PositionEvent(node_id, x, y):
+  uavnode = uavs[mynodeseq]
+  trackid = uavnode.trackid
+  if trackid <= 0 or node_id not in (trackid, uavnode.nodeid):
+    return
+  uavpos = positions.positions.get(uavnode.nodeid)
+  trgtpos = positions.positions.get(trackid)
+  if uavpos is None or trgtpos is None:
+    return
+  if Distance_pts(uavpos[0], trgtpos[0], uavpos[1], trgtpos[1]) > tracking_range:
+    Trigger('range')
+
+#---------------
+# Whether the last tick kept the same target and that target moves
+# slowly, so the scheduler may stretch the interval
+#---------------
+def Settled():
+  global last_track
+  uavnode = uavs[mynodeseq]
+  position = None
+  if uavnode.trackid > 0:
+    position = positions.getPosition(uavnode.trackid)
+  now = clock()
+  previous, previous_position, previous_time = last_track
+  last_track = (uavnode.trackid, position, now)
+  if uavnode.trackid != previous:
+    return False
+  if position is None or previous_position is None:
+    return True
+  moved = Distance_pts(position[0], previous_position[0], position[1], previous_position[1])
+  return moved <= scheduler.slow_speed * (now - previous_time)
+
+#---------------
+# Drop peers not heard from within the TTL; their claims go with them
+#---------------
+def ExpirePeers():
+  for uavnode in uavs.expire(clock()):
+    Log("UAV %d expired, releasing target %d" % (uavnode.nodeid, uavnode.oldtrackid))
+    metrics.Inc('peers_expired')
+    if reliable_rx is not None:
+      reliable_rx.forget(uavnode.nodeid)
+
 #---------------
 # Compare with other UAVs if they share the same potential targets
 # The closest UAV gets the target
@@ -163,12 +481,13 @@ def compareUAV(uavnode):
   compare = True
   if (uavnode.trackid > 0):
     toTrackOrNot = 1
-    i = 1
-    while (i < len(uavs)) and (compare):
-      tempUAV = uavs[i]
+    # Only the UAVs claiming the same target can compete for it
+    for tempUAV in uavs.claiming(uavnode.trackid):
+      if (not compare) or (tempUAV is uavnode):
+        continue
       # If the current UAV is potentially tracking a target, and another UAV is tracking the same target
-      if (tempUAV.trackid == uavnode.trackid) and (tempUAV.trackingMode == 1):
-        print("UAV %d competes with UAV %d for target %d"%(uavnode.nodeid, tempUAV.nodeid, uavnode.trackid))
+      if (tempUAV.trackingMode == 1):
+        Log("UAV %d competes with UAV %d for target %d"%(uavnode.nodeid, tempUAV.nodeid, uavnode.trackid))
         
         # If the current UAV is further away than the competing UAV
         if (tempUAV.potentialTargetDis < uavnode.potentialTargetDis):
@@ -185,20 +504,31 @@ def compareUAV(uavnode):
         
         # Current UAV lost the potentail target, should find another 
         if (toTrackOrNot == 0):
-          seen_targets.append(uavnode.trackid)
+          seen_targets.add(uavnode.trackid)
           uavnode.trackid = -1
           tempUAV.trackingMode = 0
           compare = False
-          print("UAV %d will track this target %d" % (tempUAV.nodeid, tempUAV.trackid))
+          Log("UAV %d will track this target %d" % (tempUAV.nodeid, tempUAV.trackid))
         else: 
           uavnode.trackingMode = 0
           tempUAV.trackid = -1
-          seen_targets.append(uavnode.trackid)
-          print("UAV %d will track this target %d" % (uavnode.nodeid, uavnode.trackid))
+          seen_targets.add(uavnode.trackid)
+          Log("UAV %d will track this target %d" % (uavnode.nodeid, uavnode.trackid))
           uavnode.oldtrackid = uavnode.trackid
           RecordTarget(uavnode)
           compare = False
-      i+=1
+
+#---------------
+# Check whether a UAV claims the target, or claimed it before the last
+# reset and has not advertised since
+#---------------
+def IsTracked(trgtnode_id):
+  if uavs.claiming(trgtnode_id):
+    return True
+  for uavnodetmp in uavs.previouslyClaiming(trgtnode_id):
+    if uavnodetmp.trackid == 0:
+      return True
+  return False
 
 #---------------
 # Track the potentail target, or reset if the target got too far from UAV
@@ -207,19 +537,168 @@ def ifTrack(uavnode):
   if (uavnode.trackid != uavnode.oldtrackid):
     if (compare):
       uavnode.oldtrackid = uavnode.trackid
-      print("UAV %d will track target %d"%(uavnode.nodeid, uavnode.trackid))
+      Log("UAV %d will track target %d"%(uavnode.nodeid, uavnode.trackid))
       RecordTarget(uavnode)
     if uavnode.trackid == -1:
       uavnode.oldtrackid = uavnode.trackid
-      print("UAV %d will find a new target"%uavnode.nodeid)
+      Log("UAV %d will find a new target"%uavnode.nodeid)
       RecordTarget(uavnode)
       RedeployUAV(uavnode)
       closestPotentialTrg = sys.maxsize
 
+#---------------
+# Waypoint for a target: where we meet it flying at uav_speed if its
+# velocity is estimated, otherwise where it is now
+#---------------
+def TargetWaypoint(trgtnode_id):
+  trgtnode_x, trgtnode_y = positions.getPosition(trgtnode_id)
+  if uav_speed > 0 and hasattr(positions, 'velocity'):
+    uavpos = positions.getPosition(uavs[mynodeseq].nodeid)
+    trgtnode_x, trgtnode_y = Intercept(uavpos, uav_speed, (trgtnode_x, trgtnode_y),
+                                       positions.velocity(trgtnode_id))
+  return int(trgtnode_x), int(trgtnode_y)
+
+#---------------
+# Targets in range of this UAV, as the mover sees them
+#---------------
+def PotentialTargets(covered_zone, track_range):
+  potential_targets = mover.getPotentialTargets(covered_zone, track_range)
+  if recorder is not None:
+    recorder.targets(potential_targets)
+  return potential_targets
+
+#---------------
+# Auction protocol: bid for the best target net of its price and follow
+# the target we hold
+#---------------
+def AuctionTargets(covered_zone, track_range):
+  global auction
+  uavnode = uavs[mynodeseq]
+  if auction is None:
+    auction = Auction(uavnode.nodeid, track_range, ttl=peer_ttl)
+
+  # Bidders not heard from within the TTL release what they hold
+  for bidder in auction.expire(clock()):
+    Log("UAV %d expired, releasing its bid" % bidder)
+    metrics.Inc('peers_expired')
+
+  positions.update()
+  potential_targets = PotentialTargets(covered_zone, track_range)
+  Log("Potential Targets: ", potential_targets)
+
+  # Compared against the node rather than the auction, which a heard
+  # bid may already have reset
+  previous = uavnode.trackid
+  distances = DistanceMatrix([uavnode.nodeid], potential_targets, positions)[0]
+  target, price = auction.round(potential_targets, distances)
+
+  uavnode.trackid = target
+  uavnode.potentialTargetDis = price
+  if target != previous:
+    uavnode.oldtrackid = target
+    if target == NO_TARGET:
+      Log("UAV %d will find a new target" % uavnode.nodeid)
+      RecordTarget(uavnode)
+      RedeployUAV(uavnode)
+    else:
+      Log("UAV %d bids %.1f for target %d" % (uavnode.nodeid, price, target))
+      RecordTarget(uavnode)
+
+  if target != NO_TARGET:
+    mover.setWypt(*TargetWaypoint(target))
+
+  # Our bid, repeated every round so lost bids are recovered
+  AdvertiseUDP(uavnode.nodeid, target, price, 0, KIND_BID)
+
+#---------------
+# Cluster protocol: report the targets in our range and, if we head our
+# cluster, assign targets to all its members at once; then follow the
+# assignment. Messages are only sent on a change or before they expire.
+#---------------
+def ClusterTargets(covered_zone, track_range):
+  global last_report
+  global last_assign
+  uavnode = uavs[mynodeseq]
+  now = clock()
+  refresh = cluster.refresh
+
+  positions.update()
+  potential_targets = PotentialTargets(covered_zone, track_range)
+  Log("Potential Targets: ", potential_targets)
+  uavNodeX, uavNodeY = positions.getPosition(uavnode.nodeid)
+  own = cluster.members.get(uavnode.nodeid)
+  cell = cluster.cellOf(uavNodeX, uavNodeY, own.cell if own is not None else None)
+
+  cluster.expire(now)
+  cluster.report(uavnode.nodeid, cell, sorted(potential_targets), uavnode.trackid, now)
+  head = cluster.head(cell)
+  entries = None
+  if head == uavnode.nodeid:
+    members = cluster.membersOf(cell)
+    targets = sorted(set(t for n in members for t in cluster.members[n].targets))
+    distances = DistanceMatrix(members, targets, positions)
+    assignment = cluster.solve(members, targets, distances)
+    target = assignment[uavnode.nodeid][0]
+    entries = [(uav, trgt, distance) for uav, (trgt, distance) in sorted(assignment.items())]
+  else:
+    # Our assignment is not kept for when we next head a cluster
+    cluster.assignment = dict()
+    if cluster.assigned is not None and cluster.assigned[0] == head:
+      target = cluster.assigned[1]
+    else:
+      # Keep our target until a new head has heard our report
+      target = uavnode.trackid
+  if target not in potential_targets:
+    target = NO_TARGET
+
+  if target != uavnode.trackid:
+    uavnode.trackid = target
+    uavnode.oldtrackid = target
+    RecordTarget(uavnode)
+    if target == NO_TARGET:
+      Log("UAV %d will find a new target" % uavnode.nodeid)
+      RedeployUAV(uavnode)
+    else:
+      Log("UAV %d assigned target %d by head %d" % (uavnode.nodeid, target, head))
+  uavnode.trackingMode = 0
+  if target != NO_TARGET:
+    uavnode.trackingMode = 1
+    trgtnode_x, trgtnode_y = positions.getPosition(target)
+    uavnode.potentialTargetDis = Distance_pts(uavNodeX, trgtnode_x, uavNodeY, trgtnode_y)
+    mover.setWypt(*TargetWaypoint(target))
+
+  report = (cell, tuple(sorted(potential_targets)), target)
+  if report != last_report[0] or now - last_report[1] >= refresh:
+    last_report = (report, now)
+    GetSender().sendCluster(KIND_REPORT, uavnode.nodeid, target, uavnode.potentialTargetDis,
+                            uavnode.trackingMode, cell, REPORT_TARGET, sorted(potential_targets))
+  if entries is not None:
+    assign = (cell, tuple((uav, trgt) for uav, trgt, distance in entries))
+    if assign != last_assign[0] or now - last_assign[1] >= refresh:
+      last_assign = (assign, now)
+      GetSender().sendCluster(KIND_ASSIGN, uavnode.nodeid, NO_TARGET, 0.0, 0, cell, ASSIGNMENT, entries)
+
 #---------------
 # Update waypoints for targets tracked, or track new targets
 #---------------
 def TrackTargets(covered_zone, track_range):
+  if recorder is not None:
+    recorder.tick()
+
+  UpdateGroups()
+
+  if protocol == "auction":
+    AuctionTargets(covered_zone, track_range)
+    SaveState()
+    return
+
+  if protocol == "cluster":
+    ClusterTargets(covered_zone, track_range)
+    SaveState()
+    return
+
+  ExpirePeers()
+
   # global counter 
   uavnode = uavs[mynodeseq]
   # uavnode.trackid = -1
@@ -229,16 +708,23 @@ def TrackTargets(covered_zone, track_range):
   toTrackOrNot = 0
 
   commsflag = 0
-  if protocol == "udp":
+  if protocol in comms_protocols:
     commsflag = 1
 
-  potential_targets = xmlproxy.getPotentialTargets(covered_zone, track_range)
+  # Every position read in this tick comes from the same snapshot
+  positions.update()
+
+  potential_targets = PotentialTargets(covered_zone, track_range)
+
+  # Recover adverts lost since the last tick
+  if protocol == "nack":
+    SendNacks(uavnode, potential_targets)
   if (len(potential_targets) == 0):
     uavnode.trackid = -1
     seen_targets.clear()
     
-  print("UAV nodes: ", uavs)
-  print("Potential Targets: ", potential_targets)
+  Log("UAV nodes: ", uavs)
+  Log("Potential Targets: ", potential_targets)
 
   # Compare and track target if UAV is the closest 
   compareUAV(uavnode)
@@ -251,57 +737,43 @@ def TrackTargets(covered_zone, track_range):
     if uavnode.oldtrackid == trgtnode_id:
       # Keep the current tracking; no need to change
       # unless the track goes out of range
-      print('Keep the current tracking; no need to change ', trgtnode_id)
+      Log('Keep the current tracking; no need to change ', trgtnode_id)
       uavnode.trackid = trgtnode_id
       updatewypt = 1
 
-    # If this UAV was not tracking any target and finds one in range    
+    # If this UAV was not tracking any target and finds one in range
     if uavnode.oldtrackid == -1 and (not trgtnode_id in seen_targets):
       # print("Node %d found potential target %d" % (uavnode.nodeid, trgtnode_id))
       if commsflag == 1:
         trackflag = 0
-        for uavnodetmp in uavs:
-          if uavnodetmp.trackid == trgtnode_id or \
-              (uavnodetmp.trackid == 0 and uavnodetmp.oldtrackid == trgtnode_id):
-            print("Target ", trgtnode_id, " is being tracked already")
-            trackflag = 1
-            break
+        if IsTracked(trgtnode_id):
+          Log("Target ", trgtnode_id, " is being tracked already")
+          trackflag = 1
             
       if commsflag == 0 or trackflag == 0: 
         # UAV node should track this target
-        currUAV = core.get_node(session_id, uavnode.nodeid)
-        currUAVnode = currUAV.node
-        uavNodeX, uavNodeY = currUAVnode.position.x, currUAVnode.position.y
-        trg = core.get_node(session_id, trgtnode_id)
-        node = trg.node
-        trgtnode_x, trgtnode_y = node.position.x, node.position.y
+        uavNodeX, uavNodeY = positions.getPosition(uavnode.nodeid)
+        trgtnode_x, trgtnode_y = positions.getPosition(trgtnode_id)
         tempDis = Distance_pts(uavNodeX, trgtnode_x, uavNodeY, trgtnode_y)
         if (tempDis < closestPotentialTrg):
-          print("UAV %d should track this potential target %d"%(uavnode.nodeid, trgtnode_id))
+          Log("UAV %d should track this potential target %d"%(uavnode.nodeid, trgtnode_id))
           closestPotentialTrg = tempDis
           uavnode.trackid = trgtnode_id
           updatewypt = 1
         
     if updatewypt == 1:
       # Update waypoint for UAV node
-      print("Update waypoint")
+      Log("Update waypoint")
       updatewypt = 0
-      response = core.get_node(session_id, trgtnode_id)
-      node = response.node
-      trgtnode_x, trgtnode_y = node.position.x, node.position.y
-      xmlproxy.setWypt(int(trgtnode_x), int(trgtnode_y))
+      mover.setWypt(*TargetWaypoint(trgtnode_id))
 
   ## MODIFICATIONS BEGINS ##
   
   if (uavnode.trackid > 0):
     # Current UAV has a potential target to track
     uavnode.trackingMode = 1
-    currUAV = core.get_node(session_id, uavnode.nodeid)
-    currUAVnode = currUAV.node
-    uavNodeX, uavNodeY = currUAVnode.position.x, currUAVnode.position.y
-    trg = core.get_node(session_id, uavnode.trackid)
-    node = trg.node
-    trgtnode_x, trgtnode_y = node.position.x, node.position.y
+    uavNodeX, uavNodeY = positions.getPosition(uavnode.nodeid)
+    trgtnode_x, trgtnode_y = positions.getPosition(uavnode.trackid)
     uavnode.potentialTargetDis = Distance_pts(uavNodeX, trgtnode_x, uavNodeY, trgtnode_y)
 
     # Inform other UAVs about the potential target and distance between itself and the potential target
@@ -312,17 +784,127 @@ def TrackTargets(covered_zone, track_range):
   
   ## MODIFICATION ENDS ##
 
-  # Reset tracking info for other UAVs if we're using comms
-  if commsflag == 1:
+  # Reset tracking info for other UAVs if we're using comms. With
+  # Trickle peers advertise rarely, and with NACKs a lost advert is
+  # repaired rather than repeated, so their claims stand until they are
+  # replaced or the peer expires.
+  if commsflag == 1 and protocol not in ("trickle", "nack"):
     for uavnodetmp in uavs:
       if uavnodetmp.nodeid != uavnode.nodeid:
         uavnodetmp.oldtrackid = uavnodetmp.trackid
         uavnodetmp.trackid = 0
           
   # Advertise target being tracked if using comms 
-  if protocol == "udp":
+  # With NACKs losses are repaired on request instead of by repeating
+  # every advert
+  if protocol == "trickle":
+    AdvertiseTrickle(uavnode)
+  elif protocol == "nack":
+    AdvertiseNack(uavnode)
+  elif protocol in comms_protocols:
     AdvertiseUDP(uavnode.nodeid, uavnode.trackid, uavnode.potentialTargetDis, uavnode.trackingMode)
+
+  SaveState()
     
+#---------------
+# Save our state for a warm restart
+#---------------
+def SaveState():
+  if warm_state is not None:
+    warm_state.save(uavs[mynodeseq], uavs, seen_targets, clock())
+
+#---------------
+# Pick up the state a previous run of this agent saved, if it is recent
+# and its target is still within our range. Returns whether we resumed.
+#---------------
+def ResumeState(node, secinterval):
+  global auction
+  if warm_state is None:
+    return False
+  max_age = peer_ttl if peer_ttl is not None else 10*secinterval
+  state = warm_state.load(node.nodeid, max_age)
+  if state is None:
+    return False
+
+  now = clock()
+  trackid = state.trackid
+  if trackid > 0:
+    positions.update()
+    uavNodeX, uavNodeY = positions.getPosition(node.nodeid)
+    trgtnode_x, trgtnode_y = positions.getPosition(trackid)
+    distance = Distance_pts(uavNodeX, trgtnode_x, uavNodeY, trgtnode_y)
+    if tracking_range is not None and distance > tracking_range:
+      Log("UAV %d: target %d of the saved state is out of range" % (node.nodeid, trackid))
+      return False
+    node.potentialTargetDis = distance
+  node.trackid = trackid
+  node.oldtrackid = state.oldtrackid
+  node.trackingMode = state.trackingMode
+
+  for (nodeid, peer_trackid, peer_oldtrackid, trackMode, potTrgDis, heard,
+       claim_target, claim_mode, claim_dis, version) in state.peers:
+    peer = CORENode(nodeid, peer_trackid, potTrgDis, trackMode)
+    peer.oldtrackid = peer_oldtrackid
+    if version > 0:
+      peer.claim = (claim_target, claim_mode, claim_dis, version)
+    uavs.append(peer)
+    uavs.touch(peer, now - heard - state.age)
+  for target in state.seen:
+    seen_targets.add(target)
+
+  if protocol == "auction" and trackid > 0:
+    auction = Auction(node.nodeid, tracking_range, ttl=peer_ttl)
+    auction.assigned = trackid
+    auction.setHolder(node.nodeid, trackid, state.potentialTargetDis)
+
+  Log("UAV %d resumed generation %d with target %d" % (node.nodeid, state.generation, trackid))
+  metrics.Inc('warm_restarts')
+  # The mover holds the target we last committed to, which a claim
+  # still being contested has not replaced yet
+  mover.setTarget(node.oldtrackid)
+  if trackid > 0:
+    mover.setWypt(*TargetWaypoint(trackid))
+  else:
+    RedeployUAV(node)
+  return True
+
+#---------------
+# Set up this agent's own node and point the mover at its original
+# waypoint, or resume the state of its previous run
+#---------------
+def InitAgent(uav_id, secinterval):
+  global mynodeseq
+  global nodecnt
+  global reliable_rx
+  global trickle
+  global cluster
+  global heartbeat
+
+  # Populate the uavs list with current UAV node information
+  mynodeseq = 0
+  uavs.ttl = peer_ttl
+  node = CORENode(uav_id, -1, 0, 0)
+  uavs.append(node)
+  if not ResumeState(node, secinterval):
+    RedeployUAV(node)
+    RecordTarget(node)
+  nodecnt += 1
+
+  if protocol == "nack":
+    # Unchanged claims are repeated three times per peer TTL, and a
+    # peer silent for longer than that has lost an advert
+    heartbeat = (peer_ttl if peer_ttl is not None else 3.0)/3
+    reliable_rx = ReliableReceiver(heartbeat)
+
+  if protocol == "cluster":
+    # Refreshed three times per peer TTL, like Trickle's longest gap
+    cluster = ClusterView(uav_id, cluster_cell, (peer_ttl if peer_ttl is not None else 3.0)/3)
+
+  if protocol == "trickle":
+    # Send often enough that peers never expire us
+    max_gap = peer_ttl/3 if peer_ttl is not None else None
+    trickle = Trickle(secinterval, k=redundancy, max_gap=max_gap, rng=rng)
+
 #---------------
 # main
 #---------------
@@ -336,7 +918,21 @@ def main():
   global nodecnt
   global core
   global session_id
+  global positions
+  global mover
   global counter
+  global quiet
+  global recorder
+  global peer_ttl
+  global scheduler
+  global tracking_range
+  global redundancy
+  global gossip
+  global uav_speed
+  global warm_state
+  global geo_cell
+  global receiver
+  global cluster_cell
 
 
   # Get command line inputs 
@@ -350,60 +946,148 @@ def main():
   parser.add_argument('-i','--update_interval', dest = 'interval', metavar='update interval',
                       type=int, default = '1', help='Update Inteval')
   parser.add_argument('-p','--protocol', dest = 'protocol', metavar='comms protocol',
-                      type=str, default = 'none', help='Comms Protocol')
+                      type=str, default = 'none', help='Comms Protocol (none, udp, nack, auction, trickle, cluster)')
+  parser.add_argument('-s','--snapshot-age', dest = 'snapshot_age', metavar='snapshot age',
+                      type=int, default = '250', help='Max age of the node position snapshot (msec)')
+  parser.add_argument('-e','--events', dest = 'events', action='store_true',
+                      help='Keep node positions up to date from the CORE event stream')
+  parser.add_argument('-a','--asyncio', dest = 'asyncio', action='store_true',
+                      help='Run the tracking loop on asyncio instead of threads')
+  parser.add_argument('-m','--mover', dest = 'mover', metavar='mover channel',
+                      type=str, default = 'xmlrpc', choices=['xmlrpc', 'shm'],
+                      help='Channel to move_node (xmlrpc, or shm for shared memory)')
+  parser.add_argument('-q','--quiet', dest = 'quiet', action='store_true',
+                      help='No per-tick output')
+  parser.add_argument('-M','--metrics-port', dest = 'metrics_port', metavar='metrics port',
+                      type=int, default = '0', help='Serve metrics on this local port (0 for none)')
+  parser.add_argument('-I','--max-interval', dest = 'max_interval', metavar='max interval',
+                      type=int, default = '0', help='Longest update interval while assignments are settled (msec)')
+  parser.add_argument('-k','--redundancy', dest = 'redundancy', metavar='redundancy',
+                      type=int, default = REDUNDANCY, help='Trickle: skip our advert after this many consistent ones (0 never skips)')
+  parser.add_argument('-g','--gossip', dest = 'gossip', metavar='claims',
+                      type=int, default = '0', help='Add up to this many recently heard claims to each advert')
+  parser.add_argument('-P','--predict', dest = 'predict', metavar='max sigma',
+                      type=float, default = '0', help='Predict target positions, polling only when a prediction '
+                      'may be off by more than this (0 for always poll; not with -e or -a)')
+  parser.add_argument('-v','--uav-speed', dest = 'uav_speed', metavar='uav speed',
+                      type=float, default = '0', help='UAV speed, to aim at the intercept point of moving targets with -P')
+  parser.add_argument('-t','--peer-ttl', dest = 'peer_ttl', metavar='peer ttl',
+                      type=int, default = '3000', help='Forget peers not heard from for this long (msec, 0 for never)')
+  parser.add_argument('-R','--record', dest = 'record', metavar='record file',
+                      type=str, default = None, help='Record tracker inputs to this file (see replay.py)')
+  parser.add_argument('-W','--warm-restart', dest = 'warm_restart', action='store_true',
+                      help='Save our state every tick and resume from it on restart (/tmp/track_nN.state)')
+  parser.add_argument('-G','--geo-cell', dest = 'geo_cell', metavar='cell size',
+                      type=int, default = '0', help='Advertise on per-cell multicast groups of this size, '
+                      'listening only to cells within twice the tracking range (0 for one group)')
+  parser.add_argument('-C','--cluster-cell', dest = 'cluster_cell', metavar='cell size',
+                      type=int, default = '1200', help='Cluster protocol: size of the grid cells UAVs are clustered by')
 
   # Parse command line options
   args = parser.parse_args()
+  if args.predict > 0 and (args.events or args.asyncio):
+    parser.error("-P cannot be combined with -e or -a")
 
   protocol = args.protocol
+  quiet = args.quiet
+  peer_ttl = args.peer_ttl/1000 if args.peer_ttl > 0 else None
+  tracking_range = args.track_range
+  redundancy = args.redundancy
+  gossip = args.gossip
+  uav_speed = args.uav_speed
+  geo_cell = args.geo_cell
+  cluster_cell = args.cluster_cell
+
+  if args.metrics_port:
+    metrics.ServeMetrics(args.metrics_port)
+  metrics.SampleProfiler("/tmp/track_n%d.prof" % args.uav_id).install()
 
   # Create grpc client
-  core = client.CoreGrpcClient("172.16.0.254:50051")
+  coreaddress = "172.16.0.254:50051"
+  core = client.CoreGrpcClient(coreaddress)
   core.connect()
+  core = metrics.TimedProxy(core, 'grpc_seconds')
   response = core.get_sessions()
   if not response.sessions:
     raise ValueError("no current core sessions")
   session_summary = response.sessions[0]
   session_id = int(session_summary.id)
   session = core.get_session(session_id).session
+  if args.events and not args.asyncio:
+    positions = NodeCache(core, session_id, args.snapshot_age/1000)
+    positions.listener = PositionEvent
+    positions.subscribe()
+  else:
+    positions = PositionSnapshot(core, session_id, args.snapshot_age/1000)
 
-  # Populate the uavs list with current UAV node information
-  mynodeseq = 0
-  node = CORENode(args.uav_id, -1, 0, 0)
-  uavs.append(node)
-  RedeployUAV(node)
-  RecordTarget(node)
-  nodecnt += 1
+  if args.mover == "shm":
+    mover = IpcMover(args.uav_id)
+  mover = metrics.TimedProxy(mover, args.mover + '_seconds')
+  if args.predict > 0:
+    # Targets are predicted; our own position is read from the state
+    # block with -m shm, and from the snapshot otherwise, sparing an
+    # XML-RPC call per read
+    own = mover.getPosition if args.mover == "shm" else None
+    positions = PredictedPositions(positions, args.predict, clock=clock,
+                                   own_id=args.uav_id, own=own)
+
+  # Initialize values
+  msecinterval = float(args.interval)
+  secinterval = msecinterval/1000
+  scheduler = TickScheduler(secinterval, args.max_interval/1000, clock=clock)
+
+  if args.record:
+    recorder = Recorder(args.record, dict(uav_id=args.uav_id, protocol=protocol, interval=secinterval,
+                                          covered_zone=args.covered_zone, track_range=args.track_range,
+                                          peer_ttl=peer_ttl, redundancy=redundancy, gossip=gossip,
+                                          cluster_cell=cluster_cell), clock)
+    atexit.register(recorder.close)
+    positions = RecordingPositions(positions, recorder)
+    mover = RecordingMover(mover, recorder)
+
+  if args.warm_restart:
+    warm_state = WarmState(StatePath(args.uav_id))
+
+  seen_targets = BoundedSet()
+  compare = True
+
+  InitAgent(args.uav_id, secinterval)
   
   if mynodeseq == -1:
     print("Error: my id needs to be in the list of UAV IDs")
     sys.exit()
-
-  seen_targets = []
-  compare = True
     
-  # Initialize values
   corepath = "/tmp/pycore.*/"
   nodepath = glob.glob(corepath)[0]
-  msecinterval = float(args.interval)
-  secinterval = msecinterval/1000
 
-  if protocol == "udp":
-    # Create UDP receiving thread
+  if args.asyncio:
+    import async_agent
+
+    # Mover calls are made between ticks; the original waypoint never changes
+    mover = async_agent.DeferredMover(mover, mover.getOriginalWypt())
+    asyncio.run(async_agent.RunAgent(sys.modules[__name__], coreaddress,
+                                     args.covered_zone, args.track_range))
+    return
+
+  if protocol in comms_protocols:
+    # Create UDP receiving thread; in geo mode groups are joined as we move
+    receiver = McastReceiver(None if geo_cell else mcastaddr, port)
     recvthrd = ReceiveUDPThread()
     recvthrd.start()
         
   # Start tracking targets
   while 1:
-    time.sleep(secinterval)
+    scheduler.wait()
 
-    if protocol == "udp":    
+    if protocol in comms_protocols:    
       thrdlock.acquire()
     
-    TrackTargets(args.covered_zone, args.track_range)
+    with metrics.Timed('tick_seconds'):
+      TrackTargets(args.covered_zone, args.track_range)
+    scheduler.ticked(Settled())
     
 
-    if protocol == "udp":
+    if protocol in comms_protocols:
       thrdlock.release()
 
 
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+
+# Trickle timer (RFC 6206) deciding when a tracker advertises. Each
+# interval I has one transmission point t, chosen at random in [I/2, I).
+# At t the advert is sent unless k consistent adverts were already heard
+# in this interval. I doubles at the end of every interval up to Imax,
+# and an inconsistency (a change of our own claim, a new peer, a peer
+# changing or contesting a claim) resets it to Imin.
+#
+# The timer is polled from the tracking loop, so its resolution is the
+# tick; Imin is normally the update interval. Peers drop UAVs they have
+# not heard from within their TTL, so a send is forced whenever the last
+# one is older than max_gap.
+
+import random
+
+DOUBLINGS = 4
+REDUNDANCY = 3
+
+
+class Trickle():
+  def __init__(self, imin, doublings=DOUBLINGS, k=REDUNDANCY, max_gap=None, rng=random):
+    self.imin = imin
+    self.imax = imin * 2**doublings
+    self.k = k
+    self.max_gap = max_gap
+    self.rng = rng
+    self.interval = imin
+    self.start = None
+    self.fire_at = None
+    self.fired = False
+    self.counter = 0
+    self.last_sent = None
+    self.sent = 0
+    self.suppressed = 0
+    self.resets = 0
+
+  def begin(self, now):
+    self.start = now
+    self.fire_at = now + self.rng.uniform(self.interval/2, self.interval)
+    self.fired = False
+    self.counter = 0
+
+  def consistent(self):
+    self.counter += 1
+
+  def inconsistent(self, now):
+    if self.start is None or self.interval > self.imin:
+      self.interval = self.imin
+      self.resets += 1
+      self.begin(now)
+
+  # Whether to advertise now
+  def poll(self, now):
+    if self.start is None:
+      self.begin(now)
+    send = False
+    if not self.fired and now >= self.fire_at:
+      self.fired = True
+      if self.k == 0 or self.counter < self.k:
+        send = True
+      else:
+        self.suppressed += 1
+    if self.max_gap is not None and self.last_sent is not None and now - self.last_sent >= self.max_gap:
+      send = True
+    if now >= self.start + self.interval:
+      self.interval = min(self.interval*2, self.imax)
+      self.begin(now)
+    if send:
+      self.last_sent = now
+      self.sent += 1
+    return send
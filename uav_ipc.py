@@ -0,0 +1,255 @@
+#!/usr/bin/python
+
+# Local channel between track_target and move_node for the same UAV.
+# Waypoint, target and position are exchanged through a memory-mapped
+# state block protected by seqlocks; the remaining CoreUav calls go
+# over a Unix socket. XML-RPC on localhost:8000 remains the fallback.
+
+import os
+import time
+import mmap
+import json
+import struct
+import socket
+import threading
+import socketserver
+
+ipcpath = "/tmp/"
+
+# Tracker -> mover: sequence, waypoint x, y, target, tracker pid
+TRACK_BLOCK = struct.Struct('=Iddii')
+TRACK_OFFSET = 0
+
+# Mover -> tracker: sequence, position x, y, original waypoint x, y
+MOVE_BLOCK = struct.Struct('=Idddd')
+MOVE_OFFSET = 64
+
+SHM_SIZE = 128
+SEQ = struct.Struct('=I')
+
+# Reads spin this many times on a block being written, then sleep
+# between tries until the writer has held it for READ_TIMEOUT seconds
+SPINS = 100
+READ_TIMEOUT = 1.0
+
+# CoreUav methods that may be called over the command socket
+COMMANDS = ('getPotentialTargets', 'getOriginalWypt', 'setOriginalWypt',
+            'getPosition', 'getWypt', 'setWypt', 'getTarget', 'setTarget')
+
+
+def ShmPath(node_id):
+  return ipcpath + "uav_n%d.shm" % node_id
+
+def SockPath(node_id):
+  return ipcpath + "uav_n%d.sock" % node_id
+
+#---------------
+# Seqlock writes and reads. A block has a single writer; the sequence is
+# odd while the writer is updating it.
+#---------------
+def SeqlockWrite(shm, offset, block, *values):
+  seq = SEQ.unpack_from(shm, offset)[0]
+  # A writer that died mid-update leaves the sequence odd
+  seq = (seq + (seq & 1)) & 0xfffffffe
+  SEQ.pack_into(shm, offset, seq + 1)
+  block.pack_into(shm, offset, seq + 1, *values)
+  seq = (seq + 2) & 0xffffffff
+  SEQ.pack_into(shm, offset, seq)
+  return seq
+
+# Raises ValueError if the writer does not finish in time, as when it
+# died mid-update
+def SeqlockRead(shm, offset, block, timeout=READ_TIMEOUT):
+  spins = 0
+  deadline = None
+  while 1:
+    seq = SEQ.unpack_from(shm, offset)[0]
+    if not seq & 1:
+      values = block.unpack_from(shm, offset)
+      if SEQ.unpack_from(shm, offset)[0] == seq:
+        return values
+    spins += 1
+    if spins > SPINS:
+      if deadline is None:
+        deadline = time.monotonic() + timeout
+      elif time.monotonic() > deadline:
+        raise ValueError("state block at %d left mid-update by its writer" % offset)
+      time.sleep(0.0001)
+
+# Whether process pid is running
+def Alive(pid):
+  if pid <= 0:
+    return False
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+#---------------
+# Command socket handler; one JSON request per line
+#---------------
+class CommandHandler(socketserver.StreamRequestHandler):
+  def handle(self):
+    for line in self.rfile:
+      name, args = json.loads(line)
+      if name in COMMANDS:
+        result = getattr(self.server.core_uav, name)(*args)
+      else:
+        result = None
+      self.wfile.write(json.dumps(result).encode('utf-8') + b'\n')
+
+
+class CommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+
+#---------------
+# Mover side: owns the state block and serves the command socket
+#---------------
+class IpcServer(threading.Thread):
+  def __init__(self, core_uav):
+    threading.Thread.__init__(self, daemon=True)
+    self.uav = core_uav
+    node_id = core_uav.node_id
+
+    # Reuse the file if it exists so a running tracker keeps its mapping
+    fd = os.open(ShmPath(node_id), os.O_RDWR | os.O_CREAT, 0o666)
+    os.ftruncate(fd, SHM_SIZE)
+    self.shm = mmap.mmap(fd, SHM_SIZE)
+    os.close(fd)
+
+    # A restarted mover takes over the waypoint and target of a tracker
+    # that is still running, instead of resetting the block under it
+    self.track_seq = None
+    if not self.adopt():
+      wypt = core_uav.getWypt()
+      self.track_seq = SeqlockWrite(self.shm, TRACK_OFFSET, TRACK_BLOCK,
+                                    wypt[0], wypt[1], core_uav.getTarget(), 0)
+    self.publish()
+
+    if os.path.exists(SockPath(node_id)):
+      os.unlink(SockPath(node_id))
+    self.server = CommandServer(SockPath(node_id), CommandHandler)
+    self.server.core_uav = core_uav
+
+  def run(self):
+    print('Serving IPC on %s' % SockPath(self.uav.node_id))
+    self.server.serve_forever()
+
+  # Whether the block holds the state of a running tracker; if so, apply it
+  def adopt(self):
+    try:
+      seq, x, y, target, pid = SeqlockRead(self.shm, TRACK_OFFSET, TRACK_BLOCK)
+    except ValueError:
+      return False      # The tracker died writing it
+    if seq == 0 or not Alive(pid):
+      return False
+    self.poll()
+    return True
+
+  # Apply waypoint and target changes written by the tracker
+  def poll(self):
+    seq, x, y, target, pid = SeqlockRead(self.shm, TRACK_OFFSET, TRACK_BLOCK)
+    if seq == self.track_seq:
+      return
+    self.track_seq = seq
+    if (x, y) != self.uav.getWypt():
+      self.uav.setWypt(x, y)
+    if target != self.uav.getTarget():
+      self.uav.setTarget(target)
+
+  # Publish the current position and original waypoint
+  def publish(self):
+    position = self.uav.getPosition()
+    orig = self.uav.getOriginalWypt()
+    SeqlockWrite(self.shm, MOVE_OFFSET, MOVE_BLOCK, position[0], position[1], orig[0], orig[1])
+
+
+#---------------
+# Tracker side: same interface as the XML-RPC proxy
+#---------------
+class IpcMover():
+  def __init__(self, node_id, timeout=30):
+    self.node_id = node_id
+
+    # Wait for the mover to create the state block
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(SockPath(node_id)):
+      if time.monotonic() > deadline:
+        raise ValueError("no mover IPC for node %d" % node_id)
+      time.sleep(0.1)
+
+    fd = os.open(ShmPath(node_id), os.O_RDWR)
+    self.shm = mmap.mmap(fd, SHM_SIZE)
+    os.close(fd)
+    seq, x, y, target, pid = SeqlockRead(self.shm, TRACK_OFFSET, TRACK_BLOCK)
+    self.wypt = (x, y)
+    self.target = target
+    self.pid = os.getpid()
+
+    self.sk = None
+    self.rfile = None
+
+  def connect(self):
+    self.sk = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sk.connect(SockPath(self.node_id))
+    self.rfile = self.sk.makefile('rb')
+
+  def close(self):
+    if self.sk is not None:
+      self.rfile.close()
+      self.sk.close()
+    self.sk = None
+    self.rfile = None
+
+  def request(self, line):
+    if self.sk is None:
+      self.connect()
+    self.sk.sendall(line)
+    reply = self.rfile.readline()
+    if not reply:
+      raise ConnectionResetError("mover closed the command socket")
+    return json.loads(reply)
+
+  # A restarted mover rebinds the socket; reconnect and retry once
+  def call(self, name, *args):
+    line = json.dumps([name, args]).encode('utf-8') + b'\n'
+    try:
+      return self.request(line)
+    except ConnectionError:
+      self.close()
+    return self.request(line)
+
+  def getPotentialTargets(self, covered_zone=1200, track_range=600):
+    return self.call('getPotentialTargets', covered_zone, track_range)
+
+  def getWypt(self):
+    return self.wypt
+
+  def setWypt(self, x, y):
+    self.wypt = (x, y)
+    SeqlockWrite(self.shm, TRACK_OFFSET, TRACK_BLOCK, x, y, self.target, self.pid)
+    return True
+
+  def getTarget(self):
+    return self.target
+
+  def setTarget(self, target):
+    self.target = target
+    SeqlockWrite(self.shm, TRACK_OFFSET, TRACK_BLOCK, self.wypt[0], self.wypt[1], target, self.pid)
+    return True
+
+  def getPosition(self):
+    seq, x, y, orig_x, orig_y = SeqlockRead(self.shm, MOVE_OFFSET, MOVE_BLOCK)
+    return (x, y)
+
+  def getOriginalWypt(self):
+    seq, x, y, orig_x, orig_y = SeqlockRead(self.shm, MOVE_OFFSET, MOVE_BLOCK)
+    return (orig_x, orig_y)
+
+  def setOriginalWypt(self, x, y):
+    return self.call('setOriginalWypt', x, y)
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+
+# Warm restart state for a tracker. Each tick the tracker rewrites a
+# small memory-mapped file with its claim, its peer table and the
+# targets it has seen contested. A restarted tracker reads it back and,
+# if it is recent and its target is still in range, keeps tracking that
+# target instead of redeploying and competing for a target again.
+#
+# The first word is a generation counter, odd while a write is in
+# progress, so a tracker killed mid-write leaves a state that is
+# rejected rather than half read.
+
+import os
+import mmap
+import time
+import struct
+
+MAGIC = 0x57524d31
+
+# Generation, magic, uav id, wall clock time written, own trackid,
+# oldtrackid, tracking mode, distance, peer count, seen target count
+HEADER = struct.Struct('=IIidiiifHH')
+GENERATION = struct.Struct('=I')
+
+# Peer: node id, trackid, oldtrackid, tracking mode, distance, seconds
+# since heard, then its claim: target, mode, distance, version (0 for none)
+PEER = struct.Struct('=iiiifdiifd')
+SEEN = struct.Struct('=i')
+
+MAX_PEERS = 256
+MAX_SEEN = 256
+STATE_SIZE = HEADER.size + MAX_PEERS*PEER.size + MAX_SEEN*SEEN.size
+
+
+def StatePath(node_id):
+  return "/tmp/track_n%d.state" % node_id
+
+
+#---------------
+# State read back from a snapshot
+#---------------
+class SavedState():
+  def __init__(self, generation, age, trackid, oldtrackid, trackingMode, potentialTargetDis, peers, seen):
+    self.generation = generation
+    self.age = age
+    self.trackid = trackid
+    self.oldtrackid = oldtrackid
+    self.trackingMode = trackingMode
+    self.potentialTargetDis = potentialTargetDis
+    self.peers = peers
+    self.seen = seen
+
+
+#---------------
+# Snapshot file of one tracker
+#---------------
+class WarmState():
+  def __init__(self, path, wall=time.time):
+    self.path = path
+    self.wall = wall
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    os.ftruncate(fd, STATE_SIZE)
+    self.shm = mmap.mmap(fd, STATE_SIZE)
+    os.close(fd)
+    generation = GENERATION.unpack_from(self.shm, 0)[0]
+    self.generation = generation + (generation & 1)
+
+  # Write our state; now is the tracker clock the peers were heard on
+  def save(self, uavnode, peers, seen, now):
+    peers = [peer for peer in peers if peer is not uavnode][:MAX_PEERS]
+    seen = list(seen.items)[-MAX_SEEN:]
+
+    GENERATION.pack_into(self.shm, 0, (self.generation + 1) & 0xffffffff)
+    offset = HEADER.size
+    for peer in peers:
+      heard = now - peer.heard if peer.heard is not None else 0.0
+      claim = peer.claim if peer.claim is not None else (-1, 0, 0.0, 0.0)
+      PEER.pack_into(self.shm, offset, peer.nodeid, peer.trackid, peer.oldtrackid, peer.trackingMode,
+                     peer.potentialTargetDis, heard, claim[0], claim[1], claim[2], claim[3])
+      offset += PEER.size
+    for target in seen:
+      SEEN.pack_into(self.shm, offset, target)
+      offset += SEEN.size
+    self.generation = (self.generation + 2) & 0xffffffff
+    HEADER.pack_into(self.shm, 0, self.generation, MAGIC, uavnode.nodeid, self.wall(),
+                     uavnode.trackid, uavnode.oldtrackid, uavnode.trackingMode,
+                     uavnode.potentialTargetDis, len(peers), len(seen))
+
+  # The state last saved for uav_id, or None if there is none, it was
+  # torn by a crash mid-write, or it is older than max_age seconds
+  def load(self, uav_id, max_age):
+    (generation, magic, saved_id, stamp, trackid, oldtrackid, trackingMode,
+     potentialTargetDis, npeers, nseen) = HEADER.unpack_from(self.shm, 0)
+    if magic != MAGIC or generation & 1 or saved_id != uav_id:
+      return None
+    age = self.wall() - stamp
+    if age < 0 or age > max_age or npeers > MAX_PEERS or nseen > MAX_SEEN:
+      return None
+
+    offset = HEADER.size
+    peers = []
+    for i in range(npeers):
+      peers.append(PEER.unpack_from(self.shm, offset))
+      offset += PEER.size
+    seen = []
+    for i in range(nseen):
+      seen.append(SEEN.unpack_from(self.shm, offset)[0])
+      offset += SEEN.size
+    return SavedState(generation, age, trackid, oldtrackid, trackingMode, potentialTargetDis, peers, seen)
+
+  def close(self):
+    self.shm.close()